@@ -0,0 +1,82 @@
+"""Speed and accuracy of the alignment backends on local and global motion.
+
+Times each backend in temporal_denoiser.flow.ALIGN_BACKENDS on two synthetic
+frame pairs with known motion: a pan with a gentle swirl (local motion, as in
+handheld footage) and a pure subpixel translation (a locked-off or stabilised
+shot). Reports the estimate time, endpoint error and alignment error of each:
+
+    python -m benchmarks.align_backends --width 1920 --height 1080 --flow-scale 0.5
+"""
+import argparse
+import json
+import time
+import numpy as np
+import cv2
+from benchmarks.flow_resolution import synthetic_pair
+from temporal_denoiser.flow import ALIGN_BACKENDS, make_flow_estimator, to_gray, upscale_flow, flow_to_map
+
+
+def translated_pair(width, height, shift=(3.4, -1.7), noise=0.02, seed=1):
+    """Like synthetic_pair, but cur is ref moved by a constant subpixel shift."""
+    ref, _, clean_ref, _, _ = synthetic_pair(width, height, noise, seed)
+    matrix = np.float32([[1, 0, shift[0]], [0, 1, shift[1]]])
+    # cur(x) = ref(x + shift), so the flow from ref to cur is -shift
+    clean_cur = cv2.warpAffine(clean_ref, matrix, (width, height), flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REFLECT)
+    rng = np.random.default_rng(seed + 1)
+    cur = np.clip(clean_cur + rng.normal(0, noise, clean_cur.shape), 0, 1).astype(np.float32)
+    true_flow = np.empty((height, width, 2), dtype=np.float32)
+    true_flow[:, :, 0] = -shift[0]
+    true_flow[:, :, 1] = -shift[1]
+    return ref, cur, clean_ref, clean_cur, true_flow
+
+
+def measure(backend, pair, flow_scale, repeats):
+    ref, cur, clean_ref, clean_cur, true_flow = pair
+    h, w = ref.shape[:2]
+    estimator = make_flow_estimator(backend)
+    ref_gray, cur_gray = to_gray(ref, flow_scale), to_gray(cur, flow_scale)
+    estimator.estimate(ref_gray, cur_gray)  # Warm up
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        flow = estimator.estimate(ref_gray, cur_gray)
+        timings.append(time.perf_counter() - start)
+    flow = upscale_flow(flow.copy(), h, w)
+    m = max(8, int(0.05 * w))
+    aligned = cv2.remap(clean_cur, flow_to_map(flow), None, cv2.INTER_LINEAR)
+    result = {
+        "backend": backend,
+        "seconds": round(float(np.median(timings)), 4),
+        "endpoint_error_px": round(float(np.linalg.norm(flow - true_flow, axis=2)[m:-m, m:-m].mean()), 4),
+        "alignment_mae": round(float(np.abs(aligned - clean_ref)[m:-m, m:-m].mean()), 5),
+    }
+    if backend == "auto":
+        result["choices"] = estimator.choices
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--flow-scale", type=float, default=1.0)
+    parser.add_argument("--backends", nargs="+", default=list(ALIGN_BACKENDS), choices=ALIGN_BACKENDS)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    output = {"width": args.width, "height": args.height, "flow_scale": args.flow_scale}
+    for motion, pair in (("local", synthetic_pair(args.width, args.height)), ("translation", translated_pair(args.width, args.height))):
+        results = [measure(backend, pair, args.flow_scale, args.repeats) for backend in args.backends]
+        output[motion] = results
+        print(f"{args.width}x{args.height}, flow scale {args.flow_scale}, {motion} motion")
+        print(f"{'backend':>14} {'seconds':>9} {'EPE px':>8} {'align MAE':>10}")
+        for r in results:
+            print(f"{r['backend']:>14} {r['seconds']:>9.4f} {r['endpoint_error_px']:>8.3f} {r['alignment_mae']:>10.5f} {r.get('choices', '')}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Per-frame time and allocations of window alignment, with and without AlignmentContext.
+
+Slides a window of 2r+1 frames over a synthetic panning clip and aligns every
+window to its centre frame with Farneback, comparing the allocating path
+(new grayscale copies, flow, map and aligned frames for every neighbour) with
+AlignmentContext's reused buffers, and with warm-started flows
+(OPTFLOW_USE_INITIAL_FLOW) at full and reduced iterations. Reports ms and
+frames per second per output frame, the peak memory allocated while aligning
+one window, and the alignment error against the noise-free frames:
+
+    python -m benchmarks.alignment --width 3840 --height 2160 --radius 3
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+import cv2
+from temporal_denoiser.flow import AlignmentContext, coordinate_grid, flow_to_map, to_gray, upscale_flow
+
+
+def synthetic_clip(width, height, frames, noise=0.02, seed=0):
+    """Return (noisy, clean) frame lists of a textured scene under a smooth, steady pan and swirl."""
+    noisy, clean = [], []
+    for noisy_frame, clean_frame in synthetic_frames(width, height, frames, noise, seed):
+        noisy.append(noisy_frame)
+        clean.append(clean_frame)
+    return noisy, clean
+
+
+def synthetic_frames(width, height, frames, noise=0.02, seed=0):
+    """Yield the (noisy, clean) frames of synthetic_clip one at a time, for clips too large to hold in memory."""
+    rng = np.random.default_rng(seed)
+    texture = np.zeros((height, width, 3), dtype=np.float32)
+    for sigma, weight in ((1.5, 0.3), (6.0, 0.4), (24.0, 0.3)):
+        layer = cv2.GaussianBlur(rng.random((height, width, 3), dtype=np.float32), (0, 0), sigma)
+        texture += weight * (layer - layer.min()) / (layer.max() - layer.min())
+    grid = coordinate_grid(height, width)
+    scale = width / 1920.0
+    motion = np.empty((height, width, 2), dtype=np.float32)
+    motion[:, :, 0] = scale * (2.0 + np.sin(2 * np.pi * grid[:, :, 1] / height))
+    motion[:, :, 1] = scale * (-1.0 + np.cos(2 * np.pi * grid[:, :, 0] / width))
+    for k in range(frames):
+        clean = cv2.remap(texture, grid + (k - frames // 2) * motion, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+        yield np.clip(clean + rng.normal(0, noise, clean.shape), 0, 1).astype(np.float32), clean
+
+
+def allocating_align(window, ref_idx, flow_params):
+    """The alignment path before AlignmentContext: everything allocated per neighbour."""
+    pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flow_scale = flow_params
+    ref = window[ref_idx]
+    ref_gray = to_gray(ref, flow_scale)
+    aligned, flows = [], []
+    for i, frame in enumerate(window):
+        if i == ref_idx:
+            aligned.append(ref)
+            continue
+        flow = cv2.calcOpticalFlowFarneback(ref_gray, to_gray(frame, flow_scale), None, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0)
+        flow = upscale_flow(flow, *ref.shape[:2])
+        flows.append(flow)
+        aligned.append(cv2.remap(frame, flow_to_map(flow), None, cv2.INTER_LINEAR))
+    return aligned, flows
+
+
+def measure(name, align, clip, clean, radius):
+    """Align every window of clip with align(window, ref_idx, first_idx, keep), which returns copies of the flows if keep is set."""
+    n = len(clip)
+    windows = [(max(0, i - radius), min(n, i + radius + 1)) for i in range(n)]
+    align(clip[windows[radius][0]:windows[radius][1]], radius, windows[radius][0], False)  # Warm up buffers
+    kept = {}
+    seconds = 0.0
+    for i, (lo, hi) in enumerate(windows):
+        start = time.perf_counter()
+        flows = align(clip[lo:hi], i - lo, lo, i % 4 == 0)
+        seconds += time.perf_counter() - start
+        if flows:
+            kept[i] = flows
+    # Apply the kept flows to the noise-free frames to measure alignment error
+    errors = []
+    h, w = clean[0].shape[:2]
+    m = max(8, int(0.03 * w))
+    for i, flows in kept.items():
+        neighbours = [j for j in range(*windows[i]) if j != i]
+        for j, flow in zip(neighbours, flows):
+            errors.append(float(np.abs(cv2.remap(clean[j], flow_to_map(upscale_flow(flow, h, w)), None, cv2.INTER_LINEAR) - clean[i])[m:-m, m:-m].mean()))
+    peak = 0
+    for lo, hi in windows[radius:radius + 2]:
+        tracemalloc.start()
+        align(clip[lo:hi], radius, lo, False)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"path": name, "ms_per_frame": round(1000 * seconds / n, 2), "frames_per_second": round(n / seconds, 3), "peak_alloc_mb": round(peak / 2**20, 2), "alignment_mae": round(float(np.mean(errors)), 5)}
+
+
+def allocating(flow_params):
+    def align(window, ref_idx, first_idx, keep):
+        flows = allocating_align(window, ref_idx, flow_params)[1]
+        return flows if keep else None
+    return align
+
+
+def context_align(context):
+    def align(window, ref_idx, first_idx, keep):
+        context.align(window, ref_idx, 0, len(window), first_idx)
+        if keep:
+            return [context._flows[i - ref_idx].copy() for i in range(len(window)) if i != ref_idx]
+    return align
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--radius", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--flow-scale", type=float, default=1.0)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    clip, clean = synthetic_clip(args.width, args.height, args.frames)
+    flow_params = (0.5, 3, 15, args.iterations, 5, 1.2, args.flow_scale)
+    fewer = flow_params[:3] + (max(1, args.iterations // 2),) + flow_params[4:]
+    paths = [
+        ("allocating", allocating(flow_params)),
+        ("context", context_align(AlignmentContext(*flow_params))),
+        ("initial_flow", context_align(AlignmentContext(*flow_params, initial_flow=True))),
+        (f"initial_flow it={fewer[3]}", context_align(AlignmentContext(*fewer, initial_flow=True))),
+    ]
+    results = [measure(name, align, clip, clean, args.radius) for name, align in paths]
+
+    print(f"{args.width}x{args.height}, radius {args.radius}, {args.iterations} iterations, flow scale {args.flow_scale}")
+    print(f"{'path':>18} {'ms/frame':>9} {'speedup':>8} {'alloc MB':>9} {'align MAE':>10}")
+    for r in results:
+        print(f"{r['path']:>18} {r['ms_per_frame']:>9.1f} {results[0]['ms_per_frame'] / r['ms_per_frame']:>8.2f} {r['peak_alloc_mb']:>9.2f} {r['alignment_mae']:>10.5f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "radius": args.radius, "iterations": args.iterations, "flow_scale": args.flow_scale, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Speed versus alignment error of proxy-resolution optical flow.
+
+Builds a synthetic textured frame pair with a known smooth motion field, adds
+sensor-like noise, and for each flow resolution times the Farneback estimate
+(including proxy conversion and upscaling) and measures the alignment error:
+
+    python -m benchmarks.flow_resolution --width 3840 --height 2160
+"""
+import argparse
+import json
+import time
+import numpy as np
+import cv2
+from temporal_denoiser.flow import to_gray, upscale_flow, flow_to_map, invert_flow, coordinate_grid
+
+
+def synthetic_pair(width, height, noise=0.02, seed=0):
+    """Return (ref, cur, clean_ref, clean_cur, true_flow) with true_flow the flow from ref to cur."""
+    rng = np.random.default_rng(seed)
+    texture = np.zeros((height, width, 3), dtype=np.float32)
+    for sigma, weight in ((1.5, 0.3), (6.0, 0.4), (24.0, 0.3)):
+        layer = cv2.GaussianBlur(rng.random((height, width, 3), dtype=np.float32), (0, 0), sigma)
+        layer = (layer - layer.min()) / (layer.max() - layer.min())
+        texture += weight * layer
+    # Smooth, low-frequency motion: a pan plus a gentle swirl, scaled to the frame size
+    grid = coordinate_grid(height, width)
+    scale = width / 1920.0
+    x = grid[:, :, 0] / width
+    y = grid[:, :, 1] / height
+    motion = np.empty((height, width, 2), dtype=np.float32)
+    motion[:, :, 0] = scale * (3.0 + 2.0 * np.sin(2 * np.pi * y))
+    motion[:, :, 1] = scale * (-1.5 + 1.5 * np.cos(2 * np.pi * x))
+    clean_ref = texture
+    clean_cur = cv2.remap(texture, grid + motion, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REFLECT)
+    # cur(y) = ref(y + motion(y)), so the flow from ref to cur is the inverse of motion
+    true_flow = invert_flow(motion, iterations=20)
+    ref = np.clip(clean_ref + rng.normal(0, noise, clean_ref.shape), 0, 1).astype(np.float32)
+    cur = np.clip(clean_cur + rng.normal(0, noise, clean_cur.shape), 0, 1).astype(np.float32)
+    return ref, cur, clean_ref, clean_cur, true_flow
+
+
+def measure(ref, cur, clean_ref, clean_cur, true_flow, flow_scale, repeats, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2):
+    h, w = ref.shape[:2]
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        flow = cv2.calcOpticalFlowFarneback(to_gray(ref, flow_scale), to_gray(cur, flow_scale), None, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0)
+        flow = upscale_flow(flow, h, w)
+        timings.append(time.perf_counter() - start)
+    # Ignore a border where the motion samples outside the frame
+    m = max(8, int(0.03 * w))
+    aligned = cv2.remap(clean_cur, flow_to_map(flow), None, cv2.INTER_LINEAR)
+    return {
+        "flow_scale": flow_scale,
+        "seconds": round(float(np.median(timings)), 4),
+        "endpoint_error_px": round(float(np.linalg.norm(flow - true_flow, axis=2)[m:-m, m:-m].mean()), 4),
+        "alignment_mae": round(float(np.abs(aligned - clean_ref)[m:-m, m:-m].mean()), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.5, 0.25])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    pair = synthetic_pair(args.width, args.height)
+    unaligned = float(np.abs(pair[3] - pair[2]).mean())
+    results = [measure(*pair, flow_scale=scale, repeats=args.repeats) for scale in args.scales]
+
+    print(f"{args.width}x{args.height}, unaligned MAE {unaligned:.5f}")
+    print(f"{'scale':>6} {'seconds':>9} {'speedup':>8} {'EPE px':>8} {'align MAE':>10}")
+    for r in results:
+        print(f"{r['flow_scale']:>6} {r['seconds']:>9.4f} {results[0]['seconds'] / r['seconds']:>8.2f} {r['endpoint_error_px']:>8.3f} {r['alignment_mae']:>10.5f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "unaligned_mae": unaligned, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
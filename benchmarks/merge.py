@@ -0,0 +1,79 @@
+"""Per-frame cost of the temporal merge paths and merge kernels.
+
+Slides a window of 2r+1 frames over a synthetic clip and, for np.mean, the
+preallocated mean mergers and each robust merge kernel, reports milliseconds
+and frames per second per output frame and the peak memory allocated while
+merging one frame (numpy allocations are visible to tracemalloc):
+
+    python -m benchmarks.merge --width 3840 --height 2160 --radius 3
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from temporal_denoiser.merge import MeanMerger, RunningMean, MERGE_KERNELS, make_merger
+
+
+def synthetic_clip(width, height, frames, seed=0):
+    """Return a list of float32 frames holding 16-bit values scaled to [0, 1], like decoded DNGs."""
+    rng = np.random.default_rng(seed)
+    return [(rng.integers(0, 65536, (height, width, 3), dtype=np.uint16) / np.float32(65535.0)).astype(np.float32) for _ in range(frames)]
+
+
+def _numpy_mean(clip, lo, hi):
+    return np.mean(clip[lo:hi], axis=0)
+
+
+def measure(name, merge, clip, radius):
+    """Merge every frame of clip with merge(lo, hi), timing it and tracking per-frame peak allocation."""
+    n = len(clip)
+    windows = [(max(0, i - radius), min(n, i + radius + 1)) for i in range(n)]
+    merge(*windows[min(radius, n - 1)])  # Warm up buffers at the full window size
+    start = time.perf_counter()
+    for lo, hi in windows:
+        merge(lo, hi)
+    seconds = time.perf_counter() - start
+    peak = 0
+    for lo, hi in windows[radius:radius + 3]:
+        tracemalloc.start()
+        merge(lo, hi)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return {"merge": name, "ms_per_frame": round(1000 * seconds / n, 3), "frames_per_second": round(n / seconds, 2), "peak_alloc_mb": round(peak / 2**20, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--radius", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=16)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    clip = synthetic_clip(args.width, args.height, args.frames)
+    merger = MeanMerger()
+    running = RunningMean()
+    paths = [
+        ("np.mean", lambda lo, hi: _numpy_mean(clip, lo, hi)),
+        ("MeanMerger", lambda lo, hi: merger.mean(clip[lo:hi])),
+        ("RunningMean", lambda lo, hi: running.mean(clip, 0, lo, hi)),
+    ]
+    for kernel in MERGE_KERNELS[1:]:
+        # Throughput does not depend on which frame is the reference, so use the middle one
+        paths.append((kernel, lambda lo, hi, merger=make_merger(kernel): merger.merge(clip[lo:hi], (hi - lo) // 2)))
+    results = [measure(name, merge, clip, args.radius) for name, merge in paths]
+
+    frame_mb = clip[0].nbytes / 2**20
+    print(f"{args.width}x{args.height}, radius {args.radius}, {frame_mb:.1f} MB per frame")
+    print(f"{'merge':>12} {'ms/frame':>9} {'frames/s':>9} {'speedup':>8} {'alloc MB':>9}")
+    for r in results:
+        print(f"{r['merge']:>12} {r['ms_per_frame']:>9.2f} {r['frames_per_second']:>9.2f} {results[0]['ms_per_frame'] / r['ms_per_frame']:>8.2f} {r['peak_alloc_mb']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "radius": args.radius, "frame_mb": frame_mb, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,327 @@
+"""Throughput, peak memory, stage times and PSNR on synthetic noisy sequences, with regression checks.
+
+Generates a sequence with known motion (the pan and swirl of
+benchmarks.alignment) and known Gaussian noise at each resolution, stored as
+16-bit frames the way a raw decode delivers them, and benchmarks in a fresh
+process per scenario:
+
+    preview  PreviewDenoiser.preview of the middle frame of one window
+    export   StreamExporter.export of the whole sequence, streamed from disk
+    decode   CinemaDNG.get_images on the sequence saved as Bayer DNGs
+
+Each scenario reports frames per second, the peak RSS of its process, the
+time per stage (see temporal_denoiser.profiling) and, for preview and export,
+the PSNR of the noisy input and of the denoised output against the clean
+frames, away from the borders where the pan brings in content no neighbour
+has. Every result records the options it ran with. --compare flags
+scenarios of an earlier --json run that got slower, noisier or bigger than the
+tolerances allow and exits with status 1; it refuses (status 2) to compare
+scenarios whose options differ, since their numbers are not comparable:
+
+    python -m benchmarks.suite --resolutions 1080p 4k 6k --radii 2 3 --json base.json
+    python -m benchmarks.suite --resolutions 1080p 4k 6k --radii 2 3 --json new.json --compare base.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+import numpy as np
+import cv2
+from benchmarks.alignment import synthetic_frames
+from temporal_denoiser.frames import FRAME_DTYPES, to_float32, to_storage
+from temporal_denoiser.profiling import Profiler
+from temporal_denoiser.writer import output_name, parse_format
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+try:
+    import tifffile
+    HAS_TIFFFILE = True
+except ImportError:
+    HAS_TIFFFILE = False
+
+RESOLUTIONS = {"1080p": (1920, 1080), "4k": (3840, 2160), "6k": (6144, 3456)}
+TARGETS = ("preview", "export", "decode")
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, or None where the platform cannot tell."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+def psnr(frame, clean, margin):
+    diff = frame[margin:-margin, margin:-margin] - clean[margin:-margin, margin:-margin]
+    mse = float(np.mean(np.square(diff, dtype=np.float32)))
+    return round(10 * np.log10(1.0 / mse), 3) if mse > 0 else float("inf")
+
+
+def write_sequence(directory, width, height, frames, noise, seed, dng=False):
+    """Save the noisy and clean frames of a synthetic clip as uint16 .npy files, and optionally as RGGB DNGs."""
+    for k, (noisy, clean) in enumerate(synthetic_frames(width, height, frames, noise, seed)):
+        noisy = to_storage(noisy, "uint16")
+        np.save(os.path.join(directory, f"noisy_{k:04d}.npy"), noisy)
+        np.save(os.path.join(directory, f"clean_{k:04d}.npy"), to_storage(clean, "uint16"))
+        if dng:
+            write_dng(os.path.join(directory, f"clip_{k:04d}.dng"), noisy)
+
+
+def write_dng(path, frame):
+    """Save an RGB uint16 frame as a minimal RGGB Bayer DNG that LibRaw (rawpy) can decode."""
+    mosaic = np.empty(frame.shape[:2], dtype=np.uint16)
+    mosaic[0::2, 0::2] = frame[0::2, 0::2, 0]
+    mosaic[0::2, 1::2] = frame[0::2, 1::2, 1]
+    mosaic[1::2, 0::2] = frame[1::2, 0::2, 1]
+    mosaic[1::2, 1::2] = frame[1::2, 1::2, 2]
+    tags = [
+        (50706, "B", 4, (1, 4, 0, 0), True),  # DNGVersion
+        (50707, "B", 4, (1, 1, 0, 0), True),  # DNGBackwardVersion
+        (50708, "s", 0, "Synthetic", True),  # UniqueCameraModel
+        (33421, "H", 2, (2, 2), True),  # CFARepeatPatternDim
+        (33422, "B", 4, (0, 1, 1, 2), True),  # CFAPattern RGGB
+        (50717, "I", 1, 65535, True),  # WhiteLevel
+        (50721, "2i", 9, (1, 1, 0, 1, 0, 1, 0, 1, 1, 1, 0, 1, 0, 1, 0, 1, 1, 1), True),  # Identity ColorMatrix1
+        (50778, "H", 1, 21, True),  # D65 CalibrationIlluminant1
+    ]
+    tifffile.imwrite(path, mosaic, photometric=32803, extratags=tags, metadata=None)
+
+
+def _frames(directory, kind, count):
+    return [os.path.join(directory, f"{kind}_{k:04d}.npy") for k in range(count)]
+
+
+def _read_output(path):
+    if path.endswith(".npy"):
+        return to_float32(np.load(path))
+    if path.endswith(".tif"):
+        return to_float32(tifffile.imread(path))
+    return to_float32(cv2.cvtColor(cv2.imread(path, cv2.IMREAD_UNCHANGED), cv2.COLOR_BGR2RGB))
+
+
+def _denoise_options(options):
+    return dict(flow_scale=options["flow_scale"], align_backend=options["align_backend"], merge=options["merge"], tile_mb=options["tile_mb"])
+
+
+def _preview(directory, frames, radius, options, margin):
+    from temporal_denoiser.denoise import PreviewDenoiser
+
+    ref = frames // 2
+    window = [np.load(path) for path in _frames(directory, "noisy", frames)[ref - radius:ref + radius + 1]]
+    denoiser = PreviewDenoiser()
+    denoiser.preview(window, radius, radius, 0, **_denoise_options(options))  # Warm up the core's buffers
+    profiler = Profiler()
+    denoiser.core.set_profiler(profiler)
+    start = time.perf_counter()
+    for _ in range(options["repeats"]):
+        orig, denoised = denoiser.preview(window, radius, radius, 0, **_denoise_options(options))
+        profiler.frame()
+    seconds = time.perf_counter() - start
+    peak = peak_rss_mb()
+    clean = to_float32(np.load(os.path.join(directory, f"clean_{ref:04d}.npy")))
+    return seconds, options["repeats"], peak, profiler, psnr(orig, clean, margin), psnr(denoised, clean, margin)
+
+
+def _export(directory, frames, radius, options, margin):
+    from temporal_denoiser.denoise import StreamExporter
+
+    profiler = Profiler()
+    with tempfile.TemporaryDirectory() as output_dir:
+        start = time.perf_counter()
+        StreamExporter().export((np.load(path) for path in _frames(directory, "noisy", frames)), output_dir, radius, 0, window_dtype=options["window_dtype"], output_format=options["format"], profiler=profiler, **_denoise_options(options))
+        seconds = time.perf_counter() - start
+        peak = peak_rss_mb()
+        noisy_psnr, denoised_psnr = [], []
+        for k in range(frames):
+            clean = to_float32(np.load(os.path.join(directory, f"clean_{k:04d}.npy")))
+            noisy_psnr.append(psnr(to_float32(np.load(os.path.join(directory, f"noisy_{k:04d}.npy"))), clean, margin))
+            denoised_psnr.append(psnr(_read_output(os.path.join(output_dir, output_name(k, options["format"]))), clean, margin))
+    return seconds, frames, peak, profiler, round(float(np.mean(noisy_psnr)), 3), round(float(np.mean(denoised_psnr)), 3)
+
+
+def _decode(directory, frames, radius, options, margin):
+    from temporal_denoiser.cinemadng import CinemaDNG
+
+    cinemadng = CinemaDNG([os.path.join(directory, f"clip_{k:04d}.dng") for k in range(frames)], cache_bytes=0)
+    profiler = Profiler()
+    start = time.perf_counter()
+    images = cinemadng.get_images()
+    finished = time.perf_counter()
+    profiler.record("decode", start, finished)
+    profiler.frame(len(images))
+    return finished - start, len(images), peak_rss_mb(), profiler, None, None
+
+
+def run_scenario(target, directory, frames, radius, options):
+    """Run one benchmark in this process and return its result record."""
+    width, height = RESOLUTIONS[options["resolution"]]
+    margin = max(8, int(0.03 * width))
+    base_rss = peak_rss_mb()
+    run = {"preview": _preview, "export": _export, "decode": _decode}[target]
+    seconds, count, peak, profiler, noisy_psnr, denoised_psnr = run(directory, frames, radius, options, margin)
+    stats = profiler.as_dict()
+    return {
+        "target": target,
+        "resolution": options["resolution"],
+        "width": width,
+        "height": height,
+        "radius": radius if target != "decode" else None,
+        "status": "ok",
+        "frames": count,
+        "seconds": round(seconds, 3),
+        "frames_per_second": round(count / seconds, 3),
+        "base_rss_mb": base_rss,
+        "peak_rss_mb": peak,
+        "noisy_psnr": noisy_psnr,
+        "denoised_psnr": denoised_psnr,
+        "stages": stats["stages"],
+        "options": _run_options(frames, options),
+    }
+
+
+def _isolated(target, directory, frames, radius, options):
+    """run_scenario in a fresh process, so the peak RSS is the scenario's own; a scenario that fails (e.g. runs out of memory) is recorded as failed."""
+    try:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(run_scenario, target, directory, frames, radius, options).result()
+    except Exception as e:
+        width, height = RESOLUTIONS[options["resolution"]]
+        return {"target": target, "resolution": options["resolution"], "width": width, "height": height, "radius": radius if target != "decode" else None, "status": "failed", "error": str(e) or type(e).__name__, "options": _run_options(frames, options)}
+
+
+def _run_options(frames, options):
+    """Everything besides the scenario key that a result depends on."""
+    return dict({name: value for name, value in options.items() if name != "resolution"}, frames=frames)
+
+
+def scenario_key(result):
+    return f"{result['target']} {result['resolution']} r{result['radius']}" if result["radius"] is not None else f"{result['target']} {result['resolution']}"
+
+
+def option_mismatches(results, baseline):
+    """Messages for every scenario of results that ran with other options than the same scenario in baseline."""
+    previous = {scenario_key(result): result for result in baseline["results"]}
+    mismatches = []
+    for result in results:
+        key = scenario_key(result)
+        old = previous.get(key)
+        if old is None:
+            continue
+        if "options" not in old:
+            mismatches.append(f"{key}: the baseline does not record its options")
+            continue
+        for name in sorted(set(result["options"]) | set(old["options"])):
+            if result["options"].get(name) != old["options"].get(name):
+                mismatches.append(f"{key}: {name} {result['options'].get(name)!r}, baseline {old['options'].get(name)!r}")
+    return mismatches
+
+
+def compare(results, baseline, max_slowdown, max_psnr_drop, max_rss_growth):
+    """Messages for every scenario of results that regressed against the same scenario in baseline.
+
+    Raises ValueError if a scenario ran with other options than in baseline
+    (see option_mismatches).
+    """
+    mismatches = option_mismatches(results, baseline)
+    if mismatches:
+        raise ValueError("Options differ from the baseline:\n" + "\n".join(mismatches))
+    previous = {scenario_key(result): result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        key = scenario_key(result)
+        old = previous.get(key)
+        if old is None or old.get("status", "ok") != "ok":
+            continue
+        if result["status"] != "ok":
+            regressions.append(f"{key}: failed ({result['error']})")
+            continue
+        if result["frames_per_second"] < (1 - max_slowdown) * old["frames_per_second"]:
+            regressions.append(f"{key}: {result['frames_per_second']:.2f} frames/s, was {old['frames_per_second']:.2f}")
+        if result["denoised_psnr"] is not None and old["denoised_psnr"] is not None and result["denoised_psnr"] < old["denoised_psnr"] - max_psnr_drop:
+            regressions.append(f"{key}: PSNR {result['denoised_psnr']:.2f} dB, was {old['denoised_psnr']:.2f} dB")
+        if result["peak_rss_mb"] is not None and old["peak_rss_mb"] is not None and result["peak_rss_mb"] > (1 + max_rss_growth) * old["peak_rss_mb"]:
+            regressions.append(f"{key}: peak RSS {result['peak_rss_mb']:.0f} MB, was {old['peak_rss_mb']:.0f} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS), choices=RESOLUTIONS)
+    parser.add_argument("--radii", type=int, nargs="+", default=[2, 3])
+    parser.add_argument("--targets", nargs="+", default=list(TARGETS), choices=TARGETS)
+    parser.add_argument("--frames", type=int, default=8, help="Frames per exported sequence (at least 2 * radius + 1)")
+    parser.add_argument("--decode-frames", type=int, default=3)
+    parser.add_argument("--noise", type=float, default=0.02, help="Standard deviation of the added Gaussian noise")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--flow-scale", type=float, default=0.5)
+    parser.add_argument("--align-backend", default="farneback")
+    parser.add_argument("--merge", default="mean")
+    parser.add_argument("--tile-mb", type=int)
+    parser.add_argument("--window-dtype", choices=FRAME_DTYPES, default="float32")
+    parser.add_argument("--format", default="npy", help="Export output format")
+    parser.add_argument("--repeats", type=int, default=3, help="Previews timed per scenario")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Flag regressions against the results of an earlier --json run")
+    parser.add_argument("--max-slowdown", type=float, default=0.1, help="Tolerated drop in frames per second (default 0.1, 10%%)")
+    parser.add_argument("--max-psnr-drop", type=float, default=0.1, help="Tolerated drop in denoised PSNR in dB")
+    parser.add_argument("--max-rss-growth", type=float, default=0.2, help="Tolerated growth of the peak RSS (default 0.2, 20%%)")
+    args = parser.parse_args()
+    parse_format(args.format)
+    if "decode" in args.targets and not HAS_TIFFFILE:
+        print("tifffile is not installed; skipping the decode benchmark")
+        args.targets = [target for target in args.targets if target != "decode"]
+
+    frames = max(args.frames, 2 * max(args.radii) + 1)
+    options = dict(flow_scale=args.flow_scale, align_backend=args.align_backend, merge=args.merge, tile_mb=args.tile_mb, window_dtype=args.window_dtype, format=args.format, repeats=args.repeats, noise=args.noise, seed=args.seed)
+    results = []
+    for resolution in args.resolutions:
+        width, height = RESOLUTIONS[resolution]
+        options["resolution"] = resolution
+        with tempfile.TemporaryDirectory() as directory:
+            write_sequence(directory, width, height, max(frames, args.decode_frames), args.noise, args.seed, dng="decode" in args.targets)
+            for target in args.targets:
+                if target == "decode":
+                    results.append(_isolated(target, directory, args.decode_frames, None, options))
+                    continue
+                for radius in args.radii:
+                    results.append(_isolated(target, directory, frames if target == "export" else 2 * radius + 1, radius, options))
+
+    print(f"flow scale {args.flow_scale}, {args.align_backend}, {args.merge}, tile_mb={args.tile_mb}, window {args.window_dtype}, format {args.format}, noise {args.noise}")
+    print(f"{'scenario':<18} {'frames/s':>9} {'ms/frame':>9} {'peak MB':>8} {'PSNR in':>8} {'PSNR out':>9}  slowest stages")
+    for r in results:
+        if r["status"] != "ok":
+            print(f"{scenario_key(r):<18} failed: {r['error']}")
+            continue
+        psnr_in = f"{r['noisy_psnr']:.2f}" if r["noisy_psnr"] is not None else "-"
+        psnr_out = f"{r['denoised_psnr']:.2f}" if r["denoised_psnr"] is not None else "-"
+        stages = ", ".join(f"{s['stage']} {s['share']:.0%}" for s in r["stages"][:3] if s["share"] is not None)
+        print(f"{scenario_key(r):<18} {r['frames_per_second']:>9.2f} {1000 / r['frames_per_second']:>9.1f} {r['peak_rss_mb'] or 0:>8.0f} {psnr_in:>8} {psnr_out:>9}  {stages}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"results": results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        try:
+            regressions = compare(results, baseline, args.max_slowdown, args.max_psnr_drop, args.max_rss_growth)
+        except ValueError as e:
+            print(f"Not comparing against {args.compare}: {e}")
+            sys.exit(2)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Working memory and time per frame of whole-frame and tiled denoising.
+
+Denoises the middle frame of a synthetic panning clip with a DenoiseCore,
+once processing whole frames and once for each tile budget, and reports the
+peak memory allocated while denoising one frame (the buffers the core keeps
+plus temporaries, but not the window of input frames or the flow estimator's
+internals), the time per frame and whether the result matches whole-frame
+processing:
+
+    python -m benchmarks.tiles --width 7680 --height 4320 --radius 5 --flow-scale 0.5 --budgets 512 256
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from benchmarks.alignment import synthetic_clip
+from temporal_denoiser.denoise import DenoiseCore
+
+
+def measure(clip, radius, tile_mb, options, repeats):
+    core = DenoiseCore(radius, tile_mb=tile_mb, **options)
+    ref = len(clip) // 2
+    tracemalloc.start()
+    core.denoise_frame(clip, ref)  # The first frame allocates every buffer the core keeps
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        denoised = core.denoise_frame(clip, ref)
+    seconds = (time.perf_counter() - start) / repeats
+    h, w = clip[0].shape[:2]
+    return {
+        "tile_mb": tile_mb,
+        "tile_rows": core.tile_rows(h, w, clip[0].shape[2], len(clip)) if tile_mb is not None else h,
+        "peak_alloc_mb": round(peak / 2**20, 1),
+        "ms_per_frame": round(1000 * seconds, 1),
+    }, denoised.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=3840)
+    parser.add_argument("--height", type=int, default=2160)
+    parser.add_argument("--radius", type=int, default=3)
+    parser.add_argument("--flow-scale", type=float, default=0.5)
+    parser.add_argument("--align-backend", default="farneback")
+    parser.add_argument("--merge", default="mean")
+    parser.add_argument("--median", type=int, default=0)
+    parser.add_argument("--budgets", type=int, nargs="+", default=[512, 256, 128], help="Tile budgets in MB")
+    parser.add_argument("--repeats", type=int, default=2)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    clip, _ = synthetic_clip(args.width, args.height, 2 * args.radius + 1)
+    options = dict(spatial_median=args.median, flow_scale=args.flow_scale, align_backend=args.align_backend, merge=args.merge)
+    whole, expected = measure(clip, args.radius, None, options, args.repeats)
+    results = [whole]
+    for budget in args.budgets:
+        result, denoised = measure(clip, args.radius, budget, options, args.repeats)
+        result["identical"] = bool(np.array_equal(denoised, expected))
+        results.append(result)
+
+    window_mb = sum(frame.nbytes for frame in clip) / 2**20
+    print(f"{args.width}x{args.height}, radius {args.radius}, flow scale {args.flow_scale}, {args.align_backend}, {args.merge}; input window {window_mb:.0f} MB")
+    print(f"{'tile MB':>8} {'rows':>6} {'peak MB':>8} {'ms/frame':>9} {'identical':>9}")
+    for r in results:
+        print(f"{r['tile_mb'] or 'whole':>8} {r['tile_rows']:>6} {r['peak_alloc_mb']:>8.1f} {r['ms_per_frame']:>9.1f} {str(r.get('identical', '')):>9}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "radius": args.radius, "flow_scale": args.flow_scale, "align_backend": args.align_backend, "merge": args.merge, "window_mb": round(window_mb, 1), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Memory and time per frame of float32, uint16 and float16 temporal windows.
+
+Streams a synthetic panning clip, quantised to 16 bits as a raw decode is,
+through DenoiseCore.denoise_range once per window storage type and reports
+the memory of the window of decoded frames, the peak memory allocated while
+streaming (window, buffers and temporaries, but not the flow estimator's
+internals), the time per frame and the largest difference from the float32
+window:
+
+    python -m benchmarks.window --width 3840 --height 2160 --radius 3 --flow-scale 0.5
+"""
+import argparse
+import json
+import time
+import tracemalloc
+import numpy as np
+from benchmarks.alignment import synthetic_clip
+from temporal_denoiser.denoise import DenoiseCore
+from temporal_denoiser.frames import FRAME_DTYPES, to_storage
+
+
+def measure(decoded, radius, window_dtype, options, expected):
+    core = DenoiseCore(radius, window_dtype=window_dtype, **options)
+    diff = 0.0
+    tracemalloc.start()
+    start = time.perf_counter()
+    # Copies of the decodes, so each run allocates (and converts) its own frames as a decoder would
+    for frame_idx, denoised in core.denoise_range(frame.copy() for frame in decoded):
+        diff = max(diff, float(np.abs(denoised - expected[frame_idx]).max()))
+    seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "window_dtype": window_dtype,
+        "window_mb": round((2 * radius + 1) * to_storage(decoded[0], window_dtype).nbytes / 2**20, 1),
+        "peak_alloc_mb": round(peak / 2**20, 1),
+        "ms_per_frame": round(1000 * seconds / len(decoded), 1),
+        "max_abs_diff": diff,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--radius", type=int, default=3)
+    parser.add_argument("--frames", type=int, default=12)
+    parser.add_argument("--flow-scale", type=float, default=0.5)
+    parser.add_argument("--align-backend", default="farneback")
+    parser.add_argument("--merge", default="mean")
+    parser.add_argument("--no-align", dest="align", action="store_false")
+    parser.add_argument("--tile-mb", type=int)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    clip, _ = synthetic_clip(args.width, args.height, args.frames)
+    decoded = [to_storage(frame, "uint16") for frame in clip]
+    del clip
+    options = dict(align=args.align, flow_scale=args.flow_scale, align_backend=args.align_backend, merge=args.merge, tile_mb=args.tile_mb)
+    # The float32 window's output, computed untraced, is the reference for the others
+    core = DenoiseCore(args.radius, **options)
+    expected = {frame_idx: denoised.copy() for frame_idx, denoised in core.denoise_range(decoded)}
+    results = [measure(decoded, args.radius, window_dtype, options, expected) for window_dtype in FRAME_DTYPES]
+
+    print(f"{args.width}x{args.height}, {args.frames} frames, radius {args.radius}, flow scale {args.flow_scale}, {args.align_backend}, {args.merge}, align={args.align}, tile_mb={args.tile_mb}")
+    print(f"{'window':>8} {'window MB':>10} {'peak MB':>8} {'ms/frame':>9} {'max diff':>9}")
+    for r in results:
+        print(f"{r['window_dtype']:>8} {r['window_mb']:>10.1f} {r['peak_alloc_mb']:>8.1f} {r['ms_per_frame']:>9.1f} {r['max_abs_diff']:>9.2g}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "frames": args.frames, "radius": args.radius, "flow_scale": args.flow_scale, "align_backend": args.align_backend, "merge": args.merge, "align": args.align, "tile_mb": args.tile_mb, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""Encode time, file size and writer-pool throughput of the output formats.
+
+Encodes a synthetic denoised frame (smooth texture with light residual grain)
+in each available output format, then writes a short sequence through a
+FrameWriter pool to measure sustained frames per second:
+
+    python -m benchmarks.writers --width 3840 --height 2160 --writers 4
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import numpy as np
+import cv2
+from temporal_denoiser.writer import FrameWriter, HAS_IMAGECODECS, HAS_TIFFFILE, encode_frame, prepare_frame
+
+
+def synthetic_frame(width, height, grain=0.004, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = cv2.GaussianBlur(rng.random((height, width, 3), dtype=np.float32), (0, 0), 6.0)
+    frame = (frame - frame.min()) / (frame.max() - frame.min())
+    return np.clip(frame + rng.normal(0, grain, frame.shape), 0, 1).astype(np.float32)
+
+
+def available_formats():
+    formats = ["png", "png:1", "npy"]
+    if HAS_TIFFFILE:
+        formats[:0] = ["tiff", "tiff:zlib:1"]
+        if HAS_IMAGECODECS:
+            formats[2:2] = ["tiff:zstd", "tiff:lzw"]
+    return formats
+
+
+def measure(frame, output_format, frames, writers):
+    image = prepare_frame(frame, output_format)
+    start = time.perf_counter()
+    data = encode_frame(image, output_format)
+    encode_seconds = time.perf_counter() - start
+    with tempfile.TemporaryDirectory() as output_dir:
+        writer = FrameWriter(output_dir, output_format, workers=writers)
+        start = time.perf_counter()
+        for frame_idx in range(frames):
+            writer.submit(frame_idx, frame)
+        writer.close()
+        seconds = time.perf_counter() - start
+    return {
+        "format": output_format,
+        "encode_ms": round(1000 * encode_seconds, 2),
+        "mb_per_frame": round(len(data) / 2**20, 2),
+        "frames_per_second": round(frames / seconds, 2),
+        "writer": writer.stats.as_dict(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--frames", type=int, default=8, help="Frames written through the writer pool per format")
+    parser.add_argument("--writers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--formats", nargs="+", help="Format specs to test (default: all available)")
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    frame = synthetic_frame(args.width, args.height)
+    results = [measure(frame, spec, args.frames, args.writers) for spec in args.formats or available_formats()]
+
+    print(f"{args.width}x{args.height}, {args.writers} writer threads")
+    print(f"{'format':>12} {'encode ms':>10} {'MB/frame':>9} {'pool fps':>9}")
+    for r in results:
+        print(f"{r['format']:>12} {r['encode_ms']:>10.1f} {r['mb_per_frame']:>9.2f} {r['frames_per_second']:>9.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"width": args.width, "height": args.height, "writers": args.writers, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,11 @@
-from temporal_denoiser.main import main
+import sys
+import multiprocessing
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
+    if len(sys.argv) > 1 and sys.argv[1] in ("denoise", "batch", "-h", "--help"):
+        # Headless entry point; does not import Qt
+        from temporal_denoiser.cli import main as cli_main
+        sys.exit(cli_main())
+    from temporal_denoiser.main import main
     main()
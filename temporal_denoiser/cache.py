@@ -0,0 +1,65 @@
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Default memory budget for decoded frames (a 4K float32 RGB frame is ~100 MB)
+DEFAULT_CACHE_BYTES = 2 * 1024 ** 3
+
+
+class FrameCache:
+    """Bounded LRU cache of decoded frames with a memory budget in bytes.
+
+    Cached arrays are marked read-only because they are shared between callers.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._frames = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._frames)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._frames
+
+    @property
+    def nbytes(self):
+        return self._nbytes
+
+    def get(self, key):
+        with self._lock:
+            frame = self._frames.get(key)
+            if frame is None:
+                self.misses += 1
+                return None
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+
+    def put(self, key, frame):
+        if frame.nbytes > self.max_bytes:
+            logger.debug("Frame of %d bytes exceeds cache budget of %d; not caching", frame.nbytes, self.max_bytes)
+            return frame
+        frame.flags.writeable = False
+        with self._lock:
+            old = self._frames.pop(key, None)
+            if old is not None:
+                self._nbytes -= old.nbytes
+            self._frames[key] = frame
+            self._nbytes += frame.nbytes
+            while self._nbytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self._nbytes -= evicted.nbytes
+        return frame
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._nbytes = 0
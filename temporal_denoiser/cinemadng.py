@@ -1,13 +1,18 @@
-import numpy as np
-import imageio
-import rawpy
+import cv2
 import os
-from temporal_denoiser.denoise import PreviewDenoiser, StreamExporter
+from temporal_denoiser.denoise import PreviewDenoiser, StreamExporter, JobCancelled, reuse_core
+from temporal_denoiser.cache import FrameCache, DEFAULT_CACHE_BYTES
+from temporal_denoiser.parallel import ParallelExporter
+from temporal_denoiser.pipeline import PipelineExporter
+from temporal_denoiser.manifest import ExportManifest, file_fingerprint
+from temporal_denoiser.writer import parse_format
+from temporal_denoiser.framestore import FrameStore
+from temporal_denoiser.frames import to_float32
+from temporal_denoiser.sequence import SequenceIndex, index_directory
+from temporal_denoiser.sweep import SWEEP_DEFAULTS, sweep
 import logging
 from pathlib import Path
 
-# Set up logging to debug initialization issues
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 try:
@@ -22,33 +27,153 @@ try:
     HAS_TIFFFILE = True
 except Exception as e:
     HAS_TIFFFILE = False
-    logger.warning(f"tifffile import failed: {e}; DNG output will use fallback (PNG)")
+    logger.warning(f"tifffile import failed: {e}; 16-bit TIFF output will fall back to 8-bit PNG")
     logger.debug("tifffile import failure details:", exc_info=True)
 
 def available():
     return HAS_RAWPY and HAS_TIFFFILE
 
+def fit_to_size(img, size):
+    """Downscale img to fit within size=(width, height), keeping its aspect ratio."""
+    h, w = img.shape[:2]
+    scale = min(size[0] / w, size[1] / h)
+    if scale >= 1.0:
+        return img
+    return cv2.resize(img, (max(1, int(round(w * scale))), max(1, int(round(h * scale)))), interpolation=cv2.INTER_AREA)
+
 try:
     class CinemaDNG:
-        def __init__(self, file_path):
-            logger.debug(f"Initializing CinemaDNG with file_path: {file_path}")
+        def __init__(self, file_path, cache_bytes=DEFAULT_CACHE_BYTES, store_dir=None, store_dtype="uint16", use_timecode=False):
+            """store_dir enables the on-disk FrameStore of decoded frames (see temporal_denoiser.framestore).
+
+            Frames are ordered by the frame number in their file names, or by their
+            DNG timecode with use_timecode=True (see temporal_denoiser.sequence).
+            """
+            logger.debug("Initializing CinemaDNG with %s, store_dir: %s", f"{len(file_path)} files" if isinstance(file_path, (list, tuple)) else file_path, store_dir)
             self.images = []
+            self.sequence = SequenceIndex([])
+            self.decode_settings = {"output_bps": 16, "no_auto_bright": True, "use_camera_wb": True}
+            self.cache = FrameCache(cache_bytes)
+            self.store = None
+            # Denoise cores are kept between calls so their buffers are reused
+            self.previewer = PreviewDenoiser()
+            self._range_core = None
             try:
                 if not HAS_RAWPY:
                     logger.warning("Cannot load CinemaDNG files without rawpy")
                     return
                 # Handle single file, multiple files, or directory
                 if isinstance(file_path, (list, tuple)):
-                    self.images = [str(Path(f)) for f in file_path]
+                    self.sequence = SequenceIndex.from_paths([str(Path(f)) for f in file_path], use_timecode)
                 elif Path(file_path).is_dir():
-                    self.images = [str(f) for f in Path(file_path).glob("*.dng")]
+                    self.sequence = index_directory(file_path, use_timecode)
                 else:
-                    self.images = [str(Path(file_path))]
-                logger.debug(f"Loaded {len(self.images)} DNG files: {self.images}")
+                    self.sequence = SequenceIndex.from_paths([str(Path(file_path))], use_timecode)
+                self.images = list(self.sequence.paths)
+                logger.debug("Loaded %d DNG files", len(self.images))
+                self._index = {path: i for i, path in enumerate(self.images)}
+                if store_dir is not None and self.images:
+                    self.store = FrameStore(store_dir, self.images, self.decode_settings, store_dtype)
             except Exception as e:
                 logger.error(f"Failed to load CinemaDNG files: {e}")
                 raise
 
+        def frame_index(self, frame_number):
+            """Position in images of the file with the given frame number (KeyError if it is missing)."""
+            return self.sequence.position(frame_number)
+
+        def _decode(self, path, half_size=False, compact=False):
+            """Decode path as a normalised float32 frame, or with compact=True as rawpy's uint16 data."""
+            with rawpy.imread(path) as raw:
+                # half_size skips demosaicing and returns a half-resolution image, used for fast previews
+                img = raw.postprocess(half_size=half_size, **self.decode_settings)
+            return img if compact else to_float32(img)
+
+        def _read(self, path, compact=False):
+            """Full-resolution frame for path, from the frame store when there is one (filling it on a miss).
+
+            With compact=True the frame comes as uint16 decoder data, or as a
+            zero-copy view of the store's data, for export windows that convert
+            it to their own storage type (see temporal_denoiser.frames).
+            """
+            if self.store is None:
+                return self._decode(path, compact=compact)
+            idx = self._index[path]
+            frame = self.store.view(idx) if compact else self.store.get(idx)
+            if frame is None:
+                frame = self._decode(path, compact=compact)
+                self.store.put(idx, frame)
+            return frame
+
+        def _read_compact(self, path):
+            return self._read(path, compact=True)
+
+        def fill_store(self, progress=None, cancel=None):
+            """Decode every frame missing from the frame store, so later sessions never touch rawpy."""
+            if self.store is None:
+                return
+            for idx, path in enumerate(self.images):
+                if cancel is not None and cancel.is_set():
+                    raise JobCancelled()
+                if idx not in self.store:
+                    try:
+                        self.store.put(idx, self._decode(path, compact=True))
+                    except Exception as e:
+                        logger.error(f"Failed to read image {path}: {e}")
+                if progress is not None:
+                    progress(idx + 1)
+            self.store.flush()
+
+        def _cache_key(self, path, preview_size=None):
+            return (path, os.stat(path).st_mtime_ns, tuple(sorted(self.decode_settings.items())), preview_size)
+
+        def get_frame(self, idx, preview_size=None):
+            """Decode a single frame, going through the LRU frame cache.
+
+            With preview_size=(width, height) the frame is decoded at half size and
+            downscaled to fit within preview_size, for fast interactive previews.
+            A frame already in the frame store is downscaled from the store instead.
+            """
+            path = self.images[idx]
+            key = self._cache_key(path, preview_size)
+            frame = self.cache.get(key)
+            if frame is None:
+                if preview_size is None:
+                    frame = self._read(path)
+                elif self.store is not None and idx in self.store:
+                    frame = fit_to_size(self.store.get(idx), preview_size)
+                else:
+                    frame = fit_to_size(self._decode(path, half_size=True), preview_size)
+                frame = self.cache.put(key, frame)
+            return frame
+
+        def get_window(self, frame_idx, radius, preview_size=None):
+            """Decode only the frames within radius of frame_idx.
+
+            Returns (frames, local_idx) where local_idx is the position of frame_idx in frames.
+            preview_size is passed on to get_frame.
+            """
+            logger.debug("Returning window of radius %d around frame %d, preview_size=%s", radius, frame_idx, preview_size)
+            if not HAS_RAWPY:
+                logger.warning("Cannot read images without rawpy")
+                return [], 0
+            if not self.images:
+                return [], 0
+            frame_idx = min(max(frame_idx, 0), len(self.images) - 1)
+            frames = []
+            local_idx = 0
+            for i in range(max(0, frame_idx - radius), min(len(self.images), frame_idx + radius + 1)):
+                if i == frame_idx:
+                    local_idx = len(frames)
+                    frames.append(self.get_frame(i, preview_size))
+                    continue
+                try:
+                    frames.append(self.get_frame(i, preview_size))
+                except Exception as e:
+                    logger.error(f"Failed to read image {self.images[i]}: {e}")
+            logger.debug("Cache holds %d frames (%d bytes), hits=%d, misses=%d", len(self.cache), self.cache.nbytes, self.cache.hits, self.cache.misses)
+            return frames, local_idx
+
         def get_images(self):
             logger.debug("Returning images from CinemaDNG")
             try:
@@ -57,10 +182,9 @@ try:
                     return []
                 # Read images using rawpy
                 images = []
-                for path in self.images:
+                for idx, path in enumerate(self.images):
                     try:
-                        img = rawpy.imread(path).postprocess(output_bps=16, no_auto_bright=True, use_camera_wb=True)
-                        images.append(img.astype(np.float32) / 65535.0)
+                        images.append(self.get_frame(idx))
                     except Exception as e:
                         logger.error(f"Failed to read image {path}: {e}")
                 logger.debug(f"Successfully read {len(images)} images")
@@ -69,40 +193,197 @@ try:
                 logger.error(f"Failed to read images: {e}")
                 raise
 
-        def denoise(self, frame_idx: int, frame_radius: int = 3, spatial_median: int = 0, align: bool = True, winsize: int = 15, iterations: int = 3, pyr_scale: float = 0.5, levels: int = 3, poly_n: int = 5, poly_sigma: float = 1.2):
-            logger.debug(f"Denoising frame {frame_idx} with frame_radius={frame_radius}, spatial_median={spatial_median}, align={align}, winsize={winsize}, iterations={iterations}, pyr_scale={pyr_scale}, levels={levels}, poly_n={poly_n}, poly_sigma={poly_sigma}")
+        def iter_images(self, paths=None):
+            """Yield decoded frames (of paths, default all) one at a time without caching them.
+
+            Used for export, where every frame is decoded exactly once and the
+            exporter keeps only its sliding window in memory. Frames come as
+            uint16 decoder data (see _read), which the exporter converts to its
+            window storage type.
+            """
+            if not HAS_RAWPY:
+                logger.warning("Cannot read images without rawpy")
+                return
+            for path in self.images if paths is None else paths:
+                try:
+                    frame = self._read(path, compact=True)
+                except Exception as e:
+                    # Dropping the frame would shift every later one onto the wrong output number
+                    raise ValueError(f"Failed to read image {path}: {e}") from e
+                yield frame
+
+        def denoise(self, frame_idx: int, frame_radius: int = 3, spatial_median: int = 0, align: bool = True, winsize: int = 15, iterations: int = 3, pyr_scale: float = 0.5, levels: int = 3, poly_n: int = 5, poly_sigma: float = 1.2, flow_scale: float = 1.0, align_backend: str = "farneback", merge: str = "mean", tile_mb=None, preview_size=None, cancel=None):
+            logger.debug("Denoising frame %d with frame_radius=%d, spatial_median=%d, align=%s, winsize=%d, iterations=%d, pyr_scale=%s, levels=%d, poly_n=%d, poly_sigma=%s, flow_scale=%s, align_backend=%s, merge=%s, tile_mb=%s", frame_idx, frame_radius, spatial_median, align, winsize, iterations, pyr_scale, levels, poly_n, poly_sigma, flow_scale, align_backend, merge, tile_mb)
             try:
-                images = self.get_images()  # Load with rawpy first
+                images, local_idx = self.get_window(frame_idx, frame_radius, preview_size)  # Decode only the frames we need
                 if not images:
                     logger.warning("No images loaded for denoising")
                     return None
-                denoiser = PreviewDenoiser()
-                orig, denoised = denoiser.preview(images, frame_idx, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma)
+                orig, denoised = self.previewer.preview(images, local_idx, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, flow_scale=flow_scale, align_backend=align_backend, merge=merge, tile_mb=tile_mb, cancel=cancel)
                 logger.info("Denoising completed")
                 return denoised
+            except JobCancelled:
+                raise
             except Exception as e:
                 logger.error(f"Denoising failed: {e}")
                 raise
 
-        def save_denoised(self, output_dir, frame_radius=3, spatial_median=0, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2):
-            logger.debug(f"Saving denoised images to {output_dir}")
+        def denoise_range(self, start, end, frame_radius=3, spatial_median=0, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, preview_size=None, cancel=None):
+            """Yield (frame_idx, denoised) for frames start..end-1 without writing them.
+
+            Frames go through get_frame (so preview_size works as in denoise) and a
+            DenoiseCore kept between calls, which shares its flows and buffers over
+            the whole range. Each denoised frame is only valid until the next one is
+            yielded; copy it to keep it.
+            """
+            start = max(0, start)
+            end = min(end, len(self.images))
+            first_frame = max(0, start - frame_radius)
+            self._range_core = core = reuse_core(self._range_core, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, reuse_flow=reuse_flow, refine_flow=refine_flow, flow_scale=flow_scale, align_backend=align_backend, initial_flow=initial_flow, merge=merge, tile_mb=tile_mb)
+
+            def frames():
+                for i in range(first_frame, min(len(self.images), end + frame_radius)):
+                    try:
+                        yield self.get_frame(i, preview_size)
+                    except Exception as e:
+                        logger.error(f"Failed to read image {self.images[i]}: {e}")
+
+            yield from core.denoise_range(frames(), start, end, first_frame, cancel)
+
+        def sweep(self, frame_idx, combinations, end=None, preview_size=None, progress=None, cancel=None):
+            """Denoise frame_idx (or frames frame_idx..end-1) with every parameter combination.
+
+            The frames within the largest radius are decoded once, through
+            get_frame (so preview_size works as in denoise), and each distinct
+            flow configuration aligns them once (see temporal_denoiser.sweep).
+            Returns the sweep records and the noisy input frames.
+            """
+            combinations = list(combinations)
+            radius = max(combination.get("frame_radius", SWEEP_DEFAULTS["frame_radius"]) for combination in combinations)
+            frame_idx = min(max(frame_idx, 0), len(self.images) - 1)
+            end = min(len(self.images), frame_idx + 1 if end is None else max(end, frame_idx + 1))
+            first_idx = max(0, frame_idx - radius)
+            images = [self.get_frame(i, preview_size) for i in range(first_idx, min(len(self.images), end + radius))]
+            records = sweep(images, range(frame_idx, end), combinations, first_idx, progress, cancel)
+            return records, images[frame_idx - first_idx:end - first_idx]
+
+        def save_denoised(self, output_dir, frame_radius=3, spatial_median=0, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32", output_format=None, workers=1, pipeline=False, memory_mb=None, progress=None, cancel=None, start=None, end=None, resume=True, resumed=None, profiler=None):
+            """Denoise the clip into output_dir.
+
+            output_format is a temporal_denoiser.writer format spec, e.g. "tiff"
+            (16-bit, the default when tifffile is available), "tiff:zstd", "png"
+            (8-bit), "png:1" or "npy".
+
+            start/end restrict the output to frames start..end-1 (for splitting a clip
+            across render nodes); only the frames within frame_radius of that range
+            are decoded.
+
+            Completed frames are logged in an ExportManifest in output_dir, one
+            per shard when start/end select part of the clip. With
+            resume=True, frames already rendered with the same parameters from the
+            same input files are skipped, and only the remaining runs of frames
+            (plus frame_radius neighbours on each side) are decoded and denoised.
+            resumed(skipped), if given, is called with the number of frames skipped
+            before any frame is rendered; progress(done) counts them as done.
+
+            tile_mb denoises each frame in tiles whose working set fits in about
+            that many megabytes (see DenoiseCore), for 6K/8K frames on machines with
+            little memory. It does not change the output.
+
+            A frame that cannot be decoded fails the export. The frames written
+            before it are recorded in the manifest, so a re-run after replacing
+            the file resumes from there.
+
+            window_dtype="uint16" holds the window of decoded frames at half the
+            memory with the same output; "float16" also halves it but rounds the
+            frames to half precision (see temporal_denoiser.frames).
+
+            memory_mb bounds the decoded frames a parallel export (workers other
+            than 1) holds in its chunks to about that many megabytes, by picking
+            the chunk size and the chunks in flight (see ParallelExporter).
+
+            profiler, a temporal_denoiser.profiling.Profiler, times every step of
+            the export (decode, flow, remap, merge, encode...) across all runs;
+            write it out with its write_json() or write_chrome_trace().
+            """
+            logger.debug(f"Saving denoised images to {output_dir} with {workers} workers, pipeline={pipeline}, start={start}, end={end}, resume={resume}")
             try:
-                images = self.get_images()  # Load with rawpy first
-                if not images:
+                if not HAS_RAWPY or not self.images:
                     logger.warning("No images loaded for saving")
                     return
                 os.makedirs(output_dir, exist_ok=True)
-                exporter = StreamExporter()
-                exporter.export(images, output_dir, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma)
-                if not HAS_TIFFFILE:
-                    logger.warning("Saved images as PNG due to missing tifffile")
+                if output_format is None:
+                    output_format = "tiff" if HAS_TIFFFILE else "png"
+                parse_format(output_format)  # Reject bad specs before rendering anything
+                start = 0 if start is None else max(0, start)
+                end = len(self.images) if end is None else min(end, len(self.images))
+                # Everything that changes the output; the choice of engine does not
+                params = dict(frame_radius=frame_radius, spatial_median=spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, reuse_flow=reuse_flow, refine_flow=refine_flow, flow_scale=flow_scale, align_backend=align_backend, initial_flow=initial_flow, merge=merge, decode_settings=self.decode_settings, format=output_format)
+                if window_dtype == "float16":
+                    params["window_dtype"] = window_dtype  # uint16 windows are exact for 16-bit decodes
+                # A shard logs to a manifest of its own, so shards sharing output_dir never write to the same file
+                manifest = ExportManifest(output_dir, params, shard=None if (start, end) == (0, len(self.images)) else (start, end))
+                lo = max(0, start - frame_radius)
+                fingerprints = {i: file_fingerprint(self.images[i]) for i in range(lo, min(len(self.images), end + frame_radius))}
+
+                def window_inputs(frame_idx):
+                    return [fingerprints[i] for i in range(max(0, frame_idx - frame_radius), min(len(self.images), frame_idx + frame_radius + 1))]
+
+                pending = [i for i in range(start, end) if not (resume and manifest.is_done(i, window_inputs(i)))]
+                skipped = (end - start) - len(pending)
+                if skipped:
+                    logger.info(f"Resuming export: {skipped} of {end - start} frames already done")
+                if resumed is not None:
+                    resumed(skipped)
+                # Contiguous runs of frames still to render
+                runs = []
+                for i in pending:
+                    if runs and runs[-1][1] == i:
+                        runs[-1][1] = i + 1
+                    else:
+                        runs.append([i, i + 1])
+
+                done = [skipped]
+
+                def run_progress(run_done):
+                    if progress is not None:
+                        progress(done[0] + run_done)
+
+                if progress is not None and skipped:
+                    progress(skipped)
+                for run_start, run_end in runs:
+                    self._export_range(output_dir, frame_radius, spatial_median, run_start, run_end, workers, pipeline, memory_mb, dict(align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, reuse_flow=reuse_flow, refine_flow=refine_flow, flow_scale=flow_scale, align_backend=align_backend, initial_flow=initial_flow, merge=merge, tile_mb=tile_mb, window_dtype=window_dtype, output_format=output_format, progress=run_progress, cancel=cancel, profiler=profiler, frame_done=lambda idx, path: manifest.record(idx, window_inputs(idx), path)))
+                    done[0] += run_end - run_start
+                if parse_format(output_format)[0] == "tiff":
+                    logger.info("Saved images as 16-bit TIFF")
+                elif parse_format(output_format)[0] == "npy":
+                    logger.info("Saved raw float32 frames as .npy")
+                elif not HAS_TIFFFILE:
+                    logger.warning("Saved images as 8-bit PNG due to missing tifffile")
                 else:
-                    logger.info("Saved images as DNG")
+                    logger.info("Saved images as 8-bit PNG")
                 logger.info(f"Denoised images saved to {output_dir}")
+            except JobCancelled:
+                raise
             except Exception as e:
                 logger.error(f"Failed to save denoised images: {e}")
                 raise
 
+        def _export_range(self, output_dir, frame_radius, spatial_median, start, end, workers, pipeline, memory_mb, options):
+            """Render frames start..end-1, decoding only them and their frame_radius neighbours."""
+            first_frame = max(0, start - frame_radius)
+            paths = self.images[first_frame:min(len(self.images), end + frame_radius)]
+            options = dict(options, first_frame=first_frame, start=start, end=end)
+            if pipeline:
+                # Decode, align, merge and encode run as concurrent stages; rawpy decoding happens on the decode workers
+                exporter = PipelineExporter()
+                exporter.export(paths, output_dir, frame_radius, spatial_median, decode=self._read_compact, **options)
+            else:
+                # workers > 1 (or None for all cores) splits the clip into chunks for a process pool
+                exporter = StreamExporter() if workers == 1 else ParallelExporter(workers, memory_mb=memory_mb)
+                # Stream frames through the exporter instead of decoding the whole clip up front
+                exporter.export(self.iter_images(paths), output_dir, frame_radius, spatial_median, **options)
+
 except Exception as e:
     logger.error(f"Failed to define CinemaDNG class: {e}")
     raise
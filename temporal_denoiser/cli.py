@@ -0,0 +1,281 @@
+"""Headless command-line entry point for batch rendering.
+
+    python -m temporal_denoiser denoise IN OUT [--radius 3] [--start 0 --end 100] ...
+    python -m temporal_denoiser batch MANIFEST.json [--continue-on-error]
+
+Re-running a command skips frames already recorded as done in the output
+directory's export manifest, so interrupted renders pick up where they left
+off (--no-resume renders everything again). --frame-store DIR keeps the
+decoded frames on disk, so re-rendering a clip with other settings skips the
+raw decode. --profile writes per-stage timings of the export to
+OUT/profile.json (and adds them to the summary); --trace also writes a Chrome
+trace of every step to OUT/profile.trace.json, for chrome://tracing or
+Perfetto.
+
+Nothing here imports Qt, so it runs on render nodes without a display. A JSON
+summary of every clip is written with --summary (use "-" for stdout). It
+counts the frames rendered and the frames the resume skipped separately; fps
+is rendered frames per second.
+
+A batch manifest is a JSON list of clips, or an object with "clips" and
+optional "defaults". Each clip has "input" and "output" plus any option using
+the long option names with underscores, e.g.
+{"input": "A001", "output": "out/A001", "radius": 5, "start": 0, "end": 500}.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from pathlib import Path
+from temporal_denoiser.flow import ALIGN_BACKENDS
+from temporal_denoiser.frames import FRAME_DTYPES
+from temporal_denoiser.merge import MERGE_KERNELS
+from temporal_denoiser.parallel import DEFAULT_CHUNK_SIZE
+from temporal_denoiser.profiling import Profiler
+from temporal_denoiser.writer import parse_format
+
+logger = logging.getLogger(__name__)
+
+# Exit codes for job schedulers
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_PARTIAL = 3
+
+# Clip options and their defaults, shared by the command line and batch manifests
+CLIP_OPTIONS = {
+    "radius": 3,
+    "median": 0,
+    "align": True,
+    "winsize": 15,
+    "iterations": 3,
+    "pyr_scale": 0.5,
+    "levels": 3,
+    "poly_n": 5,
+    "poly_sigma": 1.2,
+    "flow_scale": 1.0,
+    "align_backend": "farneback",
+    "initial_flow": False,
+    "merge": "mean",
+    "tile_mb": None,
+    "window_dtype": "float32",
+    "format": None,
+    "reuse_flow": False,
+    "refine_flow": False,
+    "workers": 1,
+    "pipeline": False,
+    "memory_mb": None,
+    "start": None,
+    "end": None,
+    "resume": True,
+    "frame_store": None,
+    "profile": False,
+    "trace": False,
+}
+
+
+def _output_format(spec):
+    try:
+        parse_format(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return spec
+
+
+def _add_clip_options(parser):
+    parser.add_argument("--radius", type=int, help="Temporal radius in frames (default 3)")
+    parser.add_argument("--median", type=int, help="Spatial median kernel size, 0 to disable")
+    parser.add_argument("--align", dest="align", action="store_true", default=None, help="Align frames with optical flow (default)")
+    parser.add_argument("--no-align", dest="align", action="store_false", help="Disable alignment")
+    parser.add_argument("--winsize", type=int)
+    parser.add_argument("--iterations", type=int)
+    parser.add_argument("--pyr-scale", type=float)
+    parser.add_argument("--levels", type=int)
+    parser.add_argument("--poly-n", type=int)
+    parser.add_argument("--poly-sigma", type=float)
+    parser.add_argument("--flow-scale", type=float, help="Estimate flow at this fraction of full resolution")
+    parser.add_argument("--align-backend", choices=ALIGN_BACKENDS, help="Motion estimator: farneback (default), DIS presets, global translation or homography, or auto")
+    parser.add_argument("--initial-flow", action="store_true", default=None, help="Warm-start each flow from the previous frame's (pairs well with fewer --iterations)")
+    parser.add_argument("--merge", choices=MERGE_KERNELS, help="Temporal merge kernel (default mean)")
+    parser.add_argument("--tile-mb", type=int, metavar="MB", help="Denoise in tiles whose working set fits in about MB megabytes, for 6K/8K frames (same output)")
+    parser.add_argument("--window-dtype", choices=FRAME_DTYPES, help="Storage of the decoded frames in the temporal window: float32 (default), uint16 (half the memory, same output) or float16 (half the memory, rounded)")
+    parser.add_argument("--format", type=_output_format, help="Output format[:compression][:level]: tiff (16-bit, default when tifffile is installed), tiff:zlib, tiff:zstd, tiff:lzw, png, png:LEVEL or npy")
+    parser.add_argument("--reuse-flow", action="store_true", default=None, help="Compose flows from adjacent frames")
+    parser.add_argument("--refine-flow", action="store_true", default=None)
+    parser.add_argument("--workers", type=int, help=f"Worker processes (default 1, 0 for all cores). Each worker takes a chunk of {DEFAULT_CHUNK_SIZE} frames plus 2 x radius frames of overlap, so the decoded frames held peak at about (workers + 1) x ({DEFAULT_CHUNK_SIZE} + 2 x radius) frames; see --memory-mb")
+    parser.add_argument("--memory-mb", type=int, metavar="MB", help="With --workers, pick the chunk size and the chunks in flight so the decoded frames held stay within about MB megabytes")
+    parser.add_argument("--pipeline", action="store_true", default=None, help="Use the pipelined export engine")
+    parser.add_argument("--start", type=int, help="First output frame (inclusive)")
+    parser.add_argument("--end", type=int, help="Last output frame (exclusive)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false", default=None, help="Re-render frames already listed as done in the output manifest")
+    parser.add_argument("--frame-store", metavar="DIR", help="Keep decoded frames in a memory-mapped store in DIR, so re-renders skip raw decoding")
+    parser.add_argument("--profile", action="store_true", default=None, help="Time every stage of the export and write OUT/profile.json")
+    parser.add_argument("--trace", action="store_true", default=None, help="Like --profile, and also write a Chrome trace to OUT/profile.trace.json")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m temporal_denoiser", description="Temporal denoiser for CinemaDNG sequences")
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("-v", "--verbose", action="count", default=0, help="-v for info, -vv for debug logging")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    denoise = subparsers.add_parser("denoise", parents=[common], help="Denoise one clip")
+    denoise.add_argument("input", help="DNG directory or file")
+    denoise.add_argument("output", help="Output directory")
+    _add_clip_options(denoise)
+    denoise.add_argument("--summary", help="Write a JSON summary to this file ('-' for stdout)")
+
+    batch = subparsers.add_parser("batch", parents=[common], help="Denoise every clip in a JSON manifest")
+    batch.add_argument("manifest")
+    batch.add_argument("--continue-on-error", action="store_true", help="Keep going after a clip fails")
+    batch.add_argument("--summary", help="Write a JSON summary to this file ('-' for stdout)")
+    return parser
+
+
+def _clip_from_args(args):
+    clip = {"input": args.input, "output": args.output}
+    for name in CLIP_OPTIONS:
+        value = getattr(args, name)
+        if value is not None:
+            clip[name] = value
+    return clip
+
+
+def _load_manifest(path):
+    with open(path) as f:
+        manifest = json.load(f)
+    if isinstance(manifest, list):
+        manifest = {"clips": manifest}
+    defaults = manifest.get("defaults", {})
+    clips = []
+    for entry in manifest["clips"]:
+        clip = dict(defaults, **entry)
+        unknown = set(clip) - set(CLIP_OPTIONS) - {"input", "output"}
+        if unknown or "input" not in clip or "output" not in clip:
+            raise ValueError(f"Invalid manifest entry {entry}: needs input and output, unknown keys {sorted(unknown)}")
+        clips.append(clip)
+    return clips
+
+
+def run_clip(clip):
+    """Denoise one clip and return its summary record."""
+    from temporal_denoiser.cinemadng import CinemaDNG, HAS_RAWPY
+
+    options = dict(CLIP_OPTIONS, **clip)
+    record = {"input": clip["input"], "output": clip["output"], "start": options["start"], "end": options["end"], "rendered": 0, "skipped": 0, "seconds": 0.0, "fps": 0.0}
+    started = time.perf_counter()
+    try:
+        if not HAS_RAWPY:
+            raise RuntimeError("rawpy is not available")
+        if not Path(clip["input"]).exists():
+            raise FileNotFoundError(f"Input not found: {clip['input']}")
+        cinemadng = CinemaDNG(clip["input"], store_dir=options["frame_store"])
+        if not cinemadng.images:
+            raise RuntimeError(f"No DNG frames found in {clip['input']}")
+
+        if cinemadng.sequence.gaps:
+            record["gaps"] = cinemadng.sequence.gaps
+
+        def resumed(skipped):
+            record["skipped"] = skipped
+
+        def progress(done):
+            # done includes the frames the resume skipped
+            record["rendered"] = done - record["skipped"]
+
+        profiler = Profiler(trace=options["trace"]) if options["profile"] or options["trace"] else None
+
+        cinemadng.save_denoised(
+            clip["output"],
+            frame_radius=options["radius"],
+            spatial_median=options["median"],
+            align=options["align"],
+            winsize=options["winsize"],
+            iterations=options["iterations"],
+            pyr_scale=options["pyr_scale"],
+            levels=options["levels"],
+            poly_n=options["poly_n"],
+            poly_sigma=options["poly_sigma"],
+            flow_scale=options["flow_scale"],
+            align_backend=options["align_backend"],
+            initial_flow=options["initial_flow"],
+            merge=options["merge"],
+            tile_mb=options["tile_mb"],
+            window_dtype=options["window_dtype"],
+            output_format=options["format"],
+            reuse_flow=options["reuse_flow"],
+            refine_flow=options["refine_flow"],
+            workers=options["workers"] or None,
+            pipeline=options["pipeline"],
+            memory_mb=options["memory_mb"],
+            start=options["start"],
+            end=options["end"],
+            resume=options["resume"],
+            resumed=resumed,
+            progress=progress,
+            profiler=profiler,
+        )
+        if profiler is not None:
+            output = Path(clip["output"])
+            record["profile"] = profiler.as_dict()
+            profiler.write_json(output / "profile.json")
+            if profiler.trace:
+                profiler.write_chrome_trace(output / "profile.trace.json")
+            logger.info("Profile of %s:\n%s", clip["input"], profiler.format_table())
+        if record["rendered"] + record["skipped"] == 0:
+            raise RuntimeError("No frames were written")
+        record["status"] = "ok"
+    except Exception as e:
+        logger.error(f"Clip {clip['input']} failed: {e}")
+        record["status"] = "failed"
+        record["error"] = str(e)
+    record["seconds"] = round(time.perf_counter() - started, 3)
+    if record["seconds"] > 0:
+        # Only rendered frames count towards the throughput
+        record["fps"] = round(record["rendered"] / record["seconds"], 3)
+    return record
+
+
+def _write_summary(summary, target):
+    text = json.dumps(summary, indent=2)
+    if target == "-":
+        print(text)
+    elif target:
+        with open(target, "w") as f:
+            f.write(text + "\n")
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    level = {0: logging.WARNING, 1: logging.INFO}.get(args.verbose, logging.DEBUG)
+    logging.basicConfig(level=level, format="%(asctime)s %(levelname)s %(name)s: %(message)s", stream=sys.stderr)
+
+    if args.command == "denoise":
+        clips = [_clip_from_args(args)]
+        continue_on_error = False
+    else:
+        try:
+            clips = _load_manifest(args.manifest)
+        except Exception as e:
+            parser.error(f"Cannot read manifest {args.manifest}: {e}")
+        continue_on_error = args.continue_on_error
+
+    records = []
+    for clip in clips:
+        record = run_clip(clip)
+        records.append(record)
+        if record["status"] != "ok" and not continue_on_error:
+            break
+
+    failed = sum(record["status"] != "ok" for record in records)
+    skipped = len(clips) - len(records)
+    if failed == 0 and skipped == 0:
+        status, code = "ok", EXIT_OK
+    elif failed + skipped < len(clips):
+        status, code = "partial", EXIT_PARTIAL
+    else:
+        status, code = "failed", EXIT_FAILED
+    _write_summary({"status": status, "clips": records, "skipped": skipped}, args.summary)
+    return code
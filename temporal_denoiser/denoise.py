@@ -2,90 +2,367 @@ import numpy as np
 import cv2
 import os  # Added missing import
 import logging
-from pathlib import Path
+from collections import deque
+from temporal_denoiser.flow import AlignmentContext, FlowCache
+from temporal_denoiser.frames import FRAME_DTYPES, to_storage
+from temporal_denoiser.profiling import NULL_PROFILER, timed
+from scipy.ndimage import median_filter
+from temporal_denoiser.merge import KERNEL_HALO, RunningMean, estimate_noise, make_merger
+from temporal_denoiser.writer import FrameWriter
 
 logger = logging.getLogger(__name__)
 
+def spatial_median_filter(denoised, spatial_median):
+    """Apply a spatial median of size spatial_median (0 disables it), keeping float precision."""
+    if spatial_median > 0:
+        if spatial_median in (3, 5):
+            # OpenCV only supports float input for these kernel sizes
+            denoised = cv2.medianBlur(denoised, spatial_median)
+        else:
+            size = (spatial_median, spatial_median, 1) if denoised.ndim == 3 else spatial_median
+            denoised = median_filter(denoised, size=size, mode="nearest")
+    return denoised
+
+class JobCancelled(Exception):
+    """Raised between frames when a job's cancel event has been set."""
+
+def check_cancelled(cancel):
+    # cancel is a threading.Event (or anything with is_set()) or None
+    if cancel is not None and cancel.is_set():
+        raise JobCancelled()
+
+def load_image(img, dtype="float32"):
+    """Return img (a file path or an array) as a frame of window storage type dtype, or None if it cannot be used.
+
+    Arrays are normalised by their dtype (see temporal_denoiser.frames): uint8
+    and uint16 data by their full-white value, float data is taken as already
+    normalised to 0..1.
+    """
+    if isinstance(img, str):
+        # If it's a file path, read it
+        loaded_img = cv2.imread(img)
+        if loaded_img is None:
+            logger.error(f"Failed to load image from path: {img}")
+            return None
+        # Convert BGR to RGB for consistency
+        return to_storage(cv2.cvtColor(loaded_img, cv2.COLOR_BGR2RGB), dtype)
+    # If it's already a numpy array, use it directly
+    if img is None:
+        logger.error("Received None image in images list")
+        return None
+    return to_storage(img, dtype)
+
+class DenoiseCore:
+    """Alignment, merging and spatial median for one set of denoise parameters.
+
+    The preview and every export engine denoise through a core. It keeps the
+    state that can be reused from frame to frame: the AlignmentContext, the
+    buffers of the merge kernel, the running sum of unaligned means and, with
+    reuse_flow, a FlowCache. denoise_frame() denoises a single frame of a window.
+    denoise_range() streams a sequence through a sliding window and shares that
+    state across the whole range. Denoised frames are buffers that the next call
+    overwrites unless out is given. A core is not thread-safe.
+
+    With tile_mb set, frames are denoised in tiles (bands of full-width rows)
+    whose working set fits in about tile_mb megabytes. Flow is still estimated
+    on whole frames at flow resolution, but the upscaled flow, the remap map,
+    the aligned frames, the merge buffers and the spatial median only ever
+    cover one tile plus the halo of rows the merge kernel and median read, and
+    each tile is written into a preallocated output frame. The result is
+    identical to whole-frame processing. The window of decoded input frames is
+    not part of the budget.
+
+    window_dtype is the storage type of the decoded frames held in the window
+    (see temporal_denoiser.frames.FRAME_DTYPES). uint16 and float16 halve the
+    window's memory; frames are promoted to float32 only as alignment and the
+    merge read them. 16-bit decodes stored as uint16 give exactly the float32
+    result, float16 rounds them to half precision.
+
+    Every step (decode, alignment, merge, median) is timed on the profiler
+    given to set_profiler (see temporal_denoiser.profiling).
+    """
+
+    def __init__(self, frame_radius, spatial_median=0, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32"):
+        self.frame_radius = frame_radius
+        self.spatial_median = spatial_median
+        self.align = align
+        self.flow_params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flow_scale, align_backend)
+        self.reuse_flow = reuse_flow
+        self.refine_flow = refine_flow
+        self.initial_flow = initial_flow
+        self.merge = merge
+        self.tile_mb = tile_mb
+        if window_dtype not in FRAME_DTYPES:
+            raise ValueError(f"Unknown window dtype {window_dtype!r}, expected one of {', '.join(FRAME_DTYPES)}")
+        self.window_dtype = window_dtype
+        # Cores with equal settings are interchangeable
+        self.settings = core_settings(frame_radius, spatial_median, align, winsize, iterations, pyr_scale, levels, poly_n, poly_sigma, reuse_flow, refine_flow, flow_scale, align_backend, initial_flow, merge, tile_mb, window_dtype)
+        self.alignment = AlignmentContext(*self.flow_params, initial_flow=initial_flow)
+        self.merger = make_merger(merge)
+        self.flows = None  # FlowCache of the last denoise_range, with reuse_flow
+        self.frames_loaded = 0  # Usable input frames seen by the last denoise_range
+        self._running = RunningMean()
+        self._tiles = {}  # Neighbour offset -> aligned tile buffer
+        self._tiled_out = None
+        self._tile_warned = False
+        self.profiler = NULL_PROFILER
+
+    def set_profiler(self, profiler):
+        """Time this core's steps, and those of its alignment and flow caches, on profiler (None stops profiling)."""
+        self.profiler = profiler or NULL_PROFILER
+        self.alignment.profiler = self.profiler
+
+    def new_alignment(self):
+        """A separate AlignmentContext with this core's parameters, for another thread."""
+        context = AlignmentContext(*self.flow_params, initial_flow=self.initial_flow)
+        context.profiler = self.profiler
+        return context
+
+    def new_flow_cache(self):
+        """A FlowCache for these parameters, or None unless aligning with reuse_flow."""
+        if self.align and self.reuse_flow:
+            # Tiles upscale only the rows of each flow they need
+            flows = FlowCache(*self.flow_params, refine=self.refine_flow, full_resolution=self.tile_mb is None)
+            flows.profiler = self.profiler
+            return flows
+        return None
+
+    def align_window(self, window, first_idx, frame_idx, flows=None, context=None, reuse=True, check=None):
+        """Return the frames within frame_radius of frame_idx, aligned to it if align is set.
+
+        window[0] is frame first_idx. flows may be any object with a
+        flow(src, dst) method (e.g. a FlowCache); without it each flow is
+        estimated directly. context is the AlignmentContext to align with
+        (default: this core's); with reuse=True the aligned frames are its
+        buffers and are only valid until the next call. check is passed on to
+        AlignmentContext.align.
+        """
+        ref_idx = frame_idx - first_idx
+        start_idx = max(0, ref_idx - self.frame_radius)
+        end_idx = min(len(window), ref_idx + self.frame_radius + 1)
+
+        if self.align and end_idx - start_idx > 1:
+            if context is None:
+                context = self.alignment
+            return context.align(window, ref_idx, start_idx, end_idx, first_idx, flows, reuse, check)
+        return [window[i] for i in range(start_idx, end_idx)]
+
+    def merge_frames(self, frames, ref=0, merger=None, out=None):
+        """Merge the aligned frames with the merge kernel and apply the spatial median.
+
+        ref is the position of the reference frame in frames. Callers merging on
+        several threads pass their own merger, and out if the result must not be
+        reused.
+        """
+        with self.profiler.stage("merge"):
+            denoised = (merger or self.merger).merge(frames, ref, out=out)
+        return self._median(denoised)
+
+    def _median(self, denoised):
+        if self.spatial_median <= 0:
+            return denoised
+        with self.profiler.stage("median"):
+            return spatial_median_filter(denoised, self.spatial_median)
+
+    def denoise_frame(self, window, frame_idx=None, first_idx=0, flows=None, cancel=None, out=None):
+        """Denoise frame frame_idx (default: the middle one) from window, whose first element is frame first_idx.
+
+        Only the frames within frame_radius of frame_idx are used. The cancel
+        event is checked before each neighbour is aligned.
+        """
+        if frame_idx is None:
+            frame_idx = first_idx + len(window) // 2
+        check_cancelled(cancel)
+        check = (lambda: check_cancelled(cancel)) if cancel is not None else None
+        if self.tile_mb is not None:
+            return self._denoise_tiled(window, first_idx, frame_idx, flows, check, out)
+        frames = self.align_window(window, first_idx, frame_idx, flows, check=check)
+        return self.merge_frames(frames, frame_idx - max(first_idx, frame_idx - self.frame_radius), out=out)
+
+    def tile_rows(self, h, w, channels, frames):
+        """Rows per tile (without the halo) for frames of h x w x channels and a window of frames frames.
+
+        The budget first pays for what every tile shares (the output frame and,
+        when aligning, the flows and grayscale proxies at flow resolution), then
+        for as many rows of per-tile buffers as fit. A budget too small for the
+        shared part gets one-row tiles.
+        """
+        px = 4 * channels
+        fixed = h * w * px
+        if self.align and frames > 1:
+            flow_pixels = max(1, int(round(h * self.flow_params[6]))) * max(1, int(round(w * self.flow_params[6])))
+            fixed += (frames - 1) * flow_pixels * 8 + frames * flow_pixels + h * w
+        available = self.tile_mb * 2**20 - fixed
+        if available <= 0 and not self._tile_warned:
+            self._tile_warned = True
+            logger.warning(f"A tile budget of {self.tile_mb} MB does not cover the {fixed / 2**20:.0f} MB every tile of a {w}x{h} frame needs; using one-row tiles")
+        # Aligned neighbours, plus the flow band, its temporaries and the remap map
+        per_pixel = px * (frames - 1) + 48
+        if self.merge == "mean":
+            per_pixel += 3 * px  # float64 accumulator and float32 result
+        elif self.merge in ("trimmed", "median"):
+            per_pixel += px * (frames + 2)  # Stack of the window, sort temporary and result
+        else:
+            per_pixel += 5 * px + 16  # Weighted sums and difference-energy temporaries
+        if self.spatial_median > 0:
+            per_pixel += px
+        if self.window_dtype != "float32":
+            per_pixel += 2 * px  # Source rows and reference tile promoted to float32
+        rows = int(max(0, available) // (per_pixel * w)) - 2 * self._halo()
+        return min(h, max(1, rows))
+
+    def _halo(self):
+        return KERNEL_HALO.get(self.merge, 0) + self.spatial_median // 2
+
+    def _denoise_tiled(self, window, first_idx, frame_idx, flows, check, out):
+        ref_idx = frame_idx - first_idx
+        start_idx = max(0, ref_idx - self.frame_radius)
+        end_idx = min(len(window), ref_idx + self.frame_radius + 1)
+        ref = window[ref_idx]
+        h, w = ref.shape[:2]
+        rows = self.tile_rows(h, w, ref.shape[2] if ref.ndim == 3 else 1, end_idx - start_idx)
+        halo = self._halo()
+        # Every tile is read with the same height, shifted inwards at the frame edges, so buffers never change shape
+        height = min(h, rows + 2 * halo)
+        context = self.alignment
+        context.band_rows = height
+        estimated = {}
+        if self.align and end_idx - start_idx > 1:
+            estimated = dict(context.estimate_window(window, ref_idx, start_idx, end_idx, first_idx, flows, check))
+        # The noise level of the whole reference frame, not of each tile
+        noise_sigma = estimate_noise(ref) if self.merge in KERNEL_HALO else None
+        if out is None:
+            if self._tiled_out is None or self._tiled_out.shape != ref.shape:
+                self._tiled_out = np.empty(ref.shape, dtype=np.float32)
+            out = self._tiled_out
+        band_shape = (height,) + ref.shape[1:]
+        for top in range(0, h, rows):
+            bottom = min(h, top + rows)
+            lo = max(0, min(top - halo, h - height))
+            frames = []
+            for i in range(start_idx, end_idx):
+                if i not in estimated:
+                    frames.append(window[i][lo:lo + height])
+                    continue
+                buffer = self._tiles.get(i - ref_idx)
+                if buffer is None or buffer.shape != band_shape:
+                    buffer = self._tiles[i - ref_idx] = np.empty(band_shape, dtype=np.float32)
+                frames.append(context.warp_rows(window[i], estimated[i], lo, lo + height, buffer))
+            with self.profiler.stage("merge"):
+                merged = self.merger.merge(frames, ref_idx - start_idx, noise_sigma=noise_sigma)
+            merged = self._median(merged)
+            out[top:bottom] = merged[top - lo:bottom - lo]
+        return out
+
+    def denoise_range(self, images, start=None, end=None, first_frame=0, cancel=None):
+        """Denoise frames start..end-1 of a sequence, yielding (frame_idx, denoised) in order.
+
+        images may be any iterable of file paths or arrays, including a
+        generator, whose first element is frame first_frame. Frames are decoded
+        once as they are consumed and only a sliding window of
+        2 * frame_radius + 1 frames is held in memory at a time. Frames outside
+        start..end-1 only serve as temporal neighbours, which lets a range be a
+        shard or chunk of a longer clip. Unaligned mean windows share a running
+        sum and aligned windows share the flow cache. Each denoised frame is
+        only valid until the next one is yielded. The cancel event is checked
+        between frames. A frame that cannot be loaded raises ValueError; the
+        frames yielded before it never have it in their window.
+        """
+        radius = self.frame_radius
+        flows = self.flows = self.new_flow_cache()
+        self._running = RunningMean()
+        self.frames_loaded = 0
+        window = deque()  # Decoded frames first_idx .. first_idx + len(window) - 1
+        first_idx = first_frame
+        frame_idx = first_frame  # Next frame to denoise
+        start = first_frame if start is None else start
+
+        def wanted(frame_idx):
+            return frame_idx >= start and (end is None or frame_idx < end)
+
+        # Decoding happens as the images iterable (typically a generator) is advanced
+        for img in timed(images, self.profiler, "decode"):
+            with self.profiler.stage("convert"):
+                frame = load_image(img, self.window_dtype)
+            if frame is None:
+                # Skipping it would shift every later frame onto the wrong number
+                raise ValueError(f"Frame {first_idx + len(window)} cannot be loaded")
+            self.frames_loaded += 1
+            window.append(frame)
+            if flows is not None:
+                flows.add_frame(first_idx + len(window) - 1, frame)
+            # Denoise every frame whose neighbours are all buffered
+            while frame_idx + radius < first_idx + len(window):
+                if wanted(frame_idx):
+                    yield frame_idx, self._range_frame(window, first_idx, frame_idx, flows, cancel)
+                frame_idx += 1
+                # Evict frames that have left the window
+                while first_idx < frame_idx - radius:
+                    window.popleft()
+                    first_idx += 1
+                if flows is not None:
+                    flows.evict_before(first_idx)
+
+        # Flush the tail of the sequence
+        while frame_idx < first_idx + len(window):
+            if wanted(frame_idx):
+                yield frame_idx, self._range_frame(window, first_idx, frame_idx, flows, cancel)
+            frame_idx += 1
+
+    def _range_frame(self, window, first_idx, frame_idx, flows, cancel):
+        check_cancelled(cancel)
+        if not self.align and self.merge == "mean" and self.tile_mb is None:
+            # Without alignment consecutive windows share frames, so keep a running sum
+            lo = max(first_idx, frame_idx - self.frame_radius)
+            hi = min(first_idx + len(window), frame_idx + self.frame_radius + 1)
+            with self.profiler.stage("merge"):
+                mean = self._running.mean(window, first_idx, lo, hi)
+            return self._median(mean)
+        return self.denoise_frame(window, frame_idx, first_idx, flows)
+
+def core_settings(frame_radius, spatial_median=0, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32"):
+    """The settings tuple of DenoiseCore with these arguments, without building its estimators."""
+    return (frame_radius, spatial_median, align, (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flow_scale, align_backend), reuse_flow, refine_flow, initial_flow, merge, tile_mb, window_dtype)
+
+
+def reuse_core(core, *args, **kwargs):
+    """Return core if it was built with the same parameters as DenoiseCore(*args, **kwargs), else a new core."""
+    if core is not None and core.settings == core_settings(*args, **kwargs):
+        return core
+    return DenoiseCore(*args, **kwargs)
+
 class PreviewDenoiser:
-    def preview(self, images, frame_idx, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2):
-        logger.debug(f"Preview denoising frame {frame_idx} with radius {frame_radius}, align={align}, winsize={winsize}, iterations={iterations}, pyr_scale={pyr_scale}, levels={levels}, poly_n={poly_n}, poly_sigma={poly_sigma}")
+    def __init__(self):
+        # Kept between previews so their buffers are reused while the parameters stay the same
+        self.core = None
+
+    def preview(self, images, frame_idx, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, flow_scale=1.0, align_backend="farneback", merge="mean", tile_mb=None, cancel=None):
+        logger.debug("Preview denoising frame %d with radius %d, align=%s, winsize=%d, iterations=%d, pyr_scale=%s, levels=%d, poly_n=%d, poly_sigma=%s, flow_scale=%s, align_backend=%s, merge=%s, tile_mb=%s", frame_idx, frame_radius, align, winsize, iterations, pyr_scale, levels, poly_n, poly_sigma, flow_scale, align_backend, merge, tile_mb)
         try:
             # Handle both file paths and numpy arrays
             processed_images = []
             for img in images:
-                if isinstance(img, str):
-                    # If it's a file path, read it
-                    loaded_img = cv2.imread(img)
-                    if loaded_img is None:
-                        logger.error(f"Failed to load image from path: {img}")
-                        return None, None
-                    # Convert BGR to RGB for consistency
-                    loaded_img = cv2.cvtColor(loaded_img, cv2.COLOR_BGR2RGB)
-                    processed_images.append(loaded_img.astype(np.float32) / 255.0 if loaded_img.max() > 1.0 else loaded_img.astype(np.float32))
-                else:
-                    # If it's already a numpy array, use it directly
-                    if img is None:
-                        logger.error("Received None image in images list")
-                        return None, None
-                    # Ensure it's float32 and normalized
-                    if img.max() > 1.0:
-                        processed_images.append(img.astype(np.float32) / 255.0)
-                    else:
-                        processed_images.append(img.astype(np.float32))
+                frame = load_image(img)
+                if frame is None:
+                    return None, None
+                processed_images.append(frame)
             
             if not processed_images:
                 logger.warning("No valid images provided for denoising")
                 return None, None
             
-            # Clamp frame_idx to valid range
-            frame_idx = min(max(frame_idx, frame_radius), len(processed_images) - frame_radius - 1)
+            # frame_idx is the reference frame's position in images, whose window may be cut short at the clip edges
+            frame_idx = min(max(frame_idx, 0), len(processed_images) - 1)
             orig = processed_images[frame_idx]
             
-            if align and len(processed_images) > 1:
-                aligned = []
-                # Convert reference frame to grayscale for optical flow
-                orig_gray = cv2.cvtColor((orig * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
-                
-                for i in range(max(0, frame_idx - frame_radius), min(len(processed_images), frame_idx + frame_radius + 1)):
-                    if i != frame_idx:
-                        # Convert current frame to grayscale for optical flow
-                        curr_gray = cv2.cvtColor((processed_images[i] * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
-                        
-                        # Calculate optical flow with fine-tuning parameters
-                        flow = cv2.calcOpticalFlowFarneback(
-                            orig_gray, curr_gray,
-                            None, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0
-                        )
-                        
-                        # Create coordinate grids for remapping
-                        h, w = flow.shape[:2]
-                        flow = -flow
-                        flow[:, :, 0] += np.arange(w)
-                        flow[:, :, 1] += np.arange(h)[:, np.newaxis]
-                        
-                        # Apply alignment to the original float image
-                        aligned_img = cv2.remap(processed_images[i], flow, None, cv2.INTER_LINEAR)
-                        aligned.append(aligned_img)
-                    else:
-                        aligned.append(orig)
-                processed_images = aligned
-            else:
-                # Use subset of images around target frame
-                start_idx = max(0, frame_idx - frame_radius)
-                end_idx = min(len(processed_images), frame_idx + frame_radius + 1)
-                processed_images = processed_images[start_idx:end_idx]
-            
-            # Average the frames for denoising
-            denoised = np.mean(processed_images, axis=0)
-            
-            # Apply spatial median filter if requested
-            if spatial_median > 0:
-                # Convert to uint8 for median filter, then back to float
-                denoised_uint8 = (denoised * 255).astype(np.uint8)
-                denoised_uint8 = cv2.medianBlur(denoised_uint8, spatial_median)
-                denoised = denoised_uint8.astype(np.float32) / 255.0
+            self.core = reuse_core(self.core, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, flow_scale=flow_scale, align_backend=align_backend, merge=merge, tile_mb=tile_mb)
+            # The preview is displayed while the next one is computed, so it gets its own buffer
+            denoised = self.core.denoise_frame(processed_images, frame_idx, cancel=cancel, out=np.empty_like(orig))
             
             return orig, denoised
+        except JobCancelled:
+            logger.debug("Preview of frame %d cancelled", frame_idx)
+            raise
         except Exception as e:
             logger.error(f"Preview denoising failed: {e}")
             import traceback
@@ -93,100 +370,93 @@ class PreviewDenoiser:
             raise
 
 class StreamExporter:
-    def export(self, images, output_dir, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2):
-        logger.debug(f"Exporting denoised images to {output_dir} with radius {frame_radius}, align={align}, winsize={winsize}, iterations={iterations}, pyr_scale={pyr_scale}, levels={levels}, poly_n={poly_n}, poly_sigma={poly_sigma}")
+    def __init__(self, writers=2, write_queue=4):
+        # Encoding and file writes run on a FrameWriter pool of this many threads
+        self.writers = writers
+        self.write_queue = write_queue
+        self.write_stats = None
+        # DenoiseCore of the last export, reused by the next one while the parameters stay the same
+        self.core = None
+
+    def export(self, images, output_dir, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32", output_format="png", progress=None, cancel=None, first_frame=0, start=None, end=None, frame_done=None, profiler=None):
+        """Denoise a sequence and write one image per frame to output_dir.
+
+        output_format is a temporal_denoiser.writer format spec such as "png",
+        "tiff" (16-bit), "tiff:zstd" or "npy". Frames are encoded and written on
+        a pool of writer threads while the next frames are denoised; per-frame
+        encode timings are in self.write_stats afterwards.
+
+        images may be any iterable of file paths or arrays, including a generator.
+        Frames are decoded once as they are consumed and only a sliding window of
+        2 * frame_radius + 1 frames is held in memory at a time (see
+        DenoiseCore.denoise_range).
+
+        align_backend names the flow estimator (see
+        temporal_denoiser.flow.ALIGN_BACKENDS): Farneback, DIS presets, a global
+        translation or homography for locked-off and stabilised shots, or auto.
+
+        With reuse_flow=True, alignment uses a FlowCache: one flow estimate per
+        frame between adjacent frames, with longer-range flows composed from those
+        (and re-estimated from the composed guess if refine_flow=True).
+
+        flow_scale < 1 estimates flow on a downscaled luma proxy; the motion field
+        is upscaled before the full-resolution frames are remapped. With
+        initial_flow=True each flow is warm-started from the flow at the same
+        offset for the previous frame (see AlignmentContext).
+
+        merge names the kernel that combines the aligned window (see
+        temporal_denoiser.merge.MERGE_KERNELS); the robust kernels suppress
+        ghosting where alignment fails, at some cost in throughput.
+
+        tile_mb bounds the per-frame working set by denoising in tiles (see
+        DenoiseCore); the output does not change. window_dtype="uint16" or
+        "float16" holds the window of decoded frames at half the memory (see
+        DenoiseCore); uint16 keeps 16-bit decodes exact.
+
+        progress(frames_done) is called after every written frame, and the cancel
+        event is checked between frames; JobCancelled is raised once it is set.
+        frame_done(frame_idx, output_path), if given, is called for each frame
+        whose file was written successfully (used by the resume manifest).
+        A frame that cannot be decoded stops the export with an error, after
+        the frames before it that do not need it as a neighbour.
+        profiler, a temporal_denoiser.profiling.Profiler, times every step
+        from decode to file write.
+
+        For sharded renders, images may be a slice of a longer clip whose first
+        element is frame first_frame; only frames start..end-1 are written, the
+        rest only serve as temporal neighbours.
+        """
+        logger.debug(f"Exporting denoised images to {output_dir} with radius {frame_radius}, align={align}, winsize={winsize}, iterations={iterations}, pyr_scale={pyr_scale}, levels={levels}, poly_n={poly_n}, poly_sigma={poly_sigma}, reuse_flow={reuse_flow}, refine_flow={refine_flow}, flow_scale={flow_scale}, align_backend={align_backend}, initial_flow={initial_flow}, merge={merge}, tile_mb={tile_mb}, window_dtype={window_dtype}, output_format={output_format}")
+        writer = FrameWriter(output_dir, output_format, self.writers, self.write_queue, progress, frame_done, profiler)
+        self.write_stats = writer.stats
         try:
-            # Handle both file paths and numpy arrays
-            processed_images = []
-            for img in images:
-                if isinstance(img, str):
-                    # If it's a file path, read it
-                    loaded_img = cv2.imread(img)
-                    if loaded_img is None:
-                        logger.error(f"Failed to load image from path: {img}")
-                        continue
-                    # Convert BGR to RGB for consistency
-                    loaded_img = cv2.cvtColor(loaded_img, cv2.COLOR_BGR2RGB)
-                    processed_images.append(loaded_img.astype(np.float32) / 255.0 if loaded_img.max() > 1.0 else loaded_img.astype(np.float32))
-                else:
-                    # If it's already a numpy array, use it directly
-                    if img is None:
-                        logger.error("Received None image in images list")
-                        continue
-                    # Ensure it's float32 and normalized
-                    if img.max() > 1.0:
-                        processed_images.append(img.astype(np.float32) / 255.0)
-                    else:
-                        processed_images.append(img.astype(np.float32))
-            
-            if not processed_images:
+            core = self.core = reuse_core(self.core, frame_radius, spatial_median, align=align, winsize=winsize, iterations=iterations, pyr_scale=pyr_scale, levels=levels, poly_n=poly_n, poly_sigma=poly_sigma, reuse_flow=reuse_flow, refine_flow=refine_flow, flow_scale=flow_scale, align_backend=align_backend, initial_flow=initial_flow, merge=merge, tile_mb=tile_mb, window_dtype=window_dtype)
+            core.set_profiler(profiler)
+            os.makedirs(output_dir, exist_ok=True)
+            for frame_idx, denoised in core.denoise_range(images, start, end, first_frame, cancel):
+                writer.submit(frame_idx, denoised)
+
+            if not core.frames_loaded:
+                writer.close()
                 logger.warning("No valid images to export")
                 return
-            
-            os.makedirs(output_dir, exist_ok=True)
-            
-            # Process each frame
-            for frame_idx in range(len(processed_images)):
-                start_idx = max(0, frame_idx - frame_radius)
-                end_idx = min(len(processed_images), frame_idx + frame_radius + 1)
-                
-                if align and end_idx - start_idx > 1:
-                    aligned = []
-                    orig = processed_images[frame_idx]
-                    # Convert reference frame to grayscale for optical flow
-                    orig_gray = cv2.cvtColor((orig * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
-                    
-                    for i in range(start_idx, end_idx):
-                        if i != frame_idx:
-                            # Convert current frame to grayscale for optical flow
-                            curr_gray = cv2.cvtColor((processed_images[i] * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
-                            
-                            # Calculate optical flow with fine-tuning parameters
-                            flow = cv2.calcOpticalFlowFarneback(
-                                orig_gray, curr_gray,
-                                None, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, 0
-                            )
-                            
-                            # Create coordinate grids for remapping
-                            h, w = flow.shape[:2]
-                            flow = -flow
-                            flow[:, :, 0] += np.arange(w)
-                            flow[:, :, 1] += np.arange(h)[:, np.newaxis]
-                            
-                            # Apply alignment to the original float image
-                            aligned_img = cv2.remap(processed_images[i], flow, None, cv2.INTER_LINEAR)
-                            aligned.append(aligned_img)
-                        else:
-                            aligned.append(orig)
-                    frame_images = aligned
-                else:
-                    frame_images = processed_images[start_idx:end_idx]
-                
-                # Average the frames for denoising
-                denoised = np.mean(frame_images, axis=0)
-                
-                # Apply spatial median filter if requested
-                if spatial_median > 0:
-                    # Convert to uint8 for median filter, then back to float
-                    denoised_uint8 = (denoised * 255).astype(np.uint8)
-                    denoised_uint8 = cv2.medianBlur(denoised_uint8, spatial_median)
-                    denoised = denoised_uint8.astype(np.float32) / 255.0
-                
-                # Save the denoised frame
-                output_path = os.path.join(output_dir, f"denoised_{frame_idx:06d}.png")
-                # Convert back to BGR for OpenCV saving
-                denoised_bgr = cv2.cvtColor((denoised * 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
-                success = cv2.imwrite(output_path, denoised_bgr)
-                
-                if not success:
-                    logger.error(f"Failed to write image: {output_path}")
-                else:
-                    logger.debug(f"Saved denoised frame {frame_idx} to {output_path}")
-            
-            logger.info(f"Exported {len(processed_images)} denoised images to {output_dir}")
+
+            writer.close()
+            if core.flows is not None:
+                logger.debug(f"Computed {core.flows.flow_calls} {align_backend} flows for {writer.written} frames")
+            elif align:
+                logger.debug(f"Aligned with {core.alignment.flow_calls} {align_backend} flows and {core.alignment.luma_conversions} grayscale conversions so far")
+                if align_backend == "auto":
+                    logger.info(f"Automatic alignment picked: {core.alignment.estimator.choices}")
+            logger.info(f"Exported {writer.written} denoised images to {output_dir}")
+        except JobCancelled:
+            # Frames already handed to the writer are finished, so they count as done when resuming
+            writer.close(check=False)
+            logger.info(f"Export to {output_dir} cancelled")
+            raise
         except Exception as e:
+            writer.close(check=False)
             logger.error(f"Export failed: {e}")
             import traceback
             logger.debug(f"Full traceback: {traceback.format_exc()}")
             raise
-
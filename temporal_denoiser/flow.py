@@ -0,0 +1,555 @@
+import numpy as np
+import cv2
+import logging
+from temporal_denoiser.frames import to_float32
+from temporal_denoiser.merge import estimate_noise
+from temporal_denoiser.profiling import NULL_PROFILER
+
+logger = logging.getLogger(__name__)
+
+_grids = {}
+
+
+def coordinate_grid(h, w):
+    """Return the (h, w, 2) float32 pixel coordinate grid used to turn flows into remap maps."""
+    grid = _grids.get((h, w))
+    if grid is None:
+        grid = np.empty((h, w, 2), dtype=np.float32)
+        grid[:, :, 0] = np.arange(w, dtype=np.float32)
+        grid[:, :, 1] = np.arange(h, dtype=np.float32)[:, np.newaxis]
+        grid.flags.writeable = False
+        _grids[(h, w)] = grid
+    return grid
+
+
+def to_gray(img, flow_scale=1.0):
+    """Convert a normalised float RGB frame to the uint8 grayscale used for optical flow.
+
+    With flow_scale < 1 the result is a downscaled luma proxy for estimating flow
+    at reduced resolution.
+    """
+    gray = cv2.cvtColor((img * 255).astype(np.uint8), cv2.COLOR_RGB2GRAY)
+    if flow_scale != 1.0:
+        h, w = gray.shape
+        size = (max(1, int(round(w * flow_scale))), max(1, int(round(h * flow_scale))))
+        gray = cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+    return gray
+
+
+def upscale_flow(flow, h, w):
+    """Resize a flow field estimated on a proxy to h x w, rescaling the vectors to match."""
+    ph, pw = flow.shape[:2]
+    if (ph, pw) == (h, w):
+        return flow
+    flow = cv2.resize(flow, (w, h), interpolation=cv2.INTER_LINEAR)
+    flow[:, :, 0] *= w / pw
+    flow[:, :, 1] *= h / ph
+    return flow
+
+
+def upscale_flow_rows(flow, h, w, top, bottom, out=None):
+    """Rows top..bottom-1 of upscale_flow(flow, h, w), bit for bit, without upscaling the whole field.
+
+    Follows cv2.resize's bilinear sampling: the flow rows needed are resized to
+    full width (a same-height resize passes rows through unchanged), then each
+    output row blends its two source rows with the same float32 weights.
+    """
+    ph, pw = flow.shape[:2]
+    if (ph, pw) == (h, w):
+        return flow[top:bottom]
+    fy = ((np.arange(top, bottom) + 0.5) * (1.0 / (h / ph)) - 0.5).astype(np.float32)
+    base = np.floor(fy)
+    beta = (fy - base)[:, np.newaxis, np.newaxis]
+    base = base.astype(np.intp)
+    first = min(max(base[0], 0), ph - 1)
+    last = min(max(base[-1] + 1, 0), ph - 1)
+    rows = cv2.resize(flow[first:last + 1], (w, last - first + 1), interpolation=cv2.INTER_LINEAR)
+    out = np.multiply(rows[np.clip(base, 0, ph - 1) - first], np.float32(1) - beta, out=out)
+    out += rows[np.clip(base + 1, 0, ph - 1) - first] * beta
+    out[:, :, 0] *= w / pw
+    out[:, :, 1] *= h / ph
+    return out
+
+
+def flow_to_map(flow):
+    """Turn the flow from a reference frame to a neighbour into a cv2.remap map.
+
+    Sampling the neighbour at x + flow(x) brings it into register with the reference.
+    """
+    h, w = flow.shape[:2]
+    return coordinate_grid(h, w) + flow
+
+
+def compose_flows(first, second):
+    """Combine flow a->b (first) and flow b->c (second) into flow a->c."""
+    h, w = first.shape[:2]
+    warped = cv2.remap(second, coordinate_grid(h, w) + first, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return first + warped
+
+
+def invert_flow(flow, iterations=5):
+    """Approximate the inverse of a flow field by fixed-point iteration."""
+    h, w = flow.shape[:2]
+    grid = coordinate_grid(h, w)
+    inverse = -flow
+    for _ in range(iterations):
+        inverse = -cv2.remap(flow, grid + inverse, None, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+    return inverse
+
+
+def _flow_buffer(flow, shape):
+    if flow is None or flow.shape != shape + (2,):
+        return np.empty(shape + (2,), dtype=np.float32)
+    return flow
+
+
+class FarnebackFlow:
+    """Dense flow with cv2.calcOpticalFlowFarneback; the default backend."""
+
+    name = "farneback"
+
+    def __init__(self, pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2):
+        self.params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        """Return the flow from grayscale ref to cur (cur sampled at x + flow(x) matches ref(x)).
+
+        flow, if given, is used as the output buffer and, with initial=True, as the starting guess.
+        """
+        flags = cv2.OPTFLOW_USE_INITIAL_FLOW if initial and flow is not None else 0
+        return cv2.calcOpticalFlowFarneback(ref, cur, flow, *self.params, flags)
+
+
+class DISFlow:
+    """Dense inverse search optical flow, several times faster than Farneback at similar quality."""
+
+    PRESETS = {"ultrafast": cv2.DISOPTICAL_FLOW_PRESET_ULTRAFAST, "fast": cv2.DISOPTICAL_FLOW_PRESET_FAST, "medium": cv2.DISOPTICAL_FLOW_PRESET_MEDIUM}
+
+    def __init__(self, preset="fast"):
+        self.name = f"dis-{preset}"
+        self._dis = cv2.DISOpticalFlow_create(self.PRESETS[preset])
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        # DIS makes its own coarse-to-fine estimate and takes no initial guess; it may read
+        # whatever is in an output buffer it is given, so let it allocate and copy the result
+        result = self._dis.calc(ref, cur, None)
+        if flow is None or flow.shape != result.shape:
+            return result
+        np.copyto(flow, result)
+        return flow
+
+
+class TranslationFlow:
+    """Global translation from phase correlation, for locked-off and stabilised shots."""
+
+    name = "translation"
+
+    def __init__(self):
+        self._window = None
+
+    def shift(self, ref, cur):
+        if self._window is None or self._window.shape != ref.shape:
+            self._window = cv2.createHanningWindow(ref.shape[::-1], cv2.CV_32F)
+        (dx, dy), _ = cv2.phaseCorrelate(ref.astype(np.float32), cur.astype(np.float32), self._window)
+        return dx, dy
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        dx, dy = self.shift(ref, cur)
+        flow = _flow_buffer(flow, ref.shape)
+        flow[:, :, 0] = dx
+        flow[:, :, 1] = dy
+        return flow
+
+
+class HomographyFlow:
+    """Global homography from ORB feature matches, for camera rotation over a static scene.
+
+    Falls back to a global translation when too few features match.
+    """
+
+    name = "homography"
+
+    def __init__(self, features=2000, min_matches=16):
+        self.min_matches = min_matches
+        self._orb = cv2.ORB_create(features)
+        self._matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+        self._fallback = TranslationFlow()
+
+    def transform(self, ref, cur):
+        """Homography taking ref pixel coordinates to cur, or None if it cannot be estimated."""
+        ref_points, ref_desc = self._orb.detectAndCompute(ref, None)
+        cur_points, cur_desc = self._orb.detectAndCompute(cur, None)
+        if ref_desc is None or cur_desc is None:
+            return None
+        matches = self._matcher.match(ref_desc, cur_desc)
+        if len(matches) < self.min_matches:
+            return None
+        src = np.float32([ref_points[m.queryIdx].pt for m in matches])
+        dst = np.float32([cur_points[m.trainIdx].pt for m in matches])
+        homography, inliers = cv2.findHomography(src, dst, cv2.RANSAC, 3.0)
+        if homography is None or inliers.sum() < self.min_matches:
+            return None
+        return homography
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        homography = self.transform(ref, cur)
+        if homography is None:
+            logger.debug("Too few feature matches for a homography; using a global translation")
+            return self._fallback.estimate(ref, cur, flow)
+        h, w = ref.shape
+        grid = coordinate_grid(h, w)
+        mapped = cv2.perspectiveTransform(grid.reshape(1, -1, 2), homography).reshape(h, w, 2)
+        return np.subtract(mapped, grid, out=_flow_buffer(flow, ref.shape))
+
+
+def flow_residual(ref, cur, flow, margin=0.05):
+    """RMS difference between grayscale ref and cur warped by flow, ignoring a border."""
+    h, w = ref.shape
+    warped = cv2.remap(cur, coordinate_grid(h, w) + flow, None, cv2.INTER_LINEAR)
+    my, mx = max(1, int(h * margin)), max(1, int(w * margin))
+    diff = cv2.absdiff(ref, warped)[my:-my, mx:-mx].astype(np.float32)
+    return float(np.sqrt(np.mean(diff * diff)))
+
+
+def interpolated_noise_factor(flow):
+    """Mean fraction of a frame's noise variance left after bilinear warping by flow.
+
+    A sample taken a fraction f between two pixels keeps (1 - f)^2 + f^2 of the
+    noise variance along that axis; integer flows keep all of it.
+    """
+    frac = flow[::4, ::4] % 1.0
+    kept = (1 - frac) ** 2 + frac ** 2
+    return float(np.mean(kept[:, :, 0] * kept[:, :, 1]))
+
+
+class AutoFlow:
+    """Aligns with the simplest motion model that explains a frame pair.
+
+    A global translation, then a homography, is tried first. The first whose
+    squared residual is at most the noise a perfect alignment leaves (ref's
+    noise variance plus cur's, reduced by the interpolation of the warp; see
+    estimate_noise) plus tolerance, in 8-bit gray levels squared, is used.
+    Only when both leave more misalignment than that is a dense flow (DIS)
+    estimated, so locked-off and gimbal shots get a rigid, artefact-free warp
+    without paying for a dense flow, and anything with local motion keeps the
+    dense flow. choices counts the models picked.
+    """
+
+    name = "auto"
+
+    def __init__(self, dense=None, tolerance=1.0):
+        self.tolerance = tolerance
+        self.candidates = [TranslationFlow(), HomographyFlow()]
+        self.dense = dense or DISFlow("fast")
+        self.choices = {}
+        self._candidate_flow = None
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        # Gray frames are 8-bit, estimate_noise reports normalised levels
+        ref_noise = (255 * estimate_noise(ref)) ** 2
+        cur_noise = (255 * estimate_noise(cur)) ** 2
+        chosen = self.dense
+        for candidate in self.candidates:
+            # Estimated aside, so flow keeps the warm start for the dense flow
+            self._candidate_flow = candidate.estimate(ref, cur, self._candidate_flow)
+            limit = ref_noise + cur_noise * interpolated_noise_factor(self._candidate_flow) + self.tolerance
+            if flow_residual(ref, cur, self._candidate_flow) ** 2 <= limit:
+                flow = _flow_buffer(flow, ref.shape)
+                np.copyto(flow, self._candidate_flow)
+                chosen = candidate
+                break
+        else:
+            flow = self.dense.estimate(ref, cur, flow, initial)
+        self.choices[chosen.name] = self.choices.get(chosen.name, 0) + 1
+        return flow
+
+
+# Alignment backends selectable by name from the API, the CLI and the UI
+ALIGN_BACKENDS = ("farneback", "dis-ultrafast", "dis-fast", "dis-medium", "translation", "homography", "auto")
+
+
+def make_flow_estimator(backend="farneback", pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2):
+    """Return a flow estimator for backend; the Farneback parameters only apply to farneback."""
+    if backend == "farneback":
+        return FarnebackFlow(pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+    if backend.startswith("dis-") and backend[4:] in DISFlow.PRESETS:
+        return DISFlow(backend[4:])
+    if backend == "translation":
+        return TranslationFlow()
+    if backend == "homography":
+        return HomographyFlow()
+    if backend == "auto":
+        return AutoFlow()
+    raise ValueError(f"Unknown alignment backend {backend!r}, expected one of {', '.join(ALIGN_BACKENDS)}")
+
+
+class FlowCache:
+    """Optical flow between any two frames of a sliding window.
+
+    Only the forward flow between adjacent frames is estimated (with the
+    alignment backend), once per frame as it enters the window. Backward adjacent flows are derived
+    by inverting the forward ones, and longer-range flows are built by composing
+    adjacent flows along the chain. With refine=True the composed flow is used as
+    the initial guess for another estimate between the two frames.
+
+    Flows are estimated and composed at flow_scale times the frame resolution and
+    upscaled to full resolution when requested, unless full_resolution=False
+    (for callers that upscale only the rows they need, see upscale_flow_rows).
+    Conversions, estimates and composition are timed on profiler (see
+    temporal_denoiser.profiling).
+    """
+
+    def __init__(self, pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2, flow_scale=1.0, backend="farneback", refine=False, full_resolution=True):
+        self.estimator = make_flow_estimator(backend, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+        self.flow_scale = flow_scale
+        self.refine = refine
+        self.full_resolution = full_resolution
+        self.profiler = NULL_PROFILER
+        self.flow_calls = 0
+        self._size = None
+        self._gray = {}
+        self._forward = {}  # i -> flow i -> i + 1
+        self._backward = {}  # i -> flow i + 1 -> i
+
+    def _estimate(self, src, dst, initial=None):
+        self.flow_calls += 1
+        with self.profiler.stage("flow"):
+            return self.estimator.estimate(self._gray[src], self._gray[dst], initial, initial is not None)
+
+    def add_frame(self, idx, frame):
+        """Register frame idx and estimate the flow from its predecessor."""
+        self._size = frame.shape[:2]
+        with self.profiler.stage("gray"):
+            self._gray[idx] = to_gray(to_float32(frame), self.flow_scale)
+        if idx - 1 in self._gray:
+            self._forward[idx - 1] = self._estimate(idx - 1, idx)
+
+    def _adjacent(self, src, dst):
+        if dst == src + 1:
+            return self._forward[src]
+        flow = self._backward.get(dst)
+        if flow is None:
+            flow = invert_flow(self._forward[dst])
+            self._backward[dst] = flow
+        return flow
+
+    def flow(self, src, dst):
+        """Return the flow field from frame src to frame dst, as estimating it directly would."""
+        step = 1 if dst > src else -1
+        with self.profiler.stage("compose"):
+            flow = self._adjacent(src, src + step)
+            for mid in range(src + step, dst, step):
+                flow = compose_flows(flow, self._adjacent(mid, mid + step))
+        if self.refine and abs(dst - src) > 1:
+            flow = self._estimate(src, dst, initial=flow.copy())
+        if not self.full_resolution:
+            return flow
+        with self.profiler.stage("compose"):
+            return upscale_flow(flow, *self._size)
+
+    def evict_before(self, idx):
+        """Drop grayscale frames and flows involving frames before idx."""
+        for cache in (self._gray, self._forward, self._backward):
+            for key in [k for k in cache if k < idx]:
+                del cache[key]
+
+
+class AlignmentContext:
+    """Aligns windows of frames to a reference frame with an alignment backend, reusing its buffers.
+
+    Grayscale proxies, flow fields, the remap map and the aligned frames are
+    written into buffers kept from call to call, so aligning a window allocates
+    nothing once they exist; the coordinate grid comes from coordinate_grid.
+    Each frame's grayscale proxy is converted once and kept while the frame is
+    in the window, instead of once per window it appears in (up to 2r+1 times).
+
+    With initial_flow=True the flow found for each neighbour offset on the
+    previous reference frame seeds the estimate for the same offset
+    (OPTFLOW_USE_INITIAL_FLOW; only Farneback uses it). For steady motion that guess is close, so fewer
+    iterations are needed, but results then depend on the previous frame, so it
+    is off by default. A context is not thread-safe; use one per thread.
+
+    For tiled processing, estimate_window() and warp_rows() split alignment into
+    whole-frame flow estimation and remapping a band of rows at a time; with
+    band_rows set, grayscale conversion also works band by band.
+
+    Frames may be stored compactly (uint16 or float16, see
+    temporal_denoiser.frames); they are promoted to float32 before they are
+    converted or remapped, so the proxies and aligned frames are the same as
+    for the float32 frames.
+
+    Grayscale conversions, flow estimates and remaps are timed on profiler
+    (see temporal_denoiser.profiling).
+    """
+
+    def __init__(self, pyr_scale=0.5, levels=3, winsize=15, iterations=3, poly_n=5, poly_sigma=1.2, flow_scale=1.0, backend="farneback", initial_flow=False):
+        self.estimator = make_flow_estimator(backend, pyr_scale, levels, winsize, iterations, poly_n, poly_sigma)
+        self.flow_scale = flow_scale
+        self.initial_flow = initial_flow
+        self.profiler = NULL_PROFILER
+        self.flow_calls = 0
+        self.luma_conversions = 0
+        self._scratch = None  # Conversion temporaries: scaled float, uint8 RGB, full-resolution gray
+        self._luma = {}  # Frame index -> (frame, grayscale proxy) for frames in the current window
+        self._free = []  # Proxy buffers of frames that left the window
+        self._flows = {}  # Neighbour offset -> flow at flow resolution
+        self._aligned = {}  # Neighbour offset -> aligned frame
+        self._upscaled = None
+        self._map = None
+        self._source = None  # Float32 copy of the compact frame (or rows of it) being remapped
+        self._warm = set()  # Offsets whose flow belongs to the previous reference frame
+        self._last_ref = None
+        self.band_rows = None  # Convert to grayscale this many rows at a time (None: whole frames)
+
+    def gray(self, img, out=None):
+        """Same result as to_gray(img, flow_scale), written into out if given."""
+        h, w = img.shape[:2]
+        rows = h if self.band_rows is None else min(h, self.band_rows)
+        band = (rows,) + img.shape[1:]
+        if self._scratch is None or self._scratch[0].shape != band or self._scratch[2].shape != (h, w):
+            self._scratch = (np.empty(band, dtype=np.float32), np.empty(band, dtype=np.uint8), np.empty((h, w), dtype=np.uint8))
+        scaled, rgb, gray = self._scratch
+        self.luma_conversions += 1
+        if rows == h:
+            np.multiply(to_float32(img, scaled), 255, out=scaled)
+            np.copyto(rgb, scaled, casting="unsafe")
+            if self.flow_scale == 1.0:
+                return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY, dst=out)
+            cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY, dst=gray)
+        else:
+            # Every step before the resize is per pixel, so converting band by band gives the same result
+            if self.flow_scale == 1.0:
+                if out is None:
+                    out = np.empty((h, w), dtype=np.uint8)
+                gray = out
+            for top in range(0, h, rows):
+                n = min(rows, h - top)
+                np.multiply(to_float32(img[top:top + n], scaled[:n]), 255, out=scaled[:n])
+                np.copyto(rgb[:n], scaled[:n], casting="unsafe")
+                gray[top:top + n] = cv2.cvtColor(rgb[:n], cv2.COLOR_RGB2GRAY)
+            if self.flow_scale == 1.0:
+                return gray
+        size = (max(1, int(round(w * self.flow_scale))), max(1, int(round(h * self.flow_scale))))
+        return cv2.resize(gray, size, dst=out, interpolation=cv2.INTER_AREA)
+
+    def luma(self, frame_idx, img):
+        """Grayscale proxy of img, frame frame_idx, converted once while the frame stays in the window."""
+        cached = self._luma.get(frame_idx)
+        if cached is not None and cached[0] is img:
+            return cached[1]
+        out = self._free.pop() if self._free else None
+        with self.profiler.stage("gray"):
+            gray = self.gray(img, out)
+        self._luma[frame_idx] = (img, gray)
+        return gray
+
+    def evict(self, lo, hi):
+        """Forget the grayscale proxies of frames outside lo..hi-1, keeping their buffers for reuse."""
+        for idx in [idx for idx in self._luma if not lo <= idx < hi]:
+            self._free.append(self._luma.pop(idx)[1])
+
+    def estimate(self, ref_gray, gray, offset):
+        """Flow from ref_gray to gray into the buffer for offset, warm-started if allowed."""
+        flow = self._flows.get(offset)
+        initial = False
+        if flow is None or flow.shape[:2] != ref_gray.shape:
+            flow = self._flows[offset] = np.zeros(ref_gray.shape + (2,), dtype=np.float32)
+        elif self.initial_flow and offset in self._warm:
+            initial = True
+        self.flow_calls += 1
+        with self.profiler.stage("flow"):
+            return self.estimator.estimate(ref_gray, gray, flow, initial)
+
+    def warp(self, frame, flow, out=None):
+        """Remap frame by flow (upscaled to the frame size if needed), as cv2.remap(frame, flow_to_map(flow)) would."""
+        with self.profiler.stage("remap"):
+            h, w = frame.shape[:2]
+            ph, pw = flow.shape[:2]
+            if (ph, pw) != (h, w):
+                if self._upscaled is None or self._upscaled.shape[:2] != (h, w):
+                    self._upscaled = np.empty((h, w, 2), dtype=np.float32)
+                flow = cv2.resize(flow, (w, h), dst=self._upscaled, interpolation=cv2.INTER_LINEAR)
+                flow[:, :, 0] *= w / pw
+                flow[:, :, 1] *= h / ph
+            if self._map is None or self._map.shape[:2] != (h, w):
+                self._map = np.empty((h, w, 2), dtype=np.float32)
+            np.add(coordinate_grid(h, w), flow, out=self._map)
+            if frame.dtype != np.float32:
+                frame = to_float32(frame, self._source_rows(frame.shape))
+            return cv2.remap(frame, self._map, None, cv2.INTER_LINEAR, dst=out)
+
+    def _source_rows(self, shape):
+        """A float32 buffer of shape for promoting (rows of) a compact frame, grown as needed."""
+        if self._source is None or self._source.shape[1:] != shape[1:] or self._source.shape[0] < shape[0]:
+            self._source = np.empty(shape, dtype=np.float32)
+        return self._source[:shape[0]]
+
+    def warp_rows(self, frame, flow, top, bottom, out=None):
+        """Rows top..bottom-1 of warp(frame, flow), computing only that band of the upscaled flow and map."""
+        with self.profiler.stage("remap"):
+            h, w = frame.shape[:2]
+            flow = upscale_flow_rows(flow, h, w, top, bottom)
+            band = (bottom - top, w, 2)
+            if self._map is None or self._map.shape != band:
+                self._map = np.empty(band, dtype=np.float32)
+            # The same sums as coordinate_grid(h, w)[top:bottom] + flow, without the full-size grid
+            np.add(np.arange(w, dtype=np.float32), flow[:, :, 0], out=self._map[:, :, 0])
+            np.add(np.arange(top, bottom, dtype=np.float32)[:, np.newaxis], flow[:, :, 1], out=self._map[:, :, 1])
+            if frame.dtype != np.float32:
+                # Promote only the source rows the band samples from, with a row of margin below for
+                # the bilinear taps; shifting the map by a whole number of rows is exact
+                ys = self._map[:, :, 1]
+                first = min(max(int(np.floor(ys.min())), 0), h - 1)
+                last = min(max(int(np.floor(ys.max())) + 3, first + 1), h)
+                frame = to_float32(frame[first:last], self._source_rows((last - first,) + frame.shape[1:]))
+                ys -= first
+            return cv2.remap(frame, self._map, None, cv2.INTER_LINEAR, dst=out)
+
+    def estimate_window(self, window, ref_idx, start_idx, end_idx, first_idx=0, flows=None, check=None):
+        """Yield (i, flow) with the flow from window[ref_idx] to window[i] for each other frame of window[start_idx:end_idx].
+
+        window[0] is frame first_idx. flows may be any object with a
+        flow(src, dst) method taking frame numbers (e.g. a FlowCache); without
+        it each flow is estimated here into this context's buffers. check(), if
+        given, is called before each flow (e.g. to raise when a job is
+        cancelled). Consume the generator fully: the warm start is updated at
+        the end.
+        """
+        frame_idx = first_idx + ref_idx
+        if self._last_ref is None or frame_idx != self._last_ref + 1:
+            self._warm = set()
+        warm = set()
+        if flows is None:
+            self.evict(first_idx + start_idx, first_idx + end_idx)
+            ref_gray = self.luma(frame_idx, window[ref_idx])
+        for i in range(start_idx, end_idx):
+            if i == ref_idx:
+                continue
+            if check is not None:
+                check()
+            if flows is not None:
+                yield i, flows.flow(frame_idx, first_idx + i)
+            else:
+                offset = i - ref_idx
+                yield i, self.estimate(ref_gray, self.luma(first_idx + i, window[i]), offset)
+                warm.add(offset)
+        self._warm = warm
+        self._last_ref = frame_idx
+
+    def align(self, window, ref_idx, start_idx, end_idx, first_idx=0, flows=None, reuse=True, check=None):
+        """Return window[start_idx:end_idx] with every frame aligned to window[ref_idx].
+
+        flows, first_idx and check are as in estimate_window. With reuse=True
+        the aligned frames are buffers that the next call overwrites; pass
+        reuse=False if they are handed to another thread.
+        """
+        ref = window[ref_idx]
+        aligned = [window[i] for i in range(start_idx, end_idx)]
+        for i, flow in self.estimate_window(window, ref_idx, start_idx, end_idx, first_idx, flows, check):
+            out = None
+            if reuse:
+                out = self._aligned.get(i - ref_idx)
+                if out is None or out.shape != ref.shape:
+                    out = self._aligned[i - ref_idx] = np.empty(ref.shape, dtype=np.float32)
+            aligned[i - start_idx] = self.warp(window[i], flow, out)
+        return aligned
@@ -0,0 +1,48 @@
+import numpy as np
+
+# Storage types for the decoded frames of a temporal window. float32 holds
+# normalised values; uint16 holds value * 65535 (lossless for 16-bit decodes)
+# and float16 normalised values at half precision, both at half the memory.
+FRAME_DTYPES = ("float32", "uint16", "float16")
+# Full-white value of the integer types frames are decoded or stored as: a
+# frame's dtype says how to normalise it, so its range never has to be guessed
+INTEGER_SCALES = {np.dtype(np.uint8): 255, np.dtype(np.uint16): 65535}
+
+
+def to_float32(frame, out=None):
+    """Normalised float32 values of a uint8, uint16 or float frame.
+
+    float32 frames are returned as they are; other frames are converted, into
+    out if given. uint16 frames convert to exactly the values of
+    frame.astype(np.float32) / 65535.0.
+    """
+    if frame.dtype == np.float32:
+        return frame
+    scale = INTEGER_SCALES.get(frame.dtype)
+    if scale is None:
+        if out is None:
+            return frame.astype(np.float32)
+        np.copyto(out, frame)
+        return out
+    return np.divide(frame, np.float32(scale), out=out, dtype=np.float32)
+
+
+def to_storage(frame, dtype="float32"):
+    """Convert a decoded frame (uint8, uint16 or normalised float) to the window storage type dtype.
+
+    Frames already of that type are returned as they are. 8-bit data widens
+    to uint16 exactly (x 257); float frames are rounded to the nearest uint16
+    step or float16 value.
+    """
+    if dtype not in FRAME_DTYPES:
+        raise ValueError(f"Unknown frame dtype {dtype!r}, expected one of {', '.join(FRAME_DTYPES)}")
+    if frame.dtype == np.dtype(dtype):
+        return frame
+    if dtype == "uint16":
+        if frame.dtype == np.uint8:
+            return np.multiply(frame, np.uint16(257), dtype=np.uint16)
+        scaled = np.multiply(to_float32(frame), np.float32(65535))
+        return np.rint(np.clip(scaled, 0, 65535, out=scaled), out=scaled).astype(np.uint16)
+    if dtype == "float16":
+        return to_float32(frame).astype(np.float16)
+    return to_float32(frame)
@@ -0,0 +1,139 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+import numpy as np
+from temporal_denoiser.frames import to_float32
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "temporal_denoiser", "frames")
+STORE_VERSION = 1
+STORE_DTYPES = ("uint16", "float16")
+
+
+class FrameStore:
+    """Decoded frames of one clip, kept on disk in a memory-mapped array.
+
+    A store is three files in store_dir named after a hash of the clip's paths:
+    <key>.npy holds an (n, h, w, c) uint16 or float16 array, <key>.filled.npy one
+    byte per frame set once the frame has been written, and <key>.json a header
+    with the version, shape, dtype, decode settings and the size and mtime of
+    every source file. A store whose header no longer matches the clip (a file
+    was re-exported, or the decode settings changed) is rebuilt.
+
+    Frames are filled lazily as they are decoded, so a second session (or a
+    parameter sweep) reads them back from the page cache instead of paying the
+    demosaic again. uint16 storage of 16-bit decodes is lossless; get() returns
+    exactly the float32 frame that was stored. view() gives zero-copy access to
+    the stored pixel data.
+    """
+
+    def __init__(self, store_dir, sources, decode_settings, dtype="uint16"):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"Unknown frame store dtype {dtype!r}, expected one of {', '.join(STORE_DTYPES)}")
+        os.makedirs(store_dir, exist_ok=True)
+        key = hashlib.sha1(json.dumps([os.path.abspath(p) for p in sources]).encode()).hexdigest()[:16]
+        base = os.path.join(store_dir, key)
+        self.frames_path = base + ".npy"
+        self.filled_path = base + ".filled.npy"
+        self.header_path = base + ".json"
+        self.dtype = dtype
+        self.count = len(sources)
+        self.header = {
+            "version": STORE_VERSION,
+            "dtype": dtype,
+            "decode_settings": decode_settings,
+            "sources": [self._identity(p) for p in sources],
+        }
+        self._frames = None
+        self._filled = None
+        self._lock = threading.Lock()
+        self._open_existing()
+
+    @staticmethod
+    def _identity(path):
+        try:
+            st = os.stat(path)
+            return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+        except OSError:
+            return [os.path.abspath(path), None, None]
+
+    def _open_existing(self):
+        try:
+            with open(self.header_path) as f:
+                header = json.load(f)
+        except (OSError, ValueError):
+            return
+        if any(header.get(k) != v for k, v in self.header.items()):
+            logger.info(f"Frame store {self.header_path} is out of date; it will be rebuilt")
+            return
+        try:
+            frames = np.load(self.frames_path, mmap_mode="r+")
+            filled = np.load(self.filled_path, mmap_mode="r+")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Cannot open frame store {self.frames_path}: {e}")
+            return
+        if list(frames.shape) != header.get("shape") or filled.shape != (self.count,):
+            logger.warning(f"Frame store {self.frames_path} has an unexpected shape; it will be rebuilt")
+            return
+        self._frames, self._filled = frames, filled
+        logger.debug(f"Opened frame store {self.frames_path} with {int(filled.sum())}/{self.count} frames")
+
+    def _create(self, frame_shape):
+        shape = (self.count,) + tuple(frame_shape)
+        logger.info(f"Creating frame store {self.frames_path} for {shape} {self.dtype} frames ({np.prod(shape) * 2 / 2**30:.1f} GiB)")
+        # Drop a stale header first, so a half-written store is never taken for a valid one
+        if os.path.exists(self.header_path):
+            os.remove(self.header_path)
+        self._frames = np.lib.format.open_memmap(self.frames_path, mode="w+", dtype=self.dtype, shape=shape)
+        self._filled = np.lib.format.open_memmap(self.filled_path, mode="w+", dtype=np.uint8, shape=(self.count,))
+        with open(self.header_path, "w") as f:
+            json.dump(dict(self.header, shape=list(shape)), f)
+
+    def __contains__(self, idx):
+        return self._filled is not None and bool(self._filled[idx])
+
+    def __len__(self):
+        return 0 if self._filled is None else int(self._filled.sum())
+
+    def view(self, idx):
+        """Read-only, zero-copy view of stored frame idx, or None if it has not been stored."""
+        if idx not in self:
+            return None
+        frame = self._frames[idx]
+        frame.flags.writeable = False
+        return frame
+
+    def get(self, idx):
+        """Return stored frame idx as a normalised float32 array, or None."""
+        frame = self.view(idx)
+        if frame is None:
+            return None
+        if self.dtype == "uint16":
+            return frame.astype(np.float32) / 65535.0
+        return frame.astype(np.float32)
+
+    def put(self, idx, frame):
+        """Store a normalised float frame, or the decoder's uint16 data, as frame idx."""
+        with self._lock:
+            if self._frames is None:
+                self._create(frame.shape)
+            if self._frames.shape[1:] != frame.shape:
+                logger.warning(f"Frame {idx} has shape {frame.shape}, the store holds {self._frames.shape[1:]}; not storing it")
+                return
+            if self.dtype == "uint16" and frame.dtype == np.uint16:
+                self._frames[idx] = frame
+            elif self.dtype == "uint16":
+                self._frames[idx] = np.rint(frame * 65535.0)
+            else:
+                self._frames[idx] = to_float32(frame)
+            # Mark the frame only after its data is in place
+            self._filled[idx] = 1
+
+    def flush(self):
+        with self._lock:
+            if self._frames is not None:
+                self._frames.flush()
+                self._filled.flush()
@@ -0,0 +1,81 @@
+import time
+import threading
+import logging
+from PySide6.QtCore import QObject, QRunnable, Signal
+from temporal_denoiser.denoise import JobCancelled
+
+logger = logging.getLogger(__name__)
+
+
+class JobSignals(QObject):
+    # frames done, total frames (0 if unknown), frames per second, ETA in seconds (-1 if unknown)
+    progress = Signal(int, int, float, float)
+    result = Signal(object)
+    error = Signal(str)
+    cancelled = Signal()
+    finished = Signal()
+
+
+class ProgressTracker:
+    """Turns per-frame completion callbacks into frames/s and ETA figures.
+
+    Frames a resumed export skips (see resumed) count as done but not towards
+    the frame rate, which only measures frames rendered.
+    """
+
+    def __init__(self, total=0):
+        self.total = total
+        self.skipped = 0
+        self.start = time.perf_counter()
+
+    def resumed(self, skipped):
+        self.skipped = skipped
+
+    def update(self, done):
+        elapsed = time.perf_counter() - self.start
+        fps = (done - self.skipped) / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / fps if fps > 0 and self.total else -1.0
+        return done, self.total, fps, eta
+
+
+class Job(QRunnable):
+    """Run fn(*args, progress=..., cancel=..., **kwargs) on a QThreadPool thread.
+
+    fn reports each completed frame through progress(done) and checks the
+    cancel event between frames, raising JobCancelled when it is set. Results,
+    errors and progress are delivered through Qt signals, so connected slots run
+    on the GUI thread. With resumable=True fn also gets resumed=..., through
+    which it reports the frames a resumed export skips (see
+    CinemaDNG.save_denoised), so they do not inflate the frame rate and ETA.
+    """
+
+    def __init__(self, fn, *args, total=0, resumable=False, **kwargs):
+        super().__init__()
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.total = total
+        self.resumable = resumable
+        self.cancel_event = threading.Event()
+        self.signals = JobSignals()
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def run(self):
+        tracker = ProgressTracker(self.total)
+        kwargs = dict(self.kwargs, resumed=tracker.resumed) if self.resumable else self.kwargs
+        try:
+            result = self.fn(*self.args, progress=lambda done: self.signals.progress.emit(*tracker.update(done)), cancel=self.cancel_event, **kwargs)
+        except JobCancelled:
+            logger.info("Job cancelled")
+            self.signals.cancelled.emit()
+        except Exception as e:
+            logger.error(f"Job failed: {e}")
+            import traceback
+            logger.debug(f"Full traceback: {traceback.format_exc()}")
+            self.signals.error.emit(str(e))
+        else:
+            self.signals.result.emit(result)
+        finally:
+            self.signals.finished.emit()
@@ -1,18 +1,21 @@
-from temporal_denoiser.cinemadng import CinemaDNG
-from temporal_denoiser.denoise import PreviewDenoiser
+from temporal_denoiser.cinemadng import CinemaDNG, HAS_TIFFFILE
+from temporal_denoiser.writer import HAS_IMAGECODECS
+from temporal_denoiser.framestore import DEFAULT_STORE_DIR
+from temporal_denoiser.jobs import Job
+from temporal_denoiser.profiling import Profiler
+from temporal_denoiser.sweep import contact_sheet, parameter_grid, write_contact_sheet
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QPushButton, QFileDialog, QVBoxLayout, QWidget,
-    QLabel, QSlider, QCheckBox, QSpinBox, QHBoxLayout, QGroupBox, QDoubleSpinBox
+    QLabel, QSlider, QCheckBox, QSpinBox, QHBoxLayout, QGroupBox, QDoubleSpinBox, QComboBox,
+    QProgressBar, QLineEdit, QDialog, QScrollArea, QGridLayout
 )
-from PySide6.QtGui import QImage, QPixmap
-from PySide6.QtCore import Qt
+from PySide6.QtGui import QImage, QPixmap, QFontDatabase
+from PySide6.QtCore import Qt, QTimer, QThreadPool
 import sys
 import logging
 import numpy as np
 from pathlib import Path
 
-# Set up logging
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 class MainWindow(QMainWindow):
@@ -41,8 +44,54 @@ class MainWindow(QMainWindow):
         button_layout.addWidget(self.preview_button)
         button_layout.addWidget(self.denoise_button)
         button_layout.addWidget(self.output_button)
+        self.format_combo = QComboBox()
+        if HAS_TIFFFILE:
+            self.format_combo.addItem("16-bit TIFF", "tiff")
+            self.format_combo.addItem("16-bit TIFF (zlib)", "tiff:zlib:1")
+            if HAS_IMAGECODECS:
+                self.format_combo.addItem("16-bit TIFF (zstd)", "tiff:zstd")
+                self.format_combo.addItem("16-bit TIFF (LZW)", "tiff:lzw")
+        self.format_combo.addItem("8-bit PNG", "png")
+        self.format_combo.addItem("8-bit PNG (smallest)", "png:9")
+        self.format_combo.addItem("Raw float32 (.npy)", "npy")
+        button_layout.addWidget(self.format_combo)
+        # Exports can hold the window of decoded frames as uint16, half the memory with the same output
+        self.compact_window_checkbox = QCheckBox("16-bit Window")
+        self.compact_window_checkbox.setToolTip("Keep decoded frames as 16-bit integers during export (half the memory, same output)")
+        button_layout.addWidget(self.compact_window_checkbox)
         main_layout.addLayout(button_layout)
 
+        # Job progress and cancellation
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        self.cancel_button = QPushButton("Cancel")
+        self.cancel_button.setEnabled(False)
+        self.status_label = QLabel("")
+        progress_layout.addWidget(self.progress_bar)
+        progress_layout.addWidget(self.cancel_button)
+        main_layout.addLayout(progress_layout)
+        main_layout.addWidget(self.status_label)
+
+        # Per-stage timings of the current or last export
+        stats_group = QGroupBox("Export Stats")
+        stats_layout = QVBoxLayout()
+        self.stats_label = QLabel("No export yet")
+        self.stats_label.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        self.stats_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        stats_layout.addWidget(self.stats_label)
+        stats_buttons = QHBoxLayout()
+        self.save_profile_button = QPushButton("Save Profile...")
+        self.save_trace_button = QPushButton("Save Trace...")
+        self.save_profile_button.setEnabled(False)
+        self.save_trace_button.setEnabled(False)
+        stats_buttons.addWidget(self.save_profile_button)
+        stats_buttons.addWidget(self.save_trace_button)
+        stats_buttons.addStretch()
+        stats_layout.addLayout(stats_buttons)
+        stats_group.setLayout(stats_layout)
+        main_layout.addWidget(stats_group)
+
         # Controls group
         controls_group = QGroupBox("Denoising Parameters")
         controls_layout = QVBoxLayout()
@@ -72,6 +121,49 @@ class MainWindow(QMainWindow):
         self.align_checkbox.setChecked(True)
         controls_layout.addWidget(self.align_checkbox)
 
+        # Temporal merge kernel; the robust ones reduce ghosting where alignment fails
+        merge_layout = QHBoxLayout()
+        merge_layout.addWidget(QLabel("Merge:"))
+        self.merge_combo = QComboBox()
+        self.merge_combo.addItem("Mean", "mean")
+        self.merge_combo.addItem("Motion-weighted mean", "weighted")
+        self.merge_combo.addItem("Trimmed mean", "trimmed")
+        self.merge_combo.addItem("Median", "median")
+        self.merge_combo.addItem("Wiener", "wiener")
+        merge_layout.addWidget(self.merge_combo)
+        # Spatial median on the merged frame, used by previews, sweeps' "Use These Settings" and exports alike
+        merge_layout.addWidget(QLabel("Spatial Median:"))
+        self.median_combo = QComboBox()
+        self.median_combo.addItem("Off", 0)
+        for size in (3, 5, 7):
+            self.median_combo.addItem(f"{size}x{size}", size)
+        merge_layout.addWidget(self.median_combo)
+        # Tiled processing bounds the working memory per frame for 6K/8K footage; the result is unchanged
+        merge_layout.addWidget(QLabel("Tile Memory (MB):"))
+        self.tile_mb_spinbox = QSpinBox()
+        self.tile_mb_spinbox.setRange(0, 65536)
+        self.tile_mb_spinbox.setSingleStep(256)
+        self.tile_mb_spinbox.setValue(0)
+        self.tile_mb_spinbox.setSpecialValueText("Off")
+        self.tile_mb_spinbox.setToolTip("Denoise each frame in tiles that fit in this much working memory (0 processes whole frames)")
+        merge_layout.addWidget(self.tile_mb_spinbox)
+        controls_layout.addLayout(merge_layout)
+
+        # Preview quality: half-size decode at viewport resolution, optionally refined afterwards
+        preview_quality_layout = QHBoxLayout()
+        self.fast_preview_checkbox = QCheckBox("Fast Preview")
+        self.fast_preview_checkbox.setChecked(True)
+        self.refine_checkbox = QCheckBox("Refine to Full Quality")
+        self.refine_checkbox.setChecked(False)
+        preview_quality_layout.addWidget(self.fast_preview_checkbox)
+        preview_quality_layout.addWidget(self.refine_checkbox)
+        # Decoded frames go to a memory-mapped store on disk, so reopening a clip skips raw decoding
+        self.frame_store_checkbox = QCheckBox("Cache Decoded Frames on Disk")
+        self.frame_store_checkbox.setChecked(False)
+        self.frame_store_checkbox.setToolTip(f"Takes effect when a clip is loaded; frames are kept in {DEFAULT_STORE_DIR}")
+        preview_quality_layout.addWidget(self.frame_store_checkbox)
+        controls_layout.addLayout(preview_quality_layout)
+
         # Basic flow parameters (existing)
         flow_layout1 = QHBoxLayout()
         self.winsize_spinbox = QSpinBox()
@@ -137,9 +229,61 @@ class MainWindow(QMainWindow):
         poly_sigma_layout.addWidget(self.poly_sigma_spinbox)
         fine_tune_layout.addLayout(poly_sigma_layout)
 
+        # Flow resolution: estimate optical flow on a downscaled luma proxy
+        flow_scale_layout = QHBoxLayout()
+        flow_scale_layout.addWidget(QLabel("Flow Resolution:"))
+        self.flow_scale_combo = QComboBox()
+        self.flow_scale_combo.addItem("Full", 1.0)
+        self.flow_scale_combo.addItem("1/2", 0.5)
+        self.flow_scale_combo.addItem("1/4", 0.25)
+        flow_scale_layout.addWidget(self.flow_scale_combo)
+        fine_tune_layout.addLayout(flow_scale_layout)
+
+        # Alignment backend: the Farneback parameters above only apply to Farneback
+        align_backend_layout = QHBoxLayout()
+        align_backend_layout.addWidget(QLabel("Alignment Method:"))
+        self.align_backend_combo = QComboBox()
+        self.align_backend_combo.addItem("Farneback", "farneback")
+        self.align_backend_combo.addItem("DIS (ultrafast)", "dis-ultrafast")
+        self.align_backend_combo.addItem("DIS (fast)", "dis-fast")
+        self.align_backend_combo.addItem("DIS (medium)", "dis-medium")
+        self.align_backend_combo.addItem("Global translation (tripod)", "translation")
+        self.align_backend_combo.addItem("Global homography (gimbal)", "homography")
+        self.align_backend_combo.addItem("Automatic", "auto")
+        align_backend_layout.addWidget(self.align_backend_combo)
+        fine_tune_layout.addLayout(align_backend_layout)
+
         fine_tune_group.setLayout(fine_tune_layout)
         controls_layout.addWidget(fine_tune_group)
 
+        # Parameter sweep: comma-separated values per parameter, empty fields keep the current setting
+        sweep_group = QGroupBox("Parameter Sweep")
+        sweep_layout = QVBoxLayout()
+        sweep_fields_layout = QHBoxLayout()
+        self.sweep_fields = {}
+        for name, label, default in (("frame_radius", "Radius", "1, 2, 3"), ("spatial_median", "Median", "0, 3"), ("winsize", "Winsize", ""),
+                                     ("levels", "Levels", ""), ("poly_n", "Poly N", ""), ("poly_sigma", "Poly Sigma", "")):
+            field = QLineEdit(default)
+            field.setPlaceholderText("current")
+            sweep_fields_layout.addWidget(QLabel(f"{label}:"))
+            sweep_fields_layout.addWidget(field)
+            self.sweep_fields[name] = field
+        sweep_layout.addLayout(sweep_fields_layout)
+        sweep_run_layout = QHBoxLayout()
+        sweep_run_layout.addWidget(QLabel("Frames:"))
+        self.sweep_frames_spinbox = QSpinBox()
+        self.sweep_frames_spinbox.setRange(1, 10)
+        self.sweep_frames_spinbox.setValue(1)
+        self.sweep_frames_spinbox.setToolTip("Sweep this many frames from the current one; the grid shows the first")
+        sweep_run_layout.addWidget(self.sweep_frames_spinbox)
+        self.sweep_button = QPushButton("Run Sweep")
+        self.sweep_button.setEnabled(False)
+        sweep_run_layout.addWidget(self.sweep_button)
+        sweep_run_layout.addStretch()
+        sweep_layout.addLayout(sweep_run_layout)
+        sweep_group.setLayout(sweep_layout)
+        controls_layout.addWidget(sweep_group)
+
         controls_group.setLayout(controls_layout)
         main_layout.addWidget(controls_group)
 
@@ -153,9 +297,39 @@ class MainWindow(QMainWindow):
         self.preview_button.clicked.connect(self.preview_denoised_frame)
         self.denoise_button.clicked.connect(self.run_denoise)
         self.output_button.clicked.connect(self.select_output_dir)
+        self.cancel_button.clicked.connect(self.cancel_denoise)
+        self.sweep_button.clicked.connect(self.run_sweep)
+        self.save_profile_button.clicked.connect(self.save_profile)
+        self.save_trace_button.clicked.connect(self.save_trace)
         self.frame_slider.valueChanged.connect(self.update_frame_label)
         self.radius_slider.valueChanged.connect(self.update_radius_label)
 
+        # Debounced previews: parameter changes restart the timer instead of queueing jobs
+        self.preview_timer = QTimer(self)
+        self.preview_timer.setSingleShot(True)
+        self.preview_timer.setInterval(150)
+        self.preview_timer.timeout.connect(self.preview_denoised_frame)
+        for slider in (self.frame_slider, self.radius_slider):
+            slider.valueChanged.connect(self.schedule_preview)
+        for spinbox in (self.winsize_spinbox, self.iterations_spinbox, self.pyr_scale_spinbox,
+                        self.levels_spinbox, self.poly_n_spinbox, self.poly_sigma_spinbox, self.tile_mb_spinbox):
+            spinbox.valueChanged.connect(self.schedule_preview)
+        self.align_checkbox.toggled.connect(self.schedule_preview)
+        self.flow_scale_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.align_backend_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.merge_combo.currentIndexChanged.connect(self.schedule_preview)
+        self.median_combo.currentIndexChanged.connect(self.schedule_preview)
+
+        # Previews run one at a time on their own pool; exports use the global pool
+        self.preview_pool = QThreadPool(self)
+        self.preview_pool.setMaxThreadCount(1)
+        self.export_pool = QThreadPool.globalInstance()
+        self.preview_job = None
+        self.preview_generation = 0
+        self.export_job = None
+        self.sweep_job = None
+        self.profiler = None
+
         self.cinemadng = None
         self.output_dir = "output"
 
@@ -184,7 +358,7 @@ class MainWindow(QMainWindow):
         try:
             dialog = QFileDialog(self)
             dialog.setFileMode(QFileDialog.AnyFile)
-            dialog.setNameFilter("DNG Files (*.dng);;All Files (*)")
+            dialog.setNameFilter("DNG Files (*.dng *.DNG);;All Files (*)")
             dialog.setOption(QFileDialog.DontUseNativeDialog, False)
             dialog.setAcceptMode(QFileDialog.AcceptOpen)
             dialog.setFileMode(QFileDialog.ExistingFiles)
@@ -192,12 +366,13 @@ class MainWindow(QMainWindow):
             if dialog.exec():
                 files = dialog.selectedFiles()
                 if files:
+                    store_dir = DEFAULT_STORE_DIR if self.frame_store_checkbox.isChecked() else None
                     if len(files) == 1 and Path(files[0]).is_dir():
                         logger.debug(f"Loading CinemaDNG from directory {files[0]}")
-                        self.cinemadng = CinemaDNG(files[0])
+                        self.cinemadng = CinemaDNG(files[0], store_dir=store_dir)
                     else:
                         logger.debug(f"Loading CinemaDNG from files {files}")
-                        self.cinemadng = CinemaDNG(files)
+                        self.cinemadng = CinemaDNG(files, store_dir=store_dir)
                     
                     self.frame_slider.setMaximum(max(0, len(self.cinemadng.images) - 1))
                     self.frame_slider.setValue(len(self.cinemadng.images) // 2)
@@ -206,9 +381,14 @@ class MainWindow(QMainWindow):
                     # Enable preview and denoise buttons
                     self.preview_button.setEnabled(True)
                     self.denoise_button.setEnabled(True)
+                    self.sweep_button.setEnabled(True)
                     
                     logger.info(f"Loaded {len(self.cinemadng.images)} DNG files")
-                    self.image_label.setText(f"Loaded {len(self.cinemadng.images)} DNG files\nClick 'Preview Denoised Frame' to see denoised result")
+                    message = f"Loaded {len(self.cinemadng.images)} DNG files"
+                    gaps = self.cinemadng.sequence.gaps
+                    if gaps:
+                        message += f" ({len(gaps)} gaps in the frame numbers, first at {gaps[0][0]})"
+                    self.image_label.setText(message + "\nClick 'Preview Denoised Frame' to see denoised result")
                 else:
                     logger.warning("No files or directory selected")
                     self.image_label.setText("No files or directory selected")
@@ -216,6 +396,11 @@ class MainWindow(QMainWindow):
             logger.error(f"Failed to load CinemaDNG: {e}")
             self.image_label.setText(f"Failed to load CinemaDNG: {str(e)}")
 
+    def schedule_preview(self):
+        """Restart the debounce timer; the preview runs once the controls settle"""
+        if self.cinemadng:
+            self.preview_timer.start()
+
     def preview_denoised_frame(self):
         """Preview the denoised frame at the current index with current parameters"""
         try:
@@ -225,62 +410,21 @@ class MainWindow(QMainWindow):
                 return
 
             logger.debug("Starting preview denoising")
-            self.image_label.setText("Processing preview...")
-            QApplication.processEvents()  # Update UI
-
-            # Get current parameters
-            frame_idx = self.frame_slider.value()
-            frame_radius = self.radius_slider.value()
-            align = self.align_checkbox.isChecked()
-            winsize = self.winsize_spinbox.value()
-            iterations = self.iterations_spinbox.value()
-            pyr_scale = self.pyr_scale_spinbox.value()
-            levels = self.levels_spinbox.value()
-            poly_n = self.poly_n_spinbox.value()
-            poly_sigma = self.poly_sigma_spinbox.value()
-
-            # Get images and perform preview denoising
-            images = self.cinemadng.get_images()
-            if not images:
-                logger.warning("No images to denoise")
-                self.image_label.setText("No images to denoise")
-                return
-
-            denoiser = PreviewDenoiser()
-            orig, denoised = denoiser.preview(
-                images, 
-                frame_idx, 
-                frame_radius, 
-                spatial_median=0,  # Keep existing default
-                align=align, 
-                winsize=winsize, 
-                iterations=iterations,
-                pyr_scale=pyr_scale,
-                levels=levels,
-                poly_n=poly_n,
-                poly_sigma=poly_sigma
+            self.preview_timer.stop()
+            # Supersede any preview still queued or running
+            self._cancel_preview()
+            self.preview_generation += 1
+            self.status_label.setText("Processing preview...")
+
+            fast = self.fast_preview_checkbox.isChecked()
+            request = dict(
+                generation=self.preview_generation,
+                params=self._preview_params(),
+                # Half-size decode, processed at the resolution of the preview label
+                preview_size=(self.image_label.width(), self.image_label.height()) if fast else None,
+                refine=fast and self.refine_checkbox.isChecked(),
             )
-
-            if denoised is not None:
-                # Convert to displayable format
-                denoised_display = (denoised * 255).clip(0, 255).astype(np.uint8)
-                if denoised_display.ndim == 2:
-                    denoised_display = np.stack([denoised_display] * 3, axis=-1)
-                
-                height, width, channel = denoised_display.shape
-                qimg = QImage(denoised_display.data, width, height, width * channel, QImage.Format_RGB888)
-                pixmap = QPixmap.fromImage(qimg).scaled(
-                    self.image_label.size(), 
-                    Qt.KeepAspectRatio, 
-                    Qt.SmoothTransformation
-                )
-                self.image_label.setPixmap(pixmap)
-                self.image_label.setText("")
-                
-                logger.info(f"Preview complete for frame {frame_idx}")
-            else:
-                logger.warning("Preview denoising returned None")
-                self.image_label.setText("Preview failed - denoising returned no result")
+            self._start_preview_job(request)
 
         except Exception as e:
             logger.error(f"Preview failed: {e}")
@@ -288,43 +432,120 @@ class MainWindow(QMainWindow):
             logger.debug(f"Full traceback: {traceback.format_exc()}")
             self.image_label.setText(f"Preview failed: {str(e)}")
 
+    def _start_preview_job(self, request):
+        job = Job(_denoise_preview, self.cinemadng, request)
+        job.signals.result.connect(self._on_preview_result)
+        job.signals.error.connect(self._on_preview_error)
+        self.preview_job = job
+        self.preview_pool.start(job)
+
+    def _cancel_preview(self):
+        self.preview_pool.clear()
+        if self.preview_job is not None:
+            self.preview_job.cancel()
+            self.preview_job = None
+
+    def _on_preview_result(self, result):
+        request, denoised = result
+        if request["generation"] != self.preview_generation:
+            return  # A newer preview has been requested
+        frame_idx = request["params"]["frame_idx"]
+        if denoised is None:
+            logger.warning("Preview denoising returned None")
+            self.image_label.setText("Preview failed - denoising returned no result")
+            self.status_label.setText("")
+            return
+
+        self._display_image(denoised)
+        quality = "fast" if request["preview_size"] is not None else "full quality"
+        logger.info(f"Preview complete for frame {frame_idx} ({quality})")
+        if request["refine"]:
+            self.status_label.setText("Refining preview...")
+            self._start_preview_job(dict(request, preview_size=None, refine=False))
+        else:
+            self.status_label.setText(f"Preview of frame {frame_idx} ({quality})")
+
+    def _on_preview_error(self, message):
+        self.image_label.setText(f"Preview failed: {message}")
+        self.status_label.setText("")
+
+    def _preview_params(self):
+        """Collect the current preview parameters from the controls"""
+        return dict(
+            frame_idx=self.frame_slider.value(),
+            frame_radius=self.radius_slider.value(),
+            spatial_median=self.median_combo.currentData(),
+            align=self.align_checkbox.isChecked(),
+            winsize=self.winsize_spinbox.value(),
+            iterations=self.iterations_spinbox.value(),
+            pyr_scale=self.pyr_scale_spinbox.value(),
+            levels=self.levels_spinbox.value(),
+            poly_n=self.poly_n_spinbox.value(),
+            poly_sigma=self.poly_sigma_spinbox.value(),
+            flow_scale=self.flow_scale_combo.currentData(),
+            align_backend=self.align_backend_combo.currentData(),
+            merge=self.merge_combo.currentData(),
+            tile_mb=self.tile_mb_spinbox.value() or None,
+        )
+
+    def _display_image(self, denoised):
+        # Convert to displayable format
+        denoised_display = (denoised * 255).clip(0, 255).astype(np.uint8)
+        if denoised_display.ndim == 2:
+            denoised_display = np.stack([denoised_display] * 3, axis=-1)
+        denoised_display = np.ascontiguousarray(denoised_display)
+
+        height, width, channel = denoised_display.shape
+        qimg = QImage(denoised_display.data, width, height, width * channel, QImage.Format_RGB888)
+        pixmap = QPixmap.fromImage(qimg).scaled(
+            self.image_label.size(),
+            Qt.KeepAspectRatio,
+            Qt.SmoothTransformation
+        )
+        self.image_label.setPixmap(pixmap)
+        self.image_label.setText("")
+
     def run_denoise(self):
         try:
             if not self.cinemadng:
                 logger.warning("No CinemaDNG file loaded")
                 self.image_label.setText("No CinemaDNG file loaded")
                 return
+            if self.export_job is not None:
+                logger.warning("Export already running")
+                return
             
             logger.debug("Starting full denoising process")
-            self.image_label.setText("Processing all frames...")
-            QApplication.processEvents()  # Update UI
+            self.status_label.setText("Processing all frames...")
 
             # Get current parameters
-            frame_radius = self.radius_slider.value()
-            align = self.align_checkbox.isChecked()
-            winsize = self.winsize_spinbox.value()
-            iterations = self.iterations_spinbox.value()
-            pyr_scale = self.pyr_scale_spinbox.value()
-            levels = self.levels_spinbox.value()
-            poly_n = self.poly_n_spinbox.value()
-            poly_sigma = self.poly_sigma_spinbox.value()
-
-            # Save all denoised images
-            self.cinemadng.save_denoised(
-                self.output_dir,
-                frame_radius=frame_radius,
-                spatial_median=0,
-                align=align,
-                winsize=winsize,
-                iterations=iterations,
-                pyr_scale=pyr_scale,
-                levels=levels,
-                poly_n=poly_n,
-                poly_sigma=poly_sigma
+            params = self._preview_params()
+            params.pop("frame_idx")
+            output_dir = self.output_dir
+            self.profiler = Profiler(trace=True)
+
+            # Save all denoised images on a worker thread
+            job = Job(
+                self.cinemadng.save_denoised,
+                output_dir,
+                total=len(self.cinemadng.images),
+                resumable=True,
+                output_format=self.format_combo.currentData(),
+                window_dtype="uint16" if self.compact_window_checkbox.isChecked() else "float32",
+                profiler=self.profiler,
+                **params
             )
-            
-            logger.info(f"All denoised images saved to {self.output_dir}")
-            self.image_label.setText(f"All frames processed and saved to {self.output_dir}")
+            job.signals.progress.connect(self._on_export_progress)
+            job.signals.result.connect(lambda _: self._on_export_done(f"All frames processed and saved to {output_dir}"))
+            job.signals.cancelled.connect(lambda: self._on_export_done("Processing cancelled"))
+            job.signals.error.connect(lambda message: self._on_export_done(f"Processing failed: {message}"))
+            job.signals.finished.connect(self._on_export_finished)
+            self.export_job = job
+            self.progress_bar.setRange(0, len(self.cinemadng.images))
+            self.progress_bar.setValue(0)
+            self.denoise_button.setEnabled(False)
+            self.cancel_button.setEnabled(True)
+            self.export_pool.start(job)
             
         except Exception as e:
             logger.error(f"Full denoising failed: {e}")
@@ -332,7 +553,206 @@ class MainWindow(QMainWindow):
             logger.debug(f"Full traceback: {traceback.format_exc()}")
             self.image_label.setText(f"Processing failed: {str(e)}")
 
+    def cancel_denoise(self):
+        if self.export_job is not None:
+            logger.info("Cancelling export")
+            self.status_label.setText("Cancelling...")
+            self.export_job.cancel()
+
+    def _on_export_progress(self, done, total, fps, eta):
+        self.progress_bar.setValue(done)
+        eta_text = f", ETA {eta:.0f}s" if eta >= 0 else ""
+        self.status_label.setText(f"Processed {done}/{total} frames ({fps:.2f} fps{eta_text})")
+        self._update_stats()
+
+    def _on_export_done(self, message):
+        logger.info(message)
+        self.status_label.setText(message)
+
+    def _on_export_finished(self):
+        self.export_job = None
+        self.denoise_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self._update_stats()
+        self.save_profile_button.setEnabled(True)
+        self.save_trace_button.setEnabled(True)
+
+    def _update_stats(self):
+        if self.profiler is not None:
+            self.stats_label.setText(self.profiler.format_table())
+
+    def save_profile(self):
+        self._save_profiler_output("Save Profile", "profile.json", self.profiler.write_json)
+
+    def save_trace(self):
+        self._save_profiler_output("Save Chrome Trace", "profile.trace.json", self.profiler.write_chrome_trace)
+
+    def _save_profiler_output(self, title, name, write):
+        try:
+            path, _ = QFileDialog.getSaveFileName(self, title, str(Path(self.output_dir) / name), "JSON (*.json)")
+            if path:
+                write(path)
+                logger.info(f"Saved {path}")
+        except Exception as e:
+            logger.error(f"Failed to save {name}: {e}")
+            self.status_label.setText(f"Failed to save {name}: {e}")
+
+    def run_sweep(self):
+        """Denoise the current frame with every combination of the sweep values and show them in a grid"""
+        try:
+            if not self.cinemadng:
+                logger.warning("No CinemaDNG file loaded")
+                return
+            if self.sweep_job is not None:
+                logger.warning("Sweep already running")
+                return
+            frame_idx, combinations = self._sweep_combinations()
+            frames = self.sweep_frames_spinbox.value()
+            preview_size = (self.image_label.width(), self.image_label.height()) if self.fast_preview_checkbox.isChecked() else None
+            logger.info(f"Sweeping {len(combinations)} combinations over {frames} frame(s) from frame {frame_idx}")
+            self.status_label.setText(f"Sweeping {len(combinations)} combinations...")
+
+            job = Job(self.cinemadng.sweep, frame_idx, combinations, total=len(combinations) * frames, end=frame_idx + frames, preview_size=preview_size)
+            job.signals.progress.connect(lambda done, total, fps, eta: self.status_label.setText(f"Sweep: {done}/{total} results"))
+            job.signals.result.connect(self._on_sweep_result)
+            job.signals.cancelled.connect(lambda: self.status_label.setText("Sweep cancelled"))
+            job.signals.error.connect(lambda message: self.status_label.setText(f"Sweep failed: {message}"))
+            job.signals.finished.connect(self._on_sweep_finished)
+            self.sweep_job = job
+            self.sweep_button.setEnabled(False)
+            self.export_pool.start(job)
+        except ValueError as e:
+            self.status_label.setText(f"Invalid sweep values: {e}")
+        except Exception as e:
+            logger.error(f"Sweep failed: {e}")
+            self.status_label.setText(f"Sweep failed: {e}")
+
+    def _sweep_combinations(self):
+        """The current frame and the sweep combinations: the sweep values over the current settings"""
+        params = self._preview_params()
+        frame_idx = params.pop("frame_idx")
+        params.pop("tile_mb")
+        values = {}
+        for name, field in self.sweep_fields.items():
+            text = field.text().strip()
+            if text:
+                kind = float if name == "poly_sigma" else int
+                values[name] = [kind(value) for value in text.replace(",", " ").split()]
+        return frame_idx, parameter_grid(params, **values)
+
+    def _on_sweep_result(self, result):
+        records, originals = result
+        self.status_label.setText(f"Sweep of {len(records)} combinations done")
+        dialog = SweepDialog(records, originals[0], self.apply_params, self)
+        dialog.show()
+
+    def _on_sweep_finished(self):
+        self.sweep_job = None
+        self.sweep_button.setEnabled(self.cinemadng is not None)
+
+    def apply_params(self, params):
+        """Set the controls to a sweep combination"""
+        self.radius_slider.setValue(params["frame_radius"])
+        self.align_checkbox.setChecked(params["align"])
+        self.winsize_spinbox.setValue(params["winsize"])
+        self.iterations_spinbox.setValue(params["iterations"])
+        self.pyr_scale_spinbox.setValue(params["pyr_scale"])
+        self.levels_spinbox.setValue(params["levels"])
+        self.poly_n_spinbox.setValue(params["poly_n"])
+        self.poly_sigma_spinbox.setValue(params["poly_sigma"])
+        for combo, value in ((self.median_combo, params["spatial_median"]), (self.merge_combo, params["merge"]),
+                             (self.flow_scale_combo, params["flow_scale"]), (self.align_backend_combo, params["align_backend"])):
+            index = combo.findData(value)
+            if index < 0:
+                # A median size typed into the sweep that the combo does not list yet
+                combo.addItem(f"{value}x{value}" if combo is self.median_combo else str(value), value)
+                index = combo.count() - 1
+            combo.setCurrentIndex(index)
+        logger.info(f"Applied sweep settings {params}")
+
+    def closeEvent(self, event):
+        self._cancel_preview()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        if self.sweep_job is not None:
+            self.sweep_job.cancel()
+        self.preview_pool.waitForDone()
+        self.export_pool.waitForDone()
+        super().closeEvent(event)
+
+def _to_pixmap(image):
+    """QPixmap of an RGB frame, float (0..1) or uint8"""
+    if image.dtype != np.uint8:
+        image = (image * 255).clip(0, 255).astype(np.uint8)
+    if image.ndim == 2:
+        image = np.stack([image] * 3, axis=-1)
+    image = np.ascontiguousarray(image)
+    height, width, channel = image.shape
+    return QPixmap.fromImage(QImage(image.data, width, height, width * channel, QImage.Format_RGB888).copy())
+
+class SweepDialog(QDialog):
+    """Grid of the results of a parameter sweep, with their timings and noise levels"""
+
+    def __init__(self, records, original, apply, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Parameter Sweep")
+        self.resize(1100, 800)
+        self.records = records
+        self.original = original
+        layout = QVBoxLayout()
+        grid = QGridLayout()
+        # The caption shows only what differs between the results
+        varying = [name for name in records[0]["params"] if len({repr(record["params"][name]) for record in records}) > 1]
+        columns = max(1, int(np.ceil(np.sqrt(len(records) + 1))))
+        cells = [(original, "Input", None)] + [
+            (record["denoised"][0],
+             "\n".join([", ".join(f"{name} {record['params'][name]}" for name in varying) or "Current settings",
+                        f"{1000 * (record['align_seconds'] + record['merge_seconds']):.0f} ms, noise {record['noise']:.4f}"]),
+             record["params"])
+            for record in records
+        ]
+        for n, (image, caption, params) in enumerate(cells):
+            cell = QVBoxLayout()
+            thumbnail = QLabel()
+            thumbnail.setPixmap(_to_pixmap(image).scaled(320, 240, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+            cell.addWidget(thumbnail)
+            cell.addWidget(QLabel(caption))
+            if params is not None:
+                use_button = QPushButton("Use These Settings")
+                use_button.clicked.connect(lambda checked=False, params=params: apply(params))
+                cell.addWidget(use_button)
+            grid.addLayout(cell, n // columns, n % columns)
+        content = QWidget()
+        content.setLayout(grid)
+        scroll = QScrollArea()
+        scroll.setWidget(content)
+        scroll.setWidgetResizable(True)
+        layout.addWidget(scroll)
+        save_button = QPushButton("Save Contact Sheet...")
+        save_button.clicked.connect(self.save_contact_sheet)
+        layout.addWidget(save_button)
+        self.setLayout(layout)
+
+    def save_contact_sheet(self):
+        try:
+            path, _ = QFileDialog.getSaveFileName(self, "Save Contact Sheet", "contact_sheet.png", "Images (*.png *.jpg)")
+            if path:
+                write_contact_sheet(path, contact_sheet(self.records, self.original))
+                logger.info(f"Saved contact sheet to {path}")
+        except Exception as e:
+            logger.error(f"Failed to save contact sheet: {e}")
+
+def _denoise_preview(cinemadng, request, progress=None, cancel=None):
+    """Preview job body, run on a worker thread"""
+    denoised = cinemadng.denoise(
+        preview_size=request["preview_size"],
+        cancel=cancel,
+        **request["params"]
+    )
+    return request, denoised
+
 def main():
+    logging.basicConfig(level=logging.INFO)
     app = QApplication(sys.argv)
     window = MainWindow()
     window.show()
@@ -0,0 +1,119 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "export_manifest.jsonl"
+
+
+def manifest_name(shard=None):
+    """File name of the manifest of a whole-clip export, or of the shard (start, end) of a clip."""
+    if shard is None:
+        return MANIFEST_NAME
+    start, end = shard
+    return f"export_manifest.{start}-{end}.jsonl"
+
+
+def params_hash(params):
+    """Stable hash of the parameters that affect the rendered output."""
+    return hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_fingerprint(path):
+    """Cheap identity of an input file: its name, size and modification time (None if missing)."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return hashlib.sha1(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns}".encode()).hexdigest()[:16]
+
+
+class ExportManifest:
+    """Per-frame completion log kept in the export output directory.
+
+    The manifest is a JSON-lines file: a header with the parameters hash, then
+    one line per completed frame with the fingerprints of its input window, the
+    output file name and its size. Appending one line per frame keeps the file
+    valid if the process is killed mid-export; a truncated last line is dropped
+    on load.
+    If the parameters hash changes, previous entries are discarded.
+
+    A shard (start, end) of a clip keeps its own file, manifest_name(shard), so
+    render nodes writing to one output directory never write to each other's
+    manifests. The entries of the other manifests in the directory with the
+    same parameters are read as well (and never modified), so a later run over
+    other ranges also skips the frames they completed.
+    """
+
+    def __init__(self, output_dir, params, shard=None):
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, manifest_name(shard))
+        self.params_hash = params_hash(params)
+        self.entries = {}
+        self._lock = threading.Lock()
+        os.makedirs(output_dir, exist_ok=True)
+        for name in sorted(os.listdir(output_dir)):
+            path = os.path.join(output_dir, name)
+            if path != self.path and name.startswith("export_manifest") and name.endswith(".jsonl"):
+                self.entries.update(self._load(path) or {})
+        entries = self._load(self.path, own=True)
+        if entries is None:
+            with open(self.path, "w") as f:
+                f.write(json.dumps({"params_hash": self.params_hash, "params": params}, sort_keys=True, default=str) + "\n")
+        else:
+            self.entries.update(entries)
+
+    def _load(self, path, own=False):
+        """Entries of the manifest at path, or None if it is missing or for other parameters.
+
+        Only this export's own manifest (own=True) is repaired: another
+        shard's may have a line that is still being appended.
+        """
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        if own and data and not data.endswith(b"\n"):
+            # Drop the line a kill cut off, so the next entry is not appended to it
+            data = data[:data.rfind(b"\n") + 1]
+            with open(path, "r+b") as f:
+                f.truncate(len(data))
+        lines = data.decode(errors="replace").splitlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return None
+        if header.get("params_hash") != self.params_hash:
+            if own:
+                logger.info(f"Export parameters changed; discarding manifest {path}")
+            return None
+        entries = {}
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Interrupted write
+            entries[entry["frame"]] = entry
+        logger.debug(f"Loaded {len(entries)} completed frames from {path}")
+        return entries
+
+    def is_done(self, frame_idx, inputs):
+        """True if frame_idx was rendered from the same inputs and its output is intact."""
+        entry = self.entries.get(frame_idx)
+        if entry is None or entry["inputs"] != list(inputs):
+            return False
+        try:
+            return os.path.getsize(os.path.join(self.output_dir, entry["output"])) == entry["size"]
+        except OSError:
+            return False
+
+    def record(self, frame_idx, inputs, output_path):
+        entry = {"frame": frame_idx, "inputs": list(inputs), "output": os.path.basename(output_path), "size": os.path.getsize(output_path)}
+        with self._lock:
+            self.entries[frame_idx] = entry
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry) + "\n")
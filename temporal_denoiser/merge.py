@@ -0,0 +1,269 @@
+import numpy as np
+import cv2
+import logging
+from temporal_denoiser.frames import to_float32
+
+logger = logging.getLogger(__name__)
+
+# Laplacian-like mask whose response to a smooth image is ~0 (Immerkaer, 1996)
+_NOISE_MASK = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+
+class MeanMerger:
+    """Temporal mean of a window of frames without per-frame allocation.
+
+    Frames are added in place into a preallocated float64 accumulator and the
+    mean is divided into a reusable float32 buffer, instead of stacking the
+    window into a new (2r+1, H, W, 3) array for np.mean. Summing in float64 is
+    exact for frames decoded from 8- or 16-bit data, so the result does not
+    depend on summation order and matches RunningMean bit for bit. Compact
+    (uint16 or float16) frames are promoted to float32 one at a time.
+    """
+
+    def __init__(self):
+        self._acc = None
+        self._out = None
+        self._promoted = None
+
+    def _buffers(self, shape):
+        if self._acc is None or self._acc.shape != shape:
+            self._acc = np.empty(shape, dtype=np.float64)
+            self._out = np.empty(shape, dtype=np.float32)
+        return self._acc, self._out
+
+    def _float(self, frame):
+        if frame.dtype == np.float32:
+            return frame
+        if self._promoted is None or self._promoted.shape != frame.shape:
+            self._promoted = np.empty(frame.shape, dtype=np.float32)
+        return to_float32(frame, self._promoted)
+
+    def mean(self, frames, out=None):
+        """Return the mean of frames.
+
+        Without out the result is an internal buffer that the next call
+        overwrites; pass out if the result has to outlive it.
+        """
+        acc, buf = self._buffers(frames[0].shape)
+        np.copyto(acc, self._float(frames[0]))
+        for frame in frames[1:]:
+            np.add(acc, self._float(frame), out=acc)
+        return np.divide(acc, len(frames), out=buf if out is None else out)
+
+    def merge(self, frames, ref, out=None, noise_sigma=None):
+        """Kernel interface shared with KernelMerger; the plain mean ignores the reference and noise level."""
+        return self.mean(frames, out=out)
+
+
+class RunningMean:
+    """Sliding box-filter mean over an unaligned window of frames.
+
+    When the window moves by one frame, the incoming frame is added to a float64
+    running sum and the outgoing one subtracted, so each output frame costs two
+    frame operations instead of 2r+1. The running sum keeps a reference to each
+    frame it contains, so frames can be subtracted after the caller has evicted
+    them from its window. Compact frames are promoted to float32 as they are
+    added and again as they are subtracted, which gives the same values.
+    """
+
+    def __init__(self):
+        self._sum = None
+        self._out = None
+        self._promoted = None
+        self._frames = {}  # Frame index -> frame currently included in the sum
+
+    def _float(self, frame):
+        if frame.dtype == np.float32:
+            return frame
+        if self._promoted is None or self._promoted.shape != frame.shape:
+            self._promoted = np.empty(frame.shape, dtype=np.float32)
+        return to_float32(frame, self._promoted)
+
+    def mean(self, window, first_idx, lo, hi, out=None):
+        """Return the mean of frames lo..hi-1, where window[0] is frame first_idx.
+
+        As with MeanMerger.mean, the result is an internal buffer unless out is given.
+        """
+        shape = window[0].shape
+        if self._sum is None or self._sum.shape != shape:
+            self._sum = np.zeros(shape, dtype=np.float64)
+            self._out = np.empty(shape, dtype=np.float32)
+            self._frames = {}
+        elif not any(lo <= idx < hi for idx in self._frames):
+            # No overlap with the previous window (e.g. a new shard); start over
+            self._sum.fill(0.0)
+            self._frames = {}
+        for idx in [idx for idx in self._frames if not lo <= idx < hi]:
+            np.subtract(self._sum, self._float(self._frames.pop(idx)), out=self._sum)
+        for idx in range(lo, hi):
+            if idx not in self._frames:
+                frame = window[idx - first_idx]
+                np.add(self._sum, self._float(frame), out=self._sum)
+                self._frames[idx] = frame
+        return np.divide(self._sum, hi - lo, out=self._out if out is None else out)
+
+
+def channel_mean(frame):
+    """Per-pixel mean of the colour channels as a float32 (h, w) array."""
+    if frame.ndim == 2:
+        return to_float32(frame)
+    channels = frame.shape[2]
+    return cv2.transform(to_float32(frame), np.full((1, channels), 1.0 / channels, dtype=np.float32))
+
+
+def estimate_noise(frame):
+    """Estimate the standard deviation of white noise in the channel mean of frame.
+
+    Uses Immerkaer's fast method on every other pixel, which is cheap enough to
+    run once per output frame.
+    """
+    luma = channel_mean(frame[::2, ::2])
+    if min(luma.shape) < 3:
+        return 0.0
+    response = cv2.filter2D(luma, -1, _NOISE_MASK)[1:-1, 1:-1]
+    return float(np.sqrt(np.pi / 2) * np.abs(response).mean() / 6.0)
+
+
+def _difference_energy(frame, ref):
+    """Squared difference of the channel means of frame and ref, averaged over a 5x5 neighbourhood.
+
+    Uses the same channel mean as estimate_noise, so pure noise gives about 2 * sigma^2.
+    """
+    diff = channel_mean(frame) - channel_mean(ref)
+    return cv2.blur(diff * diff, (5, 5))
+
+
+def _expand(weight, frame):
+    return weight[:, :, np.newaxis] if frame.ndim == 3 else weight
+
+
+def weighted_mean(frames, ref, out, noise_sigma=None, strength=3.0):
+    """Mean weighted by alignment residual: pixels that still differ from the reference after
+    alignment (occlusions, flow failures) get weight exp(-residual^2 / (strength * sigma)^2)."""
+    reference = to_float32(frames[ref])
+    sigma = estimate_noise(reference) if noise_sigma is None else noise_sigma
+    h2 = max((strength * sigma) ** 2, 1e-12)
+    acc = reference.astype(np.float32, copy=True)
+    total = np.ones(reference.shape[:2], dtype=np.float32)
+    for i, frame in enumerate(frames):
+        if i == ref:
+            continue
+        frame = to_float32(frame)
+        weight = np.exp(-_difference_energy(frame, reference) / h2)
+        acc += _expand(weight, frame) * frame
+        total += weight
+    return np.divide(acc, _expand(total, acc), out=out)
+
+
+def wiener_merge(frames, ref, out, noise_sigma=None, strength=8.0):
+    """Pairwise Wiener-style merge: each neighbour moves the reference by (1 - A) of its
+    difference, with A = d^2 / (d^2 + strength * sigma^2) from the local difference energy d^2."""
+    reference = to_float32(frames[ref])
+    sigma = estimate_noise(reference) if noise_sigma is None else noise_sigma
+    c = max(strength * sigma * sigma, 1e-12)
+    acc = np.zeros(reference.shape, dtype=np.float32)
+    for i, frame in enumerate(frames):
+        if i == ref:
+            continue
+        frame = to_float32(frame)
+        energy = _difference_energy(frame, reference)
+        shrink = _expand(c / (energy + c), frame)
+        acc += shrink * (frame - reference)
+    acc /= len(frames)
+    return np.add(reference, acc, out=out)
+
+
+def sort_frames(stack, tmp=None):
+    """Sort a (n, ...) stack of frames per pixel along axis 0, in place.
+
+    Uses an odd-even transposition network of elementwise minimum/maximum over
+    whole frames, which for the small n of a temporal window is several times
+    faster than np.sort or np.median along the (strided) frame axis.
+    """
+    n = stack.shape[0]
+    if tmp is None:
+        tmp = np.empty(stack.shape[1:], dtype=stack.dtype)
+    for p in range(n):
+        for i in range(p % 2, n - 1, 2):
+            np.minimum(stack[i], stack[i + 1], out=tmp)
+            np.maximum(stack[i], stack[i + 1], out=stack[i + 1])
+            stack[i] = tmp
+    return stack
+
+
+def trimmed_mean(stack, out, trim=0.2, tmp=None):
+    """Per-pixel mean after dropping the trim fraction of lowest and highest values (at least one each when possible)."""
+    n = stack.shape[0]
+    k = max(1, int(n * trim)) if n >= 3 else 0
+    if k > 0:
+        sort_frames(stack, tmp)
+    return np.mean(stack[k:n - k], axis=0, out=out)
+
+
+def temporal_median(stack, out, tmp=None):
+    n = stack.shape[0]
+    sort_frames(stack, tmp)
+    if n % 2:
+        np.copyto(out, stack[n // 2])
+        return out
+    np.add(stack[n // 2 - 1], stack[n // 2], out=out)
+    return np.multiply(out, 0.5, out=out)
+
+
+# Merge kernels selectable by name from the API, the CLI and the UI
+MERGE_KERNELS = ("mean", "weighted", "trimmed", "median", "wiener")
+# Pixels of context each kernel reads around an output pixel (the 5x5 blur of _difference_energy);
+# tiles need this much overlap to merge exactly as whole frames do
+KERNEL_HALO = {"weighted": 2, "wiener": 2}
+
+
+class KernelMerger:
+    """Applies one of the robust merge kernels to a window of aligned frames.
+
+    weighted and wiener compare every frame with the reference frame; trimmed
+    and median work on a stack of the window kept in a reused buffer. Compact
+    frames are promoted to float32 as they are read. kwargs are passed to the
+    kernel function (e.g. noise_sigma, strength, trim).
+    """
+
+    def __init__(self, kernel, **kwargs):
+        if kernel not in MERGE_KERNELS:
+            raise ValueError(f"Unknown merge kernel {kernel!r}, expected one of {', '.join(MERGE_KERNELS)}")
+        self.kernel = kernel
+        self.kwargs = kwargs
+        self._stack = None
+        self._tmp = None
+        self._out = None
+
+    def merge(self, frames, ref, out=None, noise_sigma=None):
+        """Merge frames; noise_sigma, if given, replaces the noise estimated from the reference (e.g. for a tile of it)."""
+        shape = frames[0].shape
+        if self._out is None or self._out.shape != shape:
+            self._out = np.empty(shape, dtype=np.float32)
+            self._tmp = np.empty(shape, dtype=np.float32)
+        if out is None:
+            out = self._out
+        kwargs = self.kwargs if noise_sigma is None else dict(self.kwargs, noise_sigma=noise_sigma)
+        if self.kernel == "weighted":
+            return weighted_mean(frames, ref, out, **kwargs)
+        if self.kernel == "wiener":
+            return wiener_merge(frames, ref, out, **kwargs)
+        # Keep the largest stack seen; shorter windows at the clip edges use a slice of it
+        if self._stack is None or self._stack.shape[1:] != shape or self._stack.shape[0] < len(frames):
+            self._stack = np.empty((len(frames),) + shape, dtype=np.float32)
+        stack = self._stack[:len(frames)]
+        for i, frame in enumerate(frames):
+            if frame.dtype == np.float32:
+                stack[i] = frame
+            else:
+                to_float32(frame, stack[i])
+        if self.kernel == "trimmed":
+            return trimmed_mean(stack, out, tmp=self._tmp, **self.kwargs)
+        return temporal_median(stack, out, tmp=self._tmp)
+
+
+def make_merger(kernel="mean", **kwargs):
+    """Return a merger for kernel: MeanMerger for the plain mean, otherwise a KernelMerger."""
+    if kernel == "mean":
+        return MeanMerger()
+    return KernelMerger(kernel, **kwargs)
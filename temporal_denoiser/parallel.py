@@ -0,0 +1,216 @@
+import numpy as np
+import cv2
+import os
+import time
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from temporal_denoiser.denoise import DenoiseCore, JobCancelled, check_cancelled, load_image
+from temporal_denoiser.writer import FrameWriter, prepare_frame, encode_frame
+from temporal_denoiser.profiling import NULL_PROFILER, Profiler, timed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 32
+
+
+def _init_worker():
+    # One OpenCV thread per process, the pool provides the parallelism
+    cv2.setNumThreads(1)
+
+
+def _denoise_chunk(shm_name, shape, first_idx, start, end, frame_radius, spatial_median, align, flow_params, reuse_flow, refine_flow, initial_flow, merge, tile_mb, window_dtype, output_format, profile):
+    """Denoise frames start..end-1 from a chunk of decoded frames held in shared memory.
+
+    The chunk starts at frame first_idx and includes frame_radius frames of
+    overlap on each side, stored as window_dtype. Returns a list of (encoded
+    bytes, encode seconds) for each output frame in order, and the snapshot
+    of the chunk's Profiler if profile is not None (True also keeps its spans).
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        frames = np.ndarray(shape, dtype=window_dtype, buffer=shm.buf)
+        pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flow_scale, align_backend = flow_params
+        core = DenoiseCore(frame_radius, spatial_median, align, winsize, iterations, pyr_scale, levels, poly_n, poly_sigma, reuse_flow, refine_flow, flow_scale, align_backend, initial_flow, merge, tile_mb, window_dtype)
+        profiler = Profiler(trace=profile) if profile is not None else NULL_PROFILER
+        core.set_profiler(profiler)
+        encoded = []
+        for frame_idx, denoised in core.denoise_range(frames, start, end, first_idx):
+            started = time.perf_counter()
+            image = prepare_frame(denoised, output_format)
+            prepared = time.perf_counter()
+            data = encode_frame(image, output_format)
+            finished = time.perf_counter()
+            profiler.record("prepare", started, prepared)
+            profiler.record("encode", prepared, finished)
+            encoded.append((data, finished - started))
+        # Release every view of the shared buffer (the core's running sum holds some) before closing it
+        del frames, core
+        # The parent already timed decoding and converting these frames; reading them from the chunk is not a decode
+        return encoded, profiler.snapshot(exclude=("decode", "convert")) if profile is not None else None
+    finally:
+        shm.close()
+
+
+class ParallelExporter:
+    """Export engine that denoises contiguous chunks of frames in a process pool.
+
+    Frames are decoded in the calling process and handed to workers through
+    shared memory. Each chunk carries frame_radius frames of overlap at its edges,
+    so every output frame sees exactly the same window as in StreamExporter and
+    the written files are identical to the serial path (with initial_flow, the
+    warm start restarts at each chunk, so frames there may differ slightly).
+    Frames are encoded in the workers; the encoded files are written in frame
+    order as chunks complete by a FrameWriter thread pool, whose timings are in
+    write_stats afterwards.
+
+    At most max_in_flight chunks (default: one per worker) are in the pool at
+    once, each a shared memory copy of chunk_size + 2 * frame_radius decoded
+    frames, while the next chunk is buffered in the calling process. The
+    decoded frames held at the peak are therefore
+
+        (max_in_flight + 1) * (chunk_size + 2 * frame_radius) * frame bytes
+
+    with frame bytes = width * height * 3 * the window_dtype item size, on top
+    of each worker's denoising working set (see tile_mb) and the encoded frames
+    of the chunk being written. With memory_mb set, chunk_size and
+    max_in_flight are instead derived from the first decoded frame so that this
+    peak stays within about memory_mb megabytes (chunk_size is then an upper
+    bound); fewer chunks are kept in flight before chunks get shorter than
+    their overlap.
+    """
+
+    def __init__(self, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, writers=2, memory_mb=None, max_in_flight=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = max(1, chunk_size)
+        self.writers = writers
+        self.memory_mb = memory_mb
+        self.max_in_flight = max(1, max_in_flight or self.workers)
+        self.write_stats = None
+
+    def plan(self, frame_bytes, frame_radius):
+        """The (chunk_size, max_in_flight) export uses for frames of frame_bytes, within memory_mb if set."""
+        if self.memory_mb is None:
+            return self.chunk_size, self.max_in_flight
+        budget = int(self.memory_mb * 2**20 // frame_bytes)  # Frames that fit in the budget
+        overlap = 2 * frame_radius
+        for in_flight in range(self.max_in_flight, 0, -1):
+            chunk_size = min(self.chunk_size, budget // (in_flight + 1) - overlap)
+            if chunk_size >= max(1, overlap) or chunk_size == self.chunk_size:
+                return chunk_size, in_flight
+        chunk_size = max(1, min(self.chunk_size, budget // 2 - overlap))
+        if budget // 2 - overlap < 1:
+            logger.warning(f"A memory budget of {self.memory_mb} MB does not cover one chunk of {overlap + 1} frames of {frame_bytes / 2**20:.0f} MB plus its successor; using one-frame chunks")
+        return chunk_size, 1
+
+    def export(self, images, output_dir, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32", output_format="png", progress=None, cancel=None, first_frame=0, start=None, end=None, frame_done=None, profiler=None):
+        # first_frame/start/end select a shard of a longer clip, frame_done reports written files and profiler times every step, as in StreamExporter.export
+        # Workers profile into profilers of their own, whose totals (and spans, when tracing) are merged into profiler
+        logger.debug(f"Exporting denoised images to {output_dir} with {self.workers} workers, chunk_size={self.chunk_size}, memory_mb={self.memory_mb}, radius {frame_radius}, align={align}")
+        flow_params = (pyr_scale, levels, winsize, iterations, poly_n, poly_sigma, flow_scale, align_backend)
+        profile = profiler.trace if profiler is not None else None
+        options = (frame_radius, spatial_median, align, flow_params, reuse_flow, refine_flow, initial_flow, merge, tile_mb, window_dtype, output_format, profile)
+        profiler = profiler or NULL_PROFILER
+        writer = FrameWriter(output_dir, output_format, self.writers, progress=progress, frame_done=frame_done, profiler=profiler)
+        self.write_stats = writer.stats
+        pending = deque()
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker) as pool:
+                buffered = []  # Decoded frames first_idx .. first_idx + len(buffered) - 1
+                first_idx = first_frame
+                chunk_start = first_frame if start is None else start
+                chunk_size = None  # Planned from the size of the first decoded frame
+                # Decoding happens as the images iterable (typically a generator) is advanced
+                for img in timed(images, profiler, "decode"):
+                    check_cancelled(cancel)
+                    if end is not None and chunk_start >= end:
+                        break
+                    with profiler.stage("convert"):
+                        frame = load_image(img, window_dtype)
+                    if frame is None:
+                        # Skipping it would shift every later frame onto the wrong number
+                        raise ValueError(f"Frame {first_idx + len(buffered)} cannot be loaded")
+                    if chunk_size is None:
+                        os.makedirs(output_dir, exist_ok=True)
+                        chunk_size, max_in_flight = self.plan(frame.nbytes, frame_radius)
+                        peak = (max_in_flight + 1) * (chunk_size + 2 * frame_radius) * frame.nbytes
+                        logger.info(f"Parallel export in chunks of {chunk_size} frames, {max_in_flight} in flight, holding up to {peak / 2**20:.1f} MB of decoded frames")
+                    buffered.append(frame)
+                    chunk_end = chunk_start + chunk_size
+                    if end is not None:
+                        chunk_end = min(chunk_end, end)
+                    if first_idx + len(buffered) < chunk_end + frame_radius:
+                        continue
+                    # Bound the chunks in flight, and with them the shared memory, before adding one
+                    while len(pending) >= max_in_flight:
+                        self._write_chunk(pending.popleft(), writer, profiler)
+                    pending.append(self._submit(pool, buffered, first_idx, chunk_start, chunk_end, options))
+                    chunk_start = chunk_end
+                    # Keep only the overlap the next chunk needs
+                    drop = chunk_start - frame_radius - first_idx
+                    if drop > 0:
+                        del buffered[:drop]
+                        first_idx += drop
+
+                total = first_idx + len(buffered)
+                if end is not None:
+                    total = min(total, end)
+                if total == first_frame:
+                    writer.close()
+                    logger.warning("No valid images to export")
+                    return
+                if chunk_start < total:
+                    while len(pending) >= max_in_flight:
+                        self._write_chunk(pending.popleft(), writer, profiler)
+                    pending.append(self._submit(pool, buffered, first_idx, chunk_start, total, options))
+                while pending:
+                    check_cancelled(cancel)
+                    self._write_chunk(pending.popleft(), writer, profiler)
+            writer.close()
+            logger.info(f"Exported {writer.written} denoised images to {output_dir}")
+        except JobCancelled:
+            logger.info(f"Export to {output_dir} cancelled")
+            for future, _, _ in pending:
+                future.cancel()
+            writer.close(check=False)
+            raise
+        except Exception as e:
+            writer.close(check=False)
+            logger.error(f"Parallel export failed: {e}")
+            import traceback
+            logger.debug(f"Full traceback: {traceback.format_exc()}")
+            raise
+        finally:
+            for _, shm, _ in pending:
+                shm.close()
+                shm.unlink()
+
+    def _submit(self, pool, buffered, first_idx, start, end, options):
+        frame_radius = options[0]
+        lo = max(first_idx, start - frame_radius)
+        hi = min(first_idx + len(buffered), end + frame_radius)
+        frames = buffered[lo - first_idx:hi - first_idx]
+        shape = (len(frames),) + frames[0].shape
+        # Frames keep their window storage type, so compact windows also halve the shared memory
+        dtype = frames[0].dtype
+        shm = shared_memory.SharedMemory(create=True, size=int(np.prod(shape)) * dtype.itemsize)
+        chunk = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        for i, frame in enumerate(frames):
+            chunk[i] = frame
+        del chunk
+        logger.debug("Submitting frames %d-%d (inputs %d-%d)", start, end - 1, lo, hi - 1)
+        future = pool.submit(_denoise_chunk, shm.name, shape, lo, start, end, *options)
+        return future, shm, start
+
+    def _write_chunk(self, item, writer, profiler):
+        future, shm, start = item
+        try:
+            encoded, profile = future.result()
+        finally:
+            shm.close()
+            shm.unlink()
+        if profile is not None:
+            profiler.merge(profile)
+        for i, (data, encode_seconds) in enumerate(encoded):
+            writer.submit(start + i, data=data, encode_seconds=encode_seconds)
@@ -0,0 +1,303 @@
+import os
+import time
+import numpy as np
+import queue
+import logging
+import threading
+from collections import deque
+from temporal_denoiser.denoise import DenoiseCore, JobCancelled, load_image
+from temporal_denoiser.writer import FrameWriter
+from temporal_denoiser.merge import make_merger
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class StageStats:
+    """Throughput counters for one pipeline stage."""
+
+    def __init__(self, name, workers):
+        self.name = name
+        self.workers = workers
+        self.items = 0
+        self.busy = 0.0  # Seconds spent in the stage function, summed over workers
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def record(self, start, end, blocked=0.0):
+        with self._lock:
+            self.items += 1
+            self.busy += end - start - blocked
+            if self.started is None:
+                self.started = start
+            self.finished = end
+
+    def as_dict(self):
+        wall = (self.finished - self.started) if self.started is not None else 0.0
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 4),
+            "items_per_second": round(self.items / wall, 3) if wall > 0 else None,
+            # Fraction of the stage's worker capacity in use; the busiest stage limits the job
+            "utilization": round(self.busy / (wall * self.workers), 3) if wall > 0 else None,
+        }
+
+
+class Stage:
+    """A pool of worker threads reading from a bounded input queue.
+
+    func(item, emit) processes one item and calls emit() for each result, which
+    blocks when the next stage's queue is full. finish(emit), if given, runs once
+    after the end of the stream (single-worker stages only).
+    """
+
+    def __init__(self, name, func, workers=1, maxsize=4, finish=None):
+        self.name = name
+        self.func = func
+        self.finish = finish
+        self.input = queue.Queue(maxsize)
+        self.output = None
+        self.stats = StageStats(name, workers)
+        self.error = None
+        self._local = threading.local()
+        self._threads = [threading.Thread(target=self._run, name=f"{name}-{i}", daemon=True) for i in range(workers)]
+
+    def _emit(self, item):
+        if self.output is not None:
+            start = time.perf_counter()
+            self.output.put(item)
+            # Time blocked on a full downstream queue is backpressure, not work
+            self._local.blocked += time.perf_counter() - start
+
+    def _run(self):
+        while True:
+            item = self.input.get()
+            if item is _STOP:
+                break
+            if self.error is not None:
+                continue  # Drain so upstream stages never block
+            self._local.blocked = 0.0
+            start = time.perf_counter()
+            try:
+                self.func(item, self._emit)
+            except Exception as e:
+                logger.error(f"Pipeline stage {self.name} failed: {e}")
+                self.error = e
+                continue
+            self.stats.record(start, time.perf_counter(), self._local.blocked)
+        if self.finish is not None and self.error is None:
+            self._local.blocked = 0.0
+            try:
+                self.finish(self._emit)
+            except Exception as e:
+                logger.error(f"Pipeline stage {self.name} failed: {e}")
+                self.error = e
+
+    def start(self):
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        """Signal end of stream and wait until every queued item has been processed."""
+        for _ in self._threads:
+            self.input.put(_STOP)
+        for t in self._threads:
+            t.join()
+
+
+class _WindowFlows:
+    """Flows from one reference frame, precomputed by the window stage."""
+
+    def __init__(self, flows):
+        self._flows = flows
+
+    def flow(self, src, dst):
+        return self._flows[dst]
+
+
+class PipelineExporter:
+    """Export engine running decode, align, merge and encode as concurrent stages.
+
+    Stages are thread pools linked by bounded queues, so decoding and file
+    encoding overlap with compute while backpressure caps the number of frames
+    in flight. A single window stage between decode and align restores frame
+    order and keeps the sliding window of 2 * frame_radius + 1 frames. The align
+    and merge workers run the steps of one DenoiseCore, each worker with its own
+    AlignmentContext or merger. With tile_mb, aligned full frames are never
+    passed between stages: each align worker denoises its frames tile by tile
+    with a core of its own and the merge stage passes them on. Output is
+    identical to StreamExporter (with initial_flow, only when there is a single
+    align worker, since each worker warm-starts from the last frame it aligned).
+    Per-stage counters are available from stats()
+    and per-frame encode timings from write_stats after export.
+    """
+
+    def __init__(self, decode_workers=2, align_workers=None, merge_workers=1, encode_workers=2, queue_size=4):
+        self.decode_workers = decode_workers
+        self.align_workers = align_workers or max(1, (os.cpu_count() or 2) // 2)
+        self.merge_workers = merge_workers
+        self.encode_workers = encode_workers
+        self.queue_size = queue_size
+        self.write_stats = None
+        self._stages = []
+
+    def stats(self):
+        return [stage.stats.as_dict() for stage in self._stages]
+
+    def export(self, images, output_dir, frame_radius, spatial_median, align=True, winsize=15, iterations=3, pyr_scale=0.5, levels=3, poly_n=5, poly_sigma=1.2, reuse_flow=False, refine_flow=False, flow_scale=1.0, align_backend="farneback", initial_flow=False, merge="mean", tile_mb=None, window_dtype="float32", output_format="png", decode=None, progress=None, cancel=None, first_frame=0, start=None, end=None, frame_done=None, profiler=None):
+        """Denoise images into output_dir.
+
+        images is any iterable of inputs; decode, if given, turns each input into
+        an array (e.g. CinemaDNG._decode for DNG paths) on the decode workers.
+        progress(frames_done) is called as frames are written; feeding stops and
+        JobCancelled is raised once the cancel event is set. first_frame, start,
+        end, tile_mb, window_dtype, frame_done and profiler work as in
+        StreamExporter.export; frame_done is called from the encode workers.
+        """
+        logger.debug(f"Pipelined export to {output_dir} with radius {frame_radius}, align={align}, workers decode={self.decode_workers} align={self.align_workers} merge={self.merge_workers} encode={self.encode_workers}")
+        core_args = (frame_radius, spatial_median, align, winsize, iterations, pyr_scale, levels, poly_n, poly_sigma, reuse_flow, refine_flow, flow_scale, align_backend, initial_flow, merge, tile_mb, window_dtype)
+        core = DenoiseCore(*core_args)
+        core.set_profiler(profiler)
+        flows = core.new_flow_cache()
+        os.makedirs(output_dir, exist_ok=True)
+
+        def decode_item(item, emit):
+            seq, img = item
+            try:
+                decoded = img
+                if decode is not None:
+                    with core.profiler.stage("decode"):
+                        decoded = decode(img)
+                with core.profiler.stage("convert"):
+                    frame = load_image(decoded, window_dtype)
+            except Exception as e:
+                raise ValueError(f"Frame {first_frame + seq} ({img}) cannot be decoded: {e}") from e
+            if frame is None:
+                raise ValueError(f"Frame {first_frame + seq} ({img}) cannot be loaded")
+            # A failed frame stops the stream: the window stage never gets past the gap, so no later frame is renumbered
+            emit((seq, frame))
+
+        # Window stage state: reorder buffer plus the sliding window
+        reorder = {}
+        window = deque()
+        state = {"next_seq": 0, "first_idx": first_frame, "frame_idx": first_frame}
+        start = first_frame if start is None else start
+
+        def window_job(frame_idx, emit):
+            if frame_idx < start or (end is not None and frame_idx >= end):
+                return
+            first_idx = state["first_idx"]
+            frames = list(window)
+            window_flows = None
+            if flows is not None:
+                ref_idx = frame_idx - first_idx
+                lo = max(0, ref_idx - frame_radius)
+                hi = min(len(frames), ref_idx + frame_radius + 1)
+                window_flows = _WindowFlows({first_idx + i: flows.flow(frame_idx, first_idx + i) for i in range(lo, hi) if i != ref_idx})
+            emit((frame_idx, frames, first_idx, window_flows))
+
+        def collect(item, emit):
+            seq, frame = item
+            reorder[seq] = frame
+            while state["next_seq"] in reorder:
+                frame = reorder.pop(state["next_seq"])
+                state["next_seq"] += 1
+                window.append(frame)
+                if flows is not None:
+                    flows.add_frame(state["first_idx"] + len(window) - 1, frame)
+                while state["frame_idx"] + frame_radius < state["first_idx"] + len(window):
+                    window_job(state["frame_idx"], emit)
+                    state["frame_idx"] += 1
+                    while state["first_idx"] < state["frame_idx"] - frame_radius:
+                        window.popleft()
+                        state["first_idx"] += 1
+                    if flows is not None:
+                        flows.evict_before(state["first_idx"])
+
+        def flush(emit):
+            if self._stages[0].error is not None:
+                return  # The stream stopped at a failed decode, so this is not the end of the sequence
+            while state["frame_idx"] < state["first_idx"] + len(window):
+                window_job(state["frame_idx"], emit)
+                state["frame_idx"] += 1
+
+        contexts = threading.local()
+
+        def align_item(item, emit):
+            frame_idx, frames, first_idx, window_flows = item
+            if tile_mb is not None:
+                # Tiled: one core per align worker, whose result goes straight to the encode stage
+                if not hasattr(contexts, "core"):
+                    contexts.core = DenoiseCore(*core_args)
+                    contexts.core.set_profiler(profiler)
+                emit((frame_idx, contexts.core.denoise_frame(frames, frame_idx, first_idx, window_flows, out=np.empty(frames[0].shape, dtype=np.float32)), None))
+                return
+            # One alignment context per align worker; the aligned frames go to the merge stage, so no buffer reuse
+            if not hasattr(contexts, "context"):
+                contexts.context = core.new_alignment()
+            aligned = core.align_window(frames, first_idx, frame_idx, window_flows, contexts.context, reuse=False)
+            emit((frame_idx, aligned, frame_idx - max(first_idx, frame_idx - frame_radius)))
+
+        mergers = threading.local()
+
+        def merge_item(item, emit):
+            frame_idx, aligned, ref = item
+            if ref is None:
+                emit((frame_idx, aligned))  # Already denoised in tiles
+                return
+            # One merger per merge worker; the result is handed to the encode stage, so it gets its own buffer
+            if not hasattr(mergers, "merger"):
+                mergers.merger = make_merger(merge)
+            denoised = core.merge_frames(aligned, ref, merger=mergers.merger, out=np.empty(aligned[0].shape, dtype=np.float32))
+            emit((frame_idx, denoised))
+
+        # The encode stage threads are the writer pool; the writer only tracks timings and progress
+        writer = FrameWriter(output_dir, output_format, progress=progress, frame_done=frame_done, profiler=profiler)
+        self.write_stats = writer.stats
+
+        def encode_item(item, emit):
+            frame_idx, denoised = item
+            writer.write(frame_idx, denoised)
+
+        self._stages = [
+            Stage("decode", decode_item, self.decode_workers, self.queue_size),
+            Stage("window", collect, 1, self.queue_size, finish=flush),
+            Stage("align", align_item, self.align_workers, self.queue_size),
+            Stage("merge", merge_item, self.merge_workers, self.queue_size),
+            Stage("encode", encode_item, self.encode_workers, self.queue_size),
+        ]
+        for upstream, downstream in zip(self._stages, self._stages[1:]):
+            upstream.output = downstream.input
+        for stage in self._stages:
+            stage.start()
+
+        try:
+            for seq, img in enumerate(images):
+                if any(stage.error is not None for stage in self._stages):
+                    break
+                if cancel is not None and cancel.is_set():
+                    # Stop feeding; frames already in flight are finished
+                    break
+                self._stages[0].input.put((seq, img))
+        finally:
+            # Shut down front to back so every stage drains its queue
+            for stage in self._stages:
+                stage.stop()
+
+        for stage in self._stages:
+            if stage.error is not None:
+                raise stage.error
+        if cancel is not None and cancel.is_set():
+            logger.info(f"Export to {output_dir} cancelled")
+            raise JobCancelled()
+        if state["frame_idx"] == first_frame:
+            logger.warning("No valid images to export")
+            return
+        writer.close()
+        for entry in self.stats():
+            logger.info(f"Stage {entry['stage']}: {entry['items']} items, {entry['items_per_second']} items/s, utilization {entry['utilization']}")
+        logger.info(f"Exported {self._stages[-1].stats.items} denoised images to {output_dir}")
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import threading
+
+# Steps of a denoise job that are timed, in pipeline order
+STAGES = ("decode", "convert", "gray", "flow", "compose", "remap", "merge", "median", "prepare", "encode", "write")
+
+
+class _Span:
+    __slots__ = ("profiler", "name", "start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.start, time.perf_counter())
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """Per-stage timers and counters for one denoise job.
+
+    Each timed step runs under `with profiler.stage(name):` (see STAGES).
+    Per stage the profiler sums the calls, the seconds and the slowest call;
+    count() keeps named counters and frame() counts output frames for the
+    frames per second. Recording is thread-safe. With trace=True every span
+    is also kept with its process and thread, for write_chrome_trace().
+
+    Worker processes profile into a Profiler of their own and send its
+    snapshot() back, which merge() adds to the job's profiler.
+    """
+
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.started = time.perf_counter()
+        self.finished = None
+        self.frames = 0
+        self._stages = {}  # Stage -> [calls, seconds, slowest call in seconds]
+        self._counters = {}
+        self._spans = []  # (stage, start, end, pid, thread id)
+        self._threads = {}  # (pid, thread id) -> thread name
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Context manager timing one call of stage name."""
+        return _Span(self, name)
+
+    def record(self, name, start, end):
+        """Record a call of stage name that ran from start to end (time.perf_counter() seconds)."""
+        seconds = end - start
+        with self._lock:
+            totals = self._stages.get(name)
+            if totals is None:
+                totals = self._stages[name] = [0, 0.0, 0.0]
+            totals[0] += 1
+            totals[1] += seconds
+            totals[2] = max(totals[2], seconds)
+            if self.trace:
+                thread = threading.current_thread()
+                key = (os.getpid(), thread.ident)
+                if key not in self._threads:
+                    self._threads[key] = thread.name
+                self._spans.append((name, start, end) + key)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def frame(self, n=1):
+        """Count n finished output frames."""
+        with self._lock:
+            self.frames += n
+            self.finished = time.perf_counter()
+
+    def snapshot(self, exclude=()):
+        """Picklable copy of everything recorded except the stages in exclude, for merge()."""
+        with self._lock:
+            return {
+                "stages": {name: list(totals) for name, totals in self._stages.items() if name not in exclude},
+                "counters": dict(self._counters),
+                "spans": [span for span in self._spans if span[0] not in exclude],
+                "threads": dict(self._threads),
+            }
+
+    def merge(self, snapshot):
+        """Add the snapshot() of another profiler (e.g. from a worker process)."""
+        with self._lock:
+            for name, (calls, seconds, slowest) in snapshot["stages"].items():
+                totals = self._stages.setdefault(name, [0, 0.0, 0.0])
+                totals[0] += calls
+                totals[1] += seconds
+                totals[2] = max(totals[2], slowest)
+            for name, n in snapshot["counters"].items():
+                self._counters[name] = self._counters.get(name, 0) + n
+            if self.trace:
+                self._spans.extend(snapshot["spans"])
+                self._threads.update(snapshot["threads"])
+
+    def as_dict(self):
+        """Totals per stage (slowest first) with their share of the profiled time, counters and frames per second."""
+        with self._lock:
+            stages = {name: list(totals) for name, totals in self._stages.items()}
+            counters = dict(self._counters)
+            frames = self.frames
+            wall = (self.finished or time.perf_counter()) - self.started
+        busy = sum(seconds for _, seconds, _ in stages.values())
+        return {
+            "wall_seconds": round(wall, 3),
+            "frames": frames,
+            "frames_per_second": round(frames / wall, 3) if frames and wall > 0 else None,
+            "stages": [
+                {
+                    "stage": name,
+                    "calls": calls,
+                    "seconds": round(seconds, 4),
+                    "ms_per_call": round(1000 * seconds / calls, 3),
+                    "max_ms": round(1000 * slowest, 3),
+                    "share": round(seconds / busy, 3) if busy > 0 else None,
+                }
+                for name, (calls, seconds, slowest) in sorted(stages.items(), key=lambda item: -item[1][1])
+            ],
+            "counters": counters,
+        }
+
+    def chrome_trace(self):
+        """The recorded spans as a Chrome trace (chrome://tracing, Perfetto), in microseconds from the start of the job."""
+        with self._lock:
+            spans = list(self._spans)
+            threads = dict(self._threads)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}} for (pid, tid), name in threads.items()]
+        for name, start, end, pid, tid in spans:
+            events.append({"name": name, "cat": "denoise", "ph": "X", "ts": round(1e6 * (start - self.started), 1), "dur": round(1e6 * (end - start), 1), "pid": pid, "tid": tid})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_json(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+    def write_chrome_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def format_table(self):
+        """The stage totals as a plain-text table, for logs and the UI."""
+        stats = self.as_dict()
+        fps = stats["frames_per_second"]
+        lines = [f"{stats['frames']} frames in {stats['wall_seconds']:.1f} s" + (f" ({fps:.2f} frames/s)" if fps else "")]
+        lines.append(f"{'stage':<8} {'calls':>7} {'seconds':>9} {'ms/call':>9} {'max ms':>9} {'share':>6}")
+        for s in stats["stages"]:
+            lines.append(f"{s['stage']:<8} {s['calls']:>7} {s['seconds']:>9.2f} {s['ms_per_call']:>9.2f} {s['max_ms']:>9.2f} {s['share'] or 0:>6.1%}")
+        return "\n".join(lines)
+
+
+class NullProfiler:
+    """A profiler that records nothing; the default wherever a profiler can be passed."""
+
+    trace = False
+
+    def stage(self, name):
+        return _NULL_SPAN
+
+    def record(self, name, start, end):
+        pass
+
+    def count(self, name, n=1):
+        pass
+
+    def frame(self, n=1):
+        pass
+
+    def merge(self, snapshot):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def timed(iterable, profiler, name):
+    """Iterate over iterable, recording the time each item takes to produce (e.g. a decode in a generator) as stage name."""
+    if profiler is NULL_PROFILER:
+        yield from iterable
+        return
+    items = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(items)
+        except StopIteration:
+            return
+        profiler.record(name, start, time.perf_counter())
+        yield item
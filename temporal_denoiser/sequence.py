@@ -0,0 +1,143 @@
+import os
+import re
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tifffile
+    HAS_TIFFFILE = True
+except Exception:
+    HAS_TIFFFILE = False
+
+# Frame number: the last run of digits in the file name, e.g. A001_C002_0123.dng -> 123
+_FRAME_NUMBER = re.compile(r"(\d+)\D*$")
+# DNG TimeCodes (SMPTE, 8 bytes) and FrameRate tags
+_TIMECODES_TAG = 51043
+_FRAME_RATE_TAG = 51044
+
+_cache = {}  # (directory, use_timecode) -> (directory mtime_ns, SequenceIndex)
+_cache_lock = threading.Lock()
+
+
+def is_dng(name):
+    return name.lower().endswith(".dng")
+
+
+def frame_number(path):
+    """Frame number parsed from the file name of path, or None if it has no digits."""
+    match = _FRAME_NUMBER.search(os.path.splitext(os.path.basename(path))[0])
+    return int(match.group(1)) if match else None
+
+
+def _bcd(value, tens_mask):
+    return ((value >> 4) & tens_mask) * 10 + (value & 0x0F)
+
+
+def timecode_frame(path):
+    """Frame count since 00:00:00:00 from the DNG TimeCodes tag of path, or None if it has none."""
+    if not HAS_TIFFFILE:
+        return None
+    try:
+        with tifffile.TiffFile(path) as tif:
+            tags = tif.pages[0].tags
+            timecode = tags.get(_TIMECODES_TAG)
+            rate = tags.get(_FRAME_RATE_TAG)
+            if timecode is None or rate is None:
+                return None
+            code = bytes(timecode.value)
+            numerator, denominator = rate.value[:2]
+    except Exception as e:
+        logger.debug(f"Cannot read timecode from {path}: {e}")
+        return None
+    fps = round(numerator / denominator) if denominator else 0
+    if len(code) < 4 or fps <= 0:
+        return None
+    frames, seconds, minutes, hours = _bcd(code[0], 0x3), _bcd(code[1], 0x7), _bcd(code[2], 0x7), _bcd(code[3], 0x3)
+    return ((hours * 60 + minutes) * 60 + seconds) * fps + frames
+
+
+class SequenceIndex:
+    """An image sequence ordered by frame number.
+
+    paths and frame_numbers list the frames in order. gaps lists the missing
+    frame numbers as inclusive (first, last) ranges. duplicates maps a frame
+    number claimed by several files to the files that were left out (the first
+    by name is kept). unnumbered lists files without a frame number, which are
+    left out unless no file has one, in which case the sequence is in name order.
+    """
+
+    def __init__(self, entries, duplicates=None, unnumbered=None):
+        self.frame_numbers = [number for number, _ in entries]
+        self.paths = [path for _, path in entries]
+        self.duplicates = duplicates or {}
+        self.unnumbered = unnumbered or []
+        self._positions = {number: i for i, number in enumerate(self.frame_numbers)}
+        self.gaps = [(a + 1, b - 1) for a, b in zip(self.frame_numbers, self.frame_numbers[1:]) if b - a > 1]
+
+    @classmethod
+    def from_paths(cls, paths, use_timecode=False):
+        numbers = None
+        if use_timecode:
+            numbers = [timecode_frame(path) for path in paths]
+            if None in numbers:
+                logger.warning("Not every frame has a DNG timecode; ordering by file name instead")
+                numbers = None
+        if numbers is None:
+            numbers = [frame_number(path) for path in paths]
+        if paths and all(number is None for number in numbers):
+            return cls(list(enumerate(sorted(paths))))
+        unnumbered = sorted(path for path, number in zip(paths, numbers) if number is None)
+        entries = sorted((number, path) for path, number in zip(paths, numbers) if number is not None)
+        kept = []
+        duplicates = {}
+        for number, path in entries:
+            if kept and kept[-1][0] == number:
+                duplicates.setdefault(number, []).append(path)
+            else:
+                kept.append((number, path))
+        index = cls(kept, duplicates, unnumbered)
+        index._warn()
+        return index
+
+    def _warn(self):
+        if self.unnumbered:
+            logger.warning(f"Skipping {len(self.unnumbered)} files without a frame number: {self.unnumbered[:5]}")
+        if self.duplicates:
+            logger.warning(f"{len(self.duplicates)} frame numbers are claimed by more than one file; skipping {sum(len(p) for p in self.duplicates.values())} duplicates, e.g. {next(iter(self.duplicates.values()))[:3]}")
+        if self.gaps:
+            missing = sum(b - a + 1 for a, b in self.gaps)
+            logger.warning(f"Sequence has {len(self.gaps)} gaps ({missing} missing frames): {self.gaps[:5]}")
+
+    def __len__(self):
+        return len(self.paths)
+
+    def position(self, number):
+        """Index in paths of frame number; raises KeyError for frames missing from the sequence."""
+        return self._positions[number]
+
+    def path_for(self, number):
+        return self.paths[self._positions[number]]
+
+
+def index_directory(directory, use_timecode=False):
+    """Index the DNG files (any case of the extension) in directory.
+
+    Indexes are cached per directory and rebuilt when its modification time
+    changes, i.e. when files are added, removed or renamed.
+    """
+    directory = os.path.abspath(directory)
+    mtime = os.stat(directory).st_mtime_ns
+    key = (directory, use_timecode)
+    with _cache_lock:
+        cached = _cache.get(key)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    with os.scandir(directory) as entries:
+        paths = [entry.path for entry in entries if is_dng(entry.name) and entry.is_file()]
+    index = SequenceIndex.from_paths(paths, use_timecode)
+    logger.debug(f"Indexed {len(index)} frames in {directory}")
+    with _cache_lock:
+        _cache[key] = (mtime, index)
+    return index
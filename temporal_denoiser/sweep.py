@@ -0,0 +1,197 @@
+"""Parameter sweeps: denoise a frame or a short range with many parameter combinations in one pass.
+
+Combinations are grouped by the parameters that change the flow. Each group
+aligns the window once, at the largest radius any of its combinations uses,
+and every radius, merge kernel and spatial median of the group is then
+merged from those aligned frames. A merge is shared by the combinations that
+differ only in their median. Results match a preview with the same
+parameters, since each neighbour's flow depends only on the two frames
+(previews do not warm-start flows).
+"""
+import itertools
+import logging
+import time
+import numpy as np
+import cv2
+from temporal_denoiser.denoise import DenoiseCore, check_cancelled, load_image, spatial_median_filter
+from temporal_denoiser.merge import estimate_noise, make_merger
+
+logger = logging.getLogger(__name__)
+
+# Parameters that change the flow; the window is aligned once per distinct combination of them
+FLOW_PARAMS = ("align", "winsize", "iterations", "pyr_scale", "levels", "poly_n", "poly_sigma", "flow_scale", "align_backend")
+SWEEP_DEFAULTS = {
+    "frame_radius": 3,
+    "spatial_median": 0,
+    "merge": "mean",
+    "align": True,
+    "winsize": 15,
+    "iterations": 3,
+    "pyr_scale": 0.5,
+    "levels": 3,
+    "poly_n": 5,
+    "poly_sigma": 1.2,
+    "flow_scale": 1.0,
+    "align_backend": "farneback",
+}
+
+
+def parameter_grid(base=None, **values):
+    """Every combination of the given parameter values, as complete parameter dicts.
+
+    parameter_grid(frame_radius=[2, 3], winsize=[15, 21]) gives four
+    combinations; parameters not given keep their value in base (e.g. the
+    current settings), or their SWEEP_DEFAULTS value.
+    """
+    unknown = set(values) - set(SWEEP_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}, expected some of {', '.join(SWEEP_DEFAULTS)}")
+    base = dict(SWEEP_DEFAULTS, **(base or {}))
+    names = list(values)
+    return [dict(base, **dict(zip(names, combination))) for combination in itertools.product(*(values[name] for name in names))]
+
+
+def sweep(images, frames, combinations, first_idx=0, progress=None, cancel=None):
+    """Denoise frames (a frame number or a range of them) with each parameter combination.
+
+    images is a list of decoded frames (arrays or file paths) whose first
+    element is frame first_idx; it should cover frames plus the largest
+    frame_radius on either side. combinations are dicts of parameters (see
+    parameter_grid); missing ones take their SWEEP_DEFAULTS value.
+
+    Returns one record per combination, in order, with its "params", the
+    "denoised" frames (a list in the order of frames), "align_seconds" (the
+    alignment of its flow group, shared with the other combinations of the
+    group), "merge_seconds" (its merge and median) and "noise", the mean
+    noise level estimate_noise measures in its denoised frames.
+    progress(done) counts finished combinations times frames; the cancel
+    event is checked before each alignment and merge.
+    """
+    frames = [frames] if isinstance(frames, int) else list(frames)
+    combinations = [dict(SWEEP_DEFAULTS, **combination) for combination in combinations]
+    window = []
+    for img in images:
+        frame = load_image(img)
+        if frame is None:
+            raise ValueError("Sweep window contains a frame that cannot be loaded")
+        window.append(frame)
+    if not window:
+        raise ValueError("No frames to sweep")
+    last_idx = first_idx + len(window) - 1
+    frames = [min(max(frame_idx, first_idx), last_idx) for frame_idx in frames]
+
+    records = [{"params": combination, "denoised": [], "align_seconds": 0.0, "merge_seconds": 0.0, "noise": 0.0} for combination in combinations]
+    groups = {}  # Flow parameters -> indices of the combinations that share them
+    for i, combination in enumerate(combinations):
+        groups.setdefault(tuple(combination[name] for name in FLOW_PARAMS), []).append(i)
+    logger.debug("Sweeping %d combinations in %d flow groups over frames %s", len(combinations), len(groups), frames)
+    mergers = {}
+    done = 0
+    for key, members in groups.items():
+        radius = max(combinations[i]["frame_radius"] for i in members)
+        core = DenoiseCore(radius, **dict(zip(FLOW_PARAMS, key)))
+        for frame_idx in frames:
+            check_cancelled(cancel)
+            started = time.perf_counter()
+            aligned = core.align_window(window, first_idx, frame_idx, check=lambda: check_cancelled(cancel))
+            align_seconds = time.perf_counter() - started
+            lo = max(first_idx, frame_idx - radius)  # Frame number of aligned[0]
+            merged = {}  # (radius, kernel) -> merged frame, shared by the medians applied to it
+            for i in members:
+                check_cancelled(cancel)
+                params = combinations[i]
+                r, kernel = params["frame_radius"], params["merge"]
+                started = time.perf_counter()
+                if (r, kernel) not in merged:
+                    start = max(lo, frame_idx - r) - lo
+                    merger = mergers.get(kernel)
+                    if merger is None:
+                        merger = mergers[kernel] = make_merger(kernel)
+                    # Each result keeps its own buffer
+                    merged[r, kernel] = merger.merge(aligned[start:frame_idx + r + 1 - lo], frame_idx - lo - start, out=np.empty(window[0].shape, dtype=np.float32))
+                denoised = spatial_median_filter(merged[r, kernel], params["spatial_median"])
+                record = records[i]
+                record["merge_seconds"] += time.perf_counter() - started
+                record["align_seconds"] += align_seconds
+                record["denoised"].append(denoised)
+                record["noise"] += estimate_noise(denoised) / len(frames)
+                done += 1
+                if progress is not None:
+                    progress(done)
+    return records
+
+
+# Caption layout of contact sheets
+_FONT = cv2.FONT_HERSHEY_SIMPLEX
+_FONT_SCALE = 0.5
+_LINE = 20
+_PAD = 6
+# Short names of the parameters in contact sheet captions
+_LABELS = {"frame_radius": "r", "spatial_median": "med", "merge": "merge", "align": "align", "winsize": "win", "iterations": "it", "pyr_scale": "pyr", "levels": "lev", "poly_n": "n", "poly_sigma": "sig", "flow_scale": "scale", "align_backend": "flow"}
+
+
+def _caption(params, varying):
+    return " ".join(f"{_LABELS[name]}={params[name]}" for name in varying) or "defaults"
+
+
+def contact_sheet(records, original=None, frame=0, columns=None, thumb_width=480):
+    """A contact sheet of the sweep records, as an RGB uint8 image.
+
+    Shows frame (a position in each record's denoised frames), downscaled to
+    thumb_width, with the parameters that differ between records, the time
+    (alignment + merge) and the noise level under each thumbnail. original, if
+    given, is the noisy input of that frame and comes first.
+    """
+    varying = [name for name in SWEEP_DEFAULTS if len({repr(record["params"][name]) for record in records}) > 1]
+    cells = []
+    if original is not None:
+        cells.append((load_image(original), ["input", f"noise {estimate_noise(load_image(original)):.4f}"]))
+    for record in records:
+        cells.append((record["denoised"][frame], [
+            _caption(record["params"], varying),
+            f"{1000 * record['align_seconds']:.0f} + {1000 * record['merge_seconds']:.0f} ms, noise {record['noise']:.4f}",
+        ]))
+    columns = columns or int(np.ceil(np.sqrt(len(cells))))
+    cells = [(image, [wrapped for text in lines for wrapped in _wrap(text, thumb_width - 2 * _PAD)]) for image, lines in cells]
+    h, w = cells[0][0].shape[:2]
+    thumb_height = max(1, int(round(h * thumb_width / w)))
+    cell_height = thumb_height + max(len(lines) for _, lines in cells) * _LINE + _PAD
+    cell_width = thumb_width + _PAD
+    rows = int(np.ceil(len(cells) / columns))
+    sheet = np.full((rows * cell_height, columns * cell_width, 3), 32, dtype=np.uint8)
+    for n, (image, lines) in enumerate(cells):
+        # Each cell is drawn on its own, so no caption runs into the next cell
+        cell = np.full((cell_height, cell_width, 3), 32, dtype=np.uint8)
+        thumb = cv2.resize(image, (thumb_width, thumb_height), interpolation=cv2.INTER_AREA)
+        if thumb.ndim == 2:
+            thumb = np.stack([thumb] * 3, axis=-1)
+        cell[:thumb_height, :thumb_width] = np.clip(thumb * 255, 0, 255)
+        for k, text in enumerate(lines):
+            cv2.putText(cell, text, (_PAD, thumb_height + (k + 1) * _LINE), _FONT, _FONT_SCALE, (235, 235, 235), 1, cv2.LINE_AA)
+        top = (n // columns) * cell_height
+        left = (n % columns) * cell_width
+        sheet[top:top + cell_height, left:left + cell_width] = cell
+    return sheet
+
+
+def _wrap(text, width):
+    """Split text at spaces into lines no wider than width pixels in the caption font."""
+    lines = []
+    for word in text.split(" "):
+        candidate = f"{lines[-1]} {word}" if lines else word
+        if lines and cv2.getTextSize(candidate, _FONT, _FONT_SCALE, 1)[0][0] <= width:
+            lines[-1] = candidate
+        else:
+            lines.append(word)
+    return lines
+
+
+def write_contact_sheet(path, sheet):
+    """Save a contact_sheet image (PNG, JPEG or any format OpenCV writes, by extension)."""
+    if not cv2.imwrite(str(path), cv2.cvtColor(sheet, cv2.COLOR_RGB2BGR)):
+        raise ValueError(f"Could not write contact sheet to {path}")
+
+
+def sweep_summary(records):
+    """The records without their frames, e.g. for JSON."""
+    return [{name: value for name, value in record.items() if name != "denoised"} for record in records]
@@ -0,0 +1,231 @@
+import io
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from temporal_denoiser.profiling import NULL_PROFILER
+
+logger = logging.getLogger(__name__)
+
+try:
+    import tifffile
+    HAS_TIFFFILE = True
+except Exception:
+    HAS_TIFFFILE = False
+
+try:
+    import imagecodecs  # noqa: F401  Provides the zstd and LZW TIFF encoders
+    HAS_IMAGECODECS = True
+except Exception:
+    HAS_IMAGECODECS = False
+
+# Output formats and their file extensions: 16-bit RGB TIFF, 8-bit PNG, or the raw float32 frame as .npy
+OUTPUT_FORMATS = {"tiff": "tif", "png": "png", "npy": "npy"}
+TIFF_COMPRESSIONS = ("none", "zlib", "zstd", "lzw")
+
+
+def parse_format(spec):
+    """Split an output format spec "format[:compression][:level]" into (format, compression, level).
+
+    Examples: "tiff" (uncompressed), "tiff:zstd", "tiff:zlib:6", "png" (OpenCV's
+    default level), "png:1", "npy". Raises ValueError for unknown or unavailable
+    formats, so a bad spec fails before any frame is rendered.
+    """
+    parts = spec.split(":")
+    output_format, options = parts[0], parts[1:]
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+    compression = level = None
+    try:
+        if output_format == "tiff":
+            if not HAS_TIFFFILE:
+                raise ValueError("TIFF output needs tifffile")
+            compression = options[0] if options else "none"
+            if compression not in TIFF_COMPRESSIONS:
+                raise ValueError(f"Unknown TIFF compression {compression!r}, expected one of {', '.join(TIFF_COMPRESSIONS)}")
+            if compression in ("zstd", "lzw") and not HAS_IMAGECODECS:
+                raise ValueError(f"TIFF {compression} compression needs imagecodecs")
+            level = int(options[1]) if len(options) > 1 else None
+            if len(options) > 2:
+                raise ValueError("too many options")
+        elif output_format == "png":
+            level = int(options[0]) if options else None
+            if len(options) > 1 or (level is not None and not 0 <= level <= 9):
+                raise ValueError("PNG takes one compression level from 0 to 9")
+        elif options:
+            raise ValueError(f"{output_format} takes no options")
+    except ValueError as e:
+        raise ValueError(f"Invalid output format {spec!r}: {e}") from None
+    return output_format, compression, level
+
+
+def output_name(frame_idx, output_format="png"):
+    return f"denoised_{frame_idx:06d}.{OUTPUT_FORMATS[parse_format(output_format)[0]]}"
+
+
+def prepare_frame(denoised, output_format="png"):
+    """Convert a float frame to the pixel data written for output_format.
+
+    Always returns a new array, so the caller may reuse its buffer right away.
+    """
+    output_format = parse_format(output_format)[0]
+    if output_format == "tiff":
+        return np.clip(denoised * 65535.0 + 0.5, 0, 65535).astype(np.uint16)
+    if output_format == "png":
+        # Convert back to BGR for OpenCV saving
+        return cv2.cvtColor((denoised * 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
+    return np.array(denoised, dtype=np.float32)
+
+
+def encode_frame(image, output_format="png"):
+    """Encode prepared pixel data (see prepare_frame) to file bytes, or None if encoding fails."""
+    output_format, compression, level = parse_format(output_format)
+    buffer = io.BytesIO()
+    if output_format == "tiff":
+        kwargs = {}
+        if compression != "none":
+            kwargs["compression"] = compression
+            if level is not None:
+                kwargs["compressionargs"] = {"level": level}
+        tifffile.imwrite(buffer, image, photometric="rgb" if image.ndim == 3 else "minisblack", **kwargs)
+    elif output_format == "png":
+        params = [] if level is None else [cv2.IMWRITE_PNG_COMPRESSION, level]
+        success, encoded = cv2.imencode(".png", image, params)
+        return encoded.tobytes() if success else None
+    else:
+        # Readable with np.load(path, mmap_mode="r")
+        np.save(buffer, image)
+    return buffer.getvalue()
+
+
+def save_encoded(data, output_path, frame_idx):
+    """Write encoded frame bytes; returns False (after logging) if the frame could not be written."""
+    try:
+        if data is None:
+            raise ValueError("encoding failed")
+        with open(output_path, "wb") as f:
+            f.write(data)
+    except Exception as e:
+        logger.error(f"Failed to write image: {output_path}: {e}")
+        return False
+    logger.debug("Saved denoised frame %d to %s", frame_idx, output_path)
+    return True
+
+
+class WriteStats:
+    """Per-frame encode and write timings, summed over writer threads."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.encode_seconds = 0.0
+        self.write_seconds = 0.0
+        self.max_encode_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, encode_seconds, write_seconds, nbytes):
+        with self._lock:
+            self.frames += 1
+            self.bytes += nbytes
+            self.encode_seconds += encode_seconds
+            self.write_seconds += write_seconds
+            self.max_encode_seconds = max(self.max_encode_seconds, encode_seconds)
+
+    def as_dict(self):
+        frames = max(self.frames, 1)
+        return {
+            "frames": self.frames,
+            "mb_written": round(self.bytes / 2**20, 2),
+            "encode_ms_per_frame": round(1000 * self.encode_seconds / frames, 2),
+            "max_encode_ms": round(1000 * self.max_encode_seconds, 2),
+            "write_ms_per_frame": round(1000 * self.write_seconds / frames, 2),
+        }
+
+
+class FrameWriter:
+    """Encodes and writes output frames, optionally on a pool of writer threads.
+
+    submit() hands a frame to the writer threads and blocks once queue_size
+    frames are waiting, so encoding applies backpressure instead of buffering
+    the clip in memory. write() does the same work on the calling thread, for
+    callers that already run their own encode threads. progress(frames_done)
+    and frame_done(frame_idx, output_path) are called as frames land on disk.
+    close() waits for every queued frame and re-raises the first encoding error.
+    Conversion, encoding, writes and finished frames are also recorded on
+    profiler, if given (see temporal_denoiser.profiling).
+    """
+
+    def __init__(self, output_dir, output_format="png", workers=2, queue_size=4, progress=None, frame_done=None, profiler=None):
+        parse_format(output_format)
+        self.output_dir = output_dir
+        self.output_format = output_format
+        self.workers = max(1, workers)
+        self.progress = progress
+        self.frame_done = frame_done
+        self.stats = WriteStats()
+        self.profiler = profiler or NULL_PROFILER
+        self.written = 0
+        self._lock = threading.Lock()
+        self._slots = threading.Semaphore(self.workers + queue_size)
+        self._pool = None
+        self._futures = []
+
+    def submit(self, frame_idx, denoised=None, data=None, encode_seconds=0.0):
+        """Queue frame_idx for writing: either a float frame to encode on a writer thread, or
+        data already encoded elsewhere (e.g. in a worker process) together with its encode time."""
+        image = None
+        if data is None:
+            with self.profiler.stage("prepare"):
+                image = prepare_frame(denoised, self.output_format)
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="writer")
+        self._slots.acquire()
+        future = self._pool.submit(self._write, frame_idx, image, data, encode_seconds)
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures = [f for f in self._futures if not f.done() or f.exception() is not None]
+        self._futures.append(future)
+
+    def write(self, frame_idx, denoised):
+        """Encode and write frame_idx on the calling thread."""
+        with self.profiler.stage("prepare"):
+            image = prepare_frame(denoised, self.output_format)
+        self._write(frame_idx, image, None, 0.0)
+
+    def _write(self, frame_idx, image, data, encode_seconds):
+        if data is None:
+            start = time.perf_counter()
+            data = encode_frame(image, self.output_format)
+            end = time.perf_counter()
+            encode_seconds = end - start
+            self.profiler.record("encode", start, end)
+        output_path = os.path.join(self.output_dir, output_name(frame_idx, self.output_format))
+        start = time.perf_counter()
+        if not save_encoded(data, output_path, frame_idx):
+            return
+        end = time.perf_counter()
+        self.stats.record(encode_seconds, end - start, len(data))
+        self.profiler.record("write", start, end)
+        self.profiler.frame()
+        if self.frame_done is not None:
+            self.frame_done(frame_idx, output_path)
+        with self._lock:
+            self.written += 1
+            if self.progress is not None:
+                self.progress(self.written)
+
+    def close(self, check=True):
+        """Wait for queued frames; with check=False (when already failing) errors are only logged."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+        for future in self._futures:
+            error = future.exception()
+            if error is not None:
+                if check:
+                    raise error
+                logger.error(f"Writing a frame failed: {error}")
+        stats = self.stats.as_dict()
+        if stats["frames"]:
+            logger.info(f"Wrote {stats['frames']} frames ({stats['mb_written']} MB): encode {stats['encode_ms_per_frame']} ms/frame (max {stats['max_encode_ms']}), write {stats['write_ms_per_frame']} ms/frame")
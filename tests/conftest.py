@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+from temporal_denoiser.cinemadng import CinemaDNG
+
+
+def _decode(self, path, half_size=False, compact=False):
+    frame = np.load(path)
+    return frame if compact else frame.astype(np.float32) / 65535.0
+
+
+@pytest.fixture
+def clip(tmp_path, monkeypatch):
+    """A 10-frame CinemaDNG clip of a panning noisy texture, decoded from .npy data instead of raw files."""
+    monkeypatch.setattr(CinemaDNG, "_decode", _decode)
+    rng = np.random.default_rng(0)
+    texture = rng.random((48, 80, 3))
+    for k in range(10):
+        frame = np.roll(texture, k, axis=1) + rng.normal(0, 0.02, texture.shape)
+        with open(tmp_path / f"clip_{k:04d}.dng", "wb") as f:
+            np.save(f, (np.clip(frame, 0, 1) * 65535).astype(np.uint16))
+    return CinemaDNG(str(tmp_path))
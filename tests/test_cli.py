@@ -0,0 +1,13 @@
+from temporal_denoiser import cli
+
+
+def test_resumed_frames_do_not_count_towards_fps(clip, tmp_path):
+    entry = {"input": str(tmp_path), "output": str(tmp_path / "out"), "radius": 1, "format": "png"}
+    first = cli.run_clip(entry)
+    assert first["status"] == "ok"
+    assert (first["rendered"], first["skipped"]) == (10, 0)
+
+    second = cli.run_clip(entry)
+    assert second["status"] == "ok"
+    assert (second["rendered"], second["skipped"]) == (0, 10)
+    assert second["fps"] == 0
@@ -0,0 +1,44 @@
+import numpy as np
+import cv2
+from temporal_denoiser.flow import AutoFlow, DISFlow, to_gray
+
+
+def _pair(shift, noise=0.02, seed=0):
+    rng = np.random.default_rng(seed)
+    texture = cv2.GaussianBlur(rng.random((180, 320, 3)).astype(np.float32), (0, 0), 1.5)
+    texture = (texture - texture.min()) / (texture.max() - texture.min())
+    ref = texture + rng.normal(0, noise, texture.shape)
+    cur = np.roll(texture, shift, axis=(0, 1)) + rng.normal(0, noise, texture.shape)
+    return to_gray(np.clip(ref, 0, 1).astype(np.float32)), to_gray(np.clip(cur, 0, 1).astype(np.float32))
+
+
+class CountingDIS(DISFlow):
+    def __init__(self):
+        super().__init__("fast")
+        self.calls = 0
+
+    def estimate(self, ref, cur, flow=None, initial=False):
+        self.calls += 1
+        return super().estimate(ref, cur, flow, initial)
+
+
+def test_translation_skips_the_dense_flow():
+    dense = CountingDIS()
+    estimator = AutoFlow(dense=dense)
+    ref, cur = _pair((2, 5))
+    flow = estimator.estimate(ref, cur)
+    assert dense.calls == 0
+    assert estimator.choices == {"translation": 1}
+    np.testing.assert_allclose(flow[60:120, 100:200].mean(axis=(0, 1)), (5, 2), atol=0.1)
+
+
+def test_local_motion_falls_back_to_the_dense_flow():
+    dense = CountingDIS()
+    estimator = AutoFlow(dense=dense)
+    ref, _ = _pair((0, 0), seed=1)
+    cur = ref.copy()
+    # Only the middle moves
+    cur[60:120, 100:220] = np.roll(ref, 6, axis=1)[60:120, 100:220]
+    estimator.estimate(ref, cur)
+    assert dense.calls == 1
+    assert estimator.choices == {"dis-fast": 1}
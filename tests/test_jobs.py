@@ -0,0 +1,14 @@
+import pytest
+
+pytest.importorskip("PySide6.QtCore")
+from temporal_denoiser.jobs import ProgressTracker
+
+
+def test_resumed_frames_do_not_count_towards_fps_and_eta():
+    tracker = ProgressTracker(total=100)
+    tracker.resumed(90)
+    tracker.start -= 10.0  # Ten seconds in
+    done, total, fps, eta = tracker.update(95)
+    assert (done, total) == (95, 100)
+    assert fps == pytest.approx(0.5, rel=0.01)
+    assert eta == pytest.approx(10.0, rel=0.01)
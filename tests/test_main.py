@@ -0,0 +1,19 @@
+import pytest
+
+
+def test_tile_budget_refreshes_the_preview(clip, monkeypatch):
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+    from temporal_denoiser.main import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = MainWindow()
+    try:
+        window.cinemadng = clip
+        window.preview_timer.stop()
+        window.tile_mb_spinbox.setValue(512)
+        assert window.preview_timer.isActive()
+    finally:
+        window.preview_timer.stop()
+        window.close()
+        app.processEvents()
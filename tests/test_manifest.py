@@ -0,0 +1,67 @@
+import logging
+import re
+import numpy as np
+import pytest
+from temporal_denoiser.manifest import MANIFEST_NAME
+
+
+def _export(clip, output_dir, caplog):
+    """Export the clip and return how many frames the resume skipped."""
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger="temporal_denoiser.cinemadng"):
+        clip.save_denoised(str(output_dir), frame_radius=1, output_format="png")
+    match = re.search(r"Resuming export: (\d+) of", caplog.text)
+    return int(match.group(1)) if match else 0
+
+
+def test_resume_after_line_cut_off_by_a_kill(clip, tmp_path, caplog):
+    output_dir = tmp_path / "out"
+    assert _export(clip, output_dir, caplog) == 0
+    manifest = output_dir / MANIFEST_NAME
+    data = manifest.read_bytes()
+    # A kill in the middle of writing the last frame's entry
+    manifest.write_bytes(data[:len(data) - 10])
+
+    assert _export(clip, output_dir, caplog) == len(clip.images) - 1
+    assert manifest.read_bytes().endswith(b"\n")
+    assert _export(clip, output_dir, caplog) == len(clip.images)
+
+
+@pytest.mark.parametrize("engine", [dict(workers=1), dict(workers=2), dict(workers=1, pipeline=True)])
+def test_undecodable_frame_stops_the_export_without_renumbering(clip, tmp_path, engine):
+    reference = tmp_path / "reference"
+    clip.save_denoised(str(reference), frame_radius=1, output_format="npy", **engine)
+    broken = clip.images[5]
+    with open(broken, "rb") as f:
+        data = f.read()
+    with open(broken, "wb") as f:
+        f.write(b"not a frame")
+    output = tmp_path / "output"
+    with pytest.raises(ValueError):
+        clip.save_denoised(str(output), frame_radius=1, output_format="npy", **engine)
+    # Only frames that do not need frame 5 are written, each with its own content
+    written = sorted(path.name for path in output.glob("*.npy"))
+    assert set(written) <= {path.name for path in sorted(reference.glob("*.npy"))[:4]}
+    for name in written:
+        np.testing.assert_array_equal(np.load(output / name), np.load(reference / name))
+
+    with open(broken, "wb") as f:
+        f.write(data)
+    clip.save_denoised(str(output), frame_radius=1, output_format="npy", **engine)
+    for path in reference.glob("*.npy"):
+        np.testing.assert_array_equal(np.load(output / path.name), np.load(path))
+
+
+def test_shards_sharing_an_output_directory_keep_their_own_manifests(clip, tmp_path, caplog):
+    output = tmp_path / "out"
+    clip.save_denoised(str(output), frame_radius=1, output_format="png", start=0, end=5)
+    # A shard killed mid-line must not be repaired by another shard starting up
+    second = output / "export_manifest.0-5.jsonl"
+    with open(second, "ab") as f:
+        f.write(b'{"frame": 9')
+    size = second.stat().st_size
+    clip.save_denoised(str(output), frame_radius=1, output_format="png", start=5, end=10)
+    assert second.stat().st_size == size
+    assert sorted(path.name for path in output.glob("export_manifest*")) == ["export_manifest.0-5.jsonl", "export_manifest.5-10.jsonl"]
+    # A whole-clip run sees the frames both shards completed
+    assert _export(clip, output, caplog) == 10
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from temporal_denoiser.parallel import ParallelExporter
+
+FRAME_BYTES = 48 * 80 * 3 * 4
+
+
+def test_plan_keeps_the_peak_within_the_budget():
+    assert ParallelExporter(workers=4).plan(FRAME_BYTES, 3) == (32, 4)
+    # 11 frames fit: two chunks in flight would leave chunks shorter than their overlap
+    assert ParallelExporter(workers=2, memory_mb=0.5).plan(FRAME_BYTES, 1) == (3, 1)
+    # Plenty of memory keeps the default chunk size
+    assert ParallelExporter(workers=2, memory_mb=1024).plan(FRAME_BYTES, 3) == (32, 2)
+    for workers in (1, 2, 4, 8):
+        for radius in (1, 3, 5):
+            exporter = ParallelExporter(workers=workers, memory_mb=2)
+            chunk_size, in_flight = exporter.plan(FRAME_BYTES, radius)
+            assert 1 <= in_flight <= workers
+            assert (in_flight + 1) * (chunk_size + 2 * radius) * FRAME_BYTES <= 2 * 2**20
+
+
+@pytest.mark.parametrize("memory_mb", [None, 0.5])
+def test_budgeted_export_matches_serial(clip, tmp_path, memory_mb):
+    clip.save_denoised(str(tmp_path / "serial"), frame_radius=1, output_format="npy")
+    clip.save_denoised(str(tmp_path / "parallel"), frame_radius=1, output_format="npy", workers=2, memory_mb=memory_mb)
+    serial = sorted((tmp_path / "serial").glob("*.npy"))
+    assert len(serial) == 10
+    for path in serial:
+        np.testing.assert_array_equal(np.load(path), np.load(tmp_path / "parallel" / path.name))
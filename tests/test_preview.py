@@ -0,0 +1,22 @@
+import numpy as np
+import pytest
+from temporal_denoiser import denoise
+from temporal_denoiser.denoise import DenoiseCore
+
+
+@pytest.mark.parametrize("frame_idx", [0, 1, 7, 8, 9])
+def test_preview_at_clip_edges_matches_export(clip, frame_idx):
+    images = [clip.get_frame(i) for i in range(len(clip.images))]
+    exported = {idx: denoised.copy() for idx, denoised in DenoiseCore(3).denoise_range(images)}
+    preview = clip.denoise(frame_idx, frame_radius=3)
+    np.testing.assert_array_equal(preview, exported[frame_idx])
+
+
+def test_preview_reuses_its_core_without_building_another(clip, monkeypatch):
+    clip.denoise(4, frame_radius=2)
+    core = clip.previewer.core
+    built = []
+    monkeypatch.setattr(denoise.DenoiseCore, "__init__", lambda self, *args, **kwargs: built.append(args))
+    clip.denoise(5, frame_radius=2)
+    assert clip.previewer.core is core
+    assert built == []
@@ -0,0 +1,80 @@
+import os
+import numpy as np
+import pytest
+from temporal_denoiser.sequence import SequenceIndex, frame_number, index_directory, timecode_frame
+
+
+def _touch(directory, *names):
+    for name in names:
+        (directory / name).write_bytes(b"")
+    return [str(directory / name) for name in names]
+
+
+def test_frame_number_is_the_last_run_of_digits():
+    assert frame_number("/clips/A001_C002_0123.dng") == 123
+    assert frame_number("shot_0042_v2.dng") == 2
+    assert frame_number("frame12_final.dng") == 12
+    assert frame_number("/clips/2024/plate.dng") is None
+
+
+def test_gapped_sequence_keeps_frame_numbers_and_lists_the_gaps():
+    index = SequenceIndex.from_paths(["c_0010.dng", "c_0003.dng", "c_0001.dng", "c_0002.dng", "c_0007.dng"])
+    assert index.frame_numbers == [1, 2, 3, 7, 10]
+    assert index.paths == ["c_0001.dng", "c_0002.dng", "c_0003.dng", "c_0007.dng", "c_0010.dng"]
+    assert index.gaps == [(4, 6), (8, 9)]
+    assert index.position(7) == 3
+    assert index.path_for(10) == "c_0010.dng"
+    with pytest.raises(KeyError):
+        index.position(5)
+
+
+def test_duplicate_frame_numbers_keep_the_first_file_by_name():
+    index = SequenceIndex.from_paths(["b_0002.dng", "a_0002.dng", "a_0001.dng", "c_0002.dng"])
+    assert index.paths == ["a_0001.dng", "a_0002.dng"]
+    assert index.duplicates == {2: ["b_0002.dng", "c_0002.dng"]}
+    assert index.gaps == []
+
+
+def test_non_numeric_names_are_left_out_of_a_numbered_sequence():
+    index = SequenceIndex.from_paths(["c_0002.dng", "notes.dng", "c_0001.dng"])
+    assert index.paths == ["c_0001.dng", "c_0002.dng"]
+    assert index.unnumbered == ["notes.dng"]
+    # Without any frame numbers the sequence is in name order
+    index = SequenceIndex.from_paths(["beta.dng", "alpha.dng"])
+    assert index.paths == ["alpha.dng", "beta.dng"]
+    assert index.frame_numbers == [0, 1]
+    assert index.unnumbered == []
+
+
+def test_index_directory_matches_any_extension_case_and_sees_new_files(tmp_path):
+    _touch(tmp_path, "c_0001.dng", "c_0002.DNG", "c_0003.tif")
+    assert [os.path.basename(path) for path in index_directory(tmp_path).paths] == ["c_0001.dng", "c_0002.DNG"]
+    _touch(tmp_path, "c_0004.dng")
+    os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 10**9))
+    index = index_directory(tmp_path)
+    assert index.frame_numbers == [1, 2, 4]
+    assert index.gaps == [(3, 3)]
+
+
+def _write_timecode_dng(path, hours, minutes, seconds, frames, fps=24):
+    tifffile = pytest.importorskip("tifffile")
+
+    def bcd(value):
+        return (value // 10) << 4 | value % 10
+
+    code = (bcd(frames), bcd(seconds), bcd(minutes), bcd(hours), 0, 0, 0, 0)
+    tifffile.imwrite(path, np.zeros((2, 2), dtype=np.uint16), extratags=[(51043, "B", 8, code, True), (51044, "2i", 1, (fps, 1), True)], metadata=None)
+
+
+def test_timecode_orders_frames_whose_names_do_not(tmp_path):
+    _write_timecode_dng(tmp_path / "b_0001.dng", 1, 0, 0, 1)
+    _write_timecode_dng(tmp_path / "a_0002.dng", 1, 0, 0, 0)
+    _write_timecode_dng(tmp_path / "c_0003.dng", 1, 0, 1, 0)
+    assert timecode_frame(str(tmp_path / "a_0002.dng")) == 3600 * 24
+    index = index_directory(tmp_path, use_timecode=True)
+    assert [os.path.basename(path) for path in index.paths] == ["a_0002.dng", "b_0001.dng", "c_0003.dng"]
+    assert index.gaps == [(3600 * 24 + 2, 3600 * 24 + 23)]
+    # A frame without a timecode falls back to the frame numbers in the names
+    _touch(tmp_path, "d_0004.dng")
+    paths = [str(tmp_path / name) for name in ("a_0002.dng", "b_0001.dng", "c_0003.dng", "d_0004.dng")]
+    assert SequenceIndex.from_paths(paths, use_timecode=True).frame_numbers == [1, 2, 3, 4]
@@ -0,0 +1,37 @@
+import os
+import pytest
+from temporal_denoiser.sweep import SWEEP_DEFAULTS, parameter_grid
+
+
+def test_grid_keeps_the_base_settings():
+    base = dict(SWEEP_DEFAULTS, winsize=31, merge="weighted")
+    grid = parameter_grid(base, frame_radius=[2, 4])
+    assert [params["frame_radius"] for params in grid] == [2, 4]
+    assert all(params["winsize"] == 31 and params["merge"] == "weighted" for params in grid)
+    assert parameter_grid(levels=[2])[0] == dict(SWEEP_DEFAULTS, levels=2)
+
+
+def test_sweep_keeps_the_controls_it_does_not_sweep(monkeypatch):
+    monkeypatch.setenv("QT_QPA_PLATFORM", "offscreen")
+    QtWidgets = pytest.importorskip("PySide6.QtWidgets")
+    from temporal_denoiser.main import MainWindow
+
+    app = QtWidgets.QApplication.instance() or QtWidgets.QApplication([])
+    window = MainWindow()
+    try:
+        window.winsize_spinbox.setValue(31)
+        window.merge_combo.setCurrentIndex(window.merge_combo.findData("weighted"))
+        window.sweep_fields["frame_radius"].setText("2, 4")
+        window.sweep_fields["spatial_median"].setText("")
+        _, combinations = window._sweep_combinations()
+        assert [params["frame_radius"] for params in combinations] == [2, 4]
+        for params in combinations:
+            assert params["winsize"] == 31
+            assert params["merge"] == "weighted"
+        window.apply_params(combinations[-1])
+        assert window.winsize_spinbox.value() == 31
+        assert window.merge_combo.currentData() == "weighted"
+        assert window.radius_slider.value() == 4
+    finally:
+        window.close()
+        app.processEvents()